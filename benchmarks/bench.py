@@ -0,0 +1,285 @@
+"""Time and peak memory of the public streams and metrics functions
+
+Every function runs on list, ndarray and Series inputs made from the bundled
+tests/assets streams and from synthetic rides of increasing length. Results
+are written as JSON, so runs of different releases can be compared:
+
+    $ python benchmarks/bench.py --output bench_new.json
+    $ python benchmarks/bench.py --output bench_new.json --compare bench_old.json
+"""
+
+import argparse
+import collections
+import datetime
+import glob
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from vmpy import metrics, streams  # noqa: E402
+from vmpy.__version__ import __version__  # noqa: E402
+from vmpy.strava import stream2dict  # noqa: E402
+from vmpy.utils import cast_array_to_original_type  # noqa: E402
+
+
+_assets = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'assets')
+
+SIZES = [1000, 10000, 100000, 250000]
+INPUT_TYPES = {'list': list, 'ndarray': np.ndarray, 'Series': pd.Series}
+
+FTP = 270
+LTHR = 160
+WEIGHT = 75
+
+_binner = streams.ZoneBinner(ftp=FTP)
+
+# Name, callable taking the activity dict, largest stream to run on (None is unbounded)
+Case = collections.namedtuple('Case', ['name', 'func', 'max_size'])
+
+CASES = [
+    Case('streams.compute_zones', lambda a: streams.compute_zones(a['watts'], ftp=FTP), None),
+    Case('streams.zone_edges', lambda a: streams.zone_edges(ftp=FTP), None),
+    Case('streams.wpk', lambda a: streams.wpk(a['watts'], WEIGHT), None),
+    Case('streams.mask_fill', lambda a: streams.mask_fill(a['watts'], a['moving']), None),
+    Case('streams.median_filter', lambda a: streams.median_filter(a['heartrate']), None),
+    Case('streams.rolling_mean', lambda a: streams.rolling_mean(a['watts'], window=30), None),
+    Case('streams.ZoneBinner.time_in_zones', lambda a: _binner.time_in_zones(a['watts']), None),
+    Case('streams.rolling_mean[ewma]', lambda a: streams.rolling_mean(a['watts'], window=30, type='ewma'), None),
+    Case('streams.w_prime_balance', lambda a: streams.w_prime_balance(a['watts'], FTP, 20000), None),
+    Case('metrics.power_duration_curve', lambda a: metrics.power_duration_curve(a['watts']), 10000),
+    Case('metrics.power_duration_curve[log]',
+         lambda a: metrics.power_duration_curve(a['watts'], durations=metrics.log_durations(len(a['watts']) - 1)),
+         None),
+    Case('metrics.PowerDurationCurve.update',
+         lambda a: metrics.PowerDurationCurve().update(
+             metrics.power_duration_curve(a['watts'], durations=np.arange(1, 3601)), activity_id=1),
+         None),
+    Case('metrics.log_durations', lambda a: metrics.log_durations(len(a['watts']) - 1), None),
+    Case('metrics.best_interval', lambda a: metrics.best_interval(a['watts'], 1200), None),
+    Case('metrics.best_intervals', lambda a: metrics.best_intervals(a['watts'], [5, 60, 300, 1200, 3600]), None),
+    Case('metrics.time_in_zones', lambda a: metrics.time_in_zones(a['watts'], ftp=FTP), None),
+    Case('metrics.normalized_power', lambda a: metrics.normalized_power(a['watts']), None),
+    Case('metrics.relative_intensity', lambda a: metrics.relative_intensity(250.0, FTP), None),
+    Case('metrics.stress_score', lambda a: metrics.stress_score(250.0, FTP, len(a['watts'])), None),
+]
+
+
+def synthetic_ride(size, seed=0):
+    """Stream dict of a synthetic ride with 1 sec samples
+
+    Power is a random walk with short sprints and coasting, heart rate lags the power
+
+    Parameters
+    ----------
+    size : int
+    seed : int, optional
+
+    Returns
+    -------
+    dict
+    """
+
+    rng = np.random.RandomState(seed)
+
+    power = 200 + np.cumsum(rng.normal(0, 5, size))
+    power = power - (power.mean() - 200)
+    power[rng.rand(size) < 0.01] += rng.uniform(300, 800)
+    coasting = rng.rand(size) < 0.05
+    power[coasting] = 0
+    power = np.clip(power, 0, 2000).round().astype(int)
+
+    heartrate = 100 + 0.3 * pd.Series(power).ewm(span=60).mean().values + rng.normal(0, 2, size)
+    heartrate = np.clip(heartrate, 60, 200).round().astype(int)
+
+    return {'time': np.arange(size).tolist(),
+            'watts': power.tolist(),
+            'heartrate': heartrate.tolist(),
+            'moving': (~coasting).tolist()}
+
+
+def datasets(sizes):
+    """Bundled assets and synthetic rides, streams as lists"""
+
+    for path in sorted(glob.glob(os.path.join(_assets, 'streams_*.json'))):
+        with open(path) as f:
+            activity = stream2dict(json.load(f))
+        activity = {k: [0 if x is None else x for x in activity[k]] for k in ('time', 'watts', 'heartrate', 'moving')}
+        yield os.path.splitext(os.path.basename(path))[0], activity
+
+    for size in sizes:
+        yield 'synthetic_{}'.format(size), synthetic_ride(size)
+
+
+def as_input_type(activity, input_type):
+    """Activity with every stream converted into the input type"""
+
+    if input_type is list:
+        return dict(activity)
+
+    return {k: cast_array_to_original_type(np.asarray(v), input_type) for k, v in activity.items()}
+
+
+def measure(func, activity, input_type, repeat):
+    """Best and median wall time in sec, and peak traced memory in bytes
+
+    Streams are converted anew before every call, so in-place functions
+    always see the original data and the conversion is not timed
+    """
+
+    times = []
+    for _ in range(repeat):
+        args = as_input_type(activity, input_type)
+        start = time.perf_counter()
+        func(args)
+        times.append(time.perf_counter() - start)
+
+    # tracemalloc slows down allocations, so memory is measured in a separate call
+    args = as_input_type(activity, input_type)
+    tracemalloc.start()
+    try:
+        func(args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(times), statistics.median(times), peak
+
+
+def run(sizes=SIZES, repeat=5, cases=CASES, input_types=INPUT_TYPES, progress=None):
+    """Benchmark every case on every dataset and input type
+
+    Returns
+    -------
+    list of dict
+    """
+
+    rv = []
+
+    for dataset, activity in datasets(sizes):
+        size = len(activity['watts'])
+
+        for case in cases:
+            if case.max_size is not None and size > case.max_size:
+                continue
+
+            for type_name, input_type in input_types.items():
+                best, median, peak = measure(case.func, activity, input_type, repeat)
+                result = {'function': case.name, 'dataset': dataset, 'size': size, 'input_type': type_name,
+                          'repeat': repeat, 'time_min': best, 'time_median': median, 'peak_memory': peak}
+                rv.append(result)
+
+                if progress:
+                    progress(result)
+
+    return rv
+
+
+def uncovered():
+    """Public functions of streams and metrics without a benchmark case"""
+
+    covered = {case.name.split('[')[0] for case in CASES}
+
+    rv = []
+    for module in (streams, metrics):
+        for name, obj in inspect.getmembers(module, inspect.isfunction):
+            qualname = '{}.{}'.format(module.__name__.split('.')[-1], name)
+            if not name.startswith('_') and obj.__module__ == module.__name__ and qualname not in covered:
+                rv.append(qualname)
+
+    return rv
+
+
+def compare(results, baseline):
+    """Ratio of the best times of baseline over results, > 1 is a speedup"""
+
+    def key(r):
+        return r['function'], r['dataset'], r['input_type']
+
+    previous = {key(r): r for r in baseline}
+
+    rv = []
+    for r in results:
+        if key(r) in previous:
+            before = previous[key(r)]
+            rv.append(dict(zip(('function', 'dataset', 'input_type'), key(r)),
+                           speedup=before['time_min'] / r['time_min'] if r['time_min'] else float('inf'),
+                           memory_ratio=r['peak_memory'] / before['peak_memory'] if before['peak_memory'] else None))
+
+    return rv
+
+
+def import_time(module='vmpy.metrics'):
+    """Cumulative import time of the module in sec, measured in a fresh interpreter"""
+
+    rv = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                        cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'),
+                        capture_output=True, text=True, check=True)
+
+    for line in rv.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+
+    return None
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmark the vmpy streams and metrics functions')
+    parser.add_argument('--output', '-o', default='bench_output.json', help='JSON results file, default=%(default)s')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Synthetic ride lengths in samples')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed calls per measurement, default=%(default)s')
+    parser.add_argument('--filter', default='', help='Only run functions containing this string')
+    parser.add_argument('--compare', help='Baseline JSON results file of a previous run')
+    args = parser.parse_args(argv)
+
+    missing = uncovered()
+    if missing:
+        sys.stderr.write('No benchmark case for {}\n'.format(', '.join(missing)))
+
+    cases = [case for case in CASES if args.filter in case.name]
+
+    def progress(r):
+        sys.stderr.write('{function:<40} {dataset:<36} {input_type:<8} {time_min:10.6f} s {peak_memory:>12} B\n'
+                         .format(**r))
+
+    results = run(sizes=args.sizes, repeat=args.repeat, cases=cases, progress=progress)
+
+    report = {
+        'meta': {
+            'vmpy': __version__,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'import_time': import_time(),
+        },
+        'results': results,
+    }
+
+    if args.compare:
+        with open(args.compare) as f:
+            report['comparison'] = compare(results, json.load(f)['results'])
+        for r in report['comparison']:
+            sys.stderr.write('{function:<40} {dataset:<36} {input_type:<8} {speedup:8.2f}x\n'.format(**r))
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
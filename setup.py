@@ -10,11 +10,17 @@ DESCRIPTION = 'Performance Velo Metrics Toolbox'
 URL = 'https://github.com/sladkovm/vmpy'
 EMAIL = 'sladkovm@gmail.com'
 AUTHOR = 'Maksym Sladkov'
+REQUIRES_PYTHON = '>=3.8'
 # What packages are required for this module to be executed?
 REQUIRED = [
     'numpy', 'pandas', 'requests'
 ]
 
+# Optional packages, e.g. pip install vmpy[numba]
+EXTRAS = {
+    'numba': ['numba'],
+}
+
 # The rest you shouldn't have to touch too much :)
 # ------------------------------------------------
 # Except, perhaps the License and Trove Classifiers!
@@ -79,10 +85,12 @@ setup(
     # If your package is a single module, use this instead of 'packages':
     # py_modules=['mypackage'],
 
-    # entry_points={
-    #     'console_scripts': ['mycli=mymodule:cli'],
-    # },
+    entry_points={
+        'console_scripts': ['vmpy=vmpy.pipeline:main'],
+    },
+    python_requires=REQUIRES_PYTHON,
     install_requires=REQUIRED,
+    extras_require=EXTRAS,
     include_package_data=True,
     license='MIT',
     classifiers=[
@@ -90,7 +98,7 @@ setup(
         # Full list: https://pypi.python.org/pypi?%3Aaction=list_classifiers
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.8',
         'Operating System :: OS Independent',
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',
@@ -1,6 +1,9 @@
 import os
 import pytest
 import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 from vmpy import strava
 
 
@@ -49,4 +52,64 @@ def test_zones():
                                  {'max': 390, 'min': 313},
                                  {'max': -1, 'min': 391}]}}
 
-    return rv
\ No newline at end of file
+    return rv
+
+
+class _StubServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            responses = server.routes.get(self.path, server.routes.get(self.path.split('?')[0], None))
+            if responses is None:
+                status, body, headers = 404, {'message': 'Record Not Found'}, {}
+            elif len(responses) > 1:
+                status, body, headers = responses.pop(0)
+            else:
+                status, body, headers = responses[0]
+
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+
+        pass
+
+
+@pytest.fixture
+def strava_server():
+    """Local stub of the Strava API
+
+    Register responses with server.routes[path] = [(status, body, headers), ...],
+    they are served in order and the last one is repeated. A path with a query
+    string takes precedence over the bare path. Received requests
+    are recorded in server.requests and the API root is server.url
+    """
+
+    server = _StubServer(('127.0.0.1', 0), _StubHandler)
+    server.routes = {}
+    server.requests = []
+    server.lock = threading.Lock()
+    server.url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
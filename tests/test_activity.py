@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from vmpy import metrics, streams
+from vmpy.activity import Activity
+
+
+def _assert_equal(a, b):
+
+    assert np.array_equal(np.asarray(a, dtype=float), np.asarray(b, dtype=float), equal_nan=True)
+
+
+@pytest.mark.parametrize('fixture', ['test_stream', 'test_stream_with_nans'])
+def test_activity_matches_metrics(fixture, request):
+
+    stream = request.getfixturevalue(fixture)
+    power = stream['watts']
+    moving = stream['moving']
+
+    activity = Activity(stream, ftp=270, lthr=160, weight=75, mask='moving')
+
+    assert activity.duration == len(power)
+    assert activity.normalized_power == metrics.normalized_power(power, mask=moving)
+    assert activity.xpower == metrics.normalized_power(power, mask=moving, type='xPower')
+    assert activity.relative_intensity == metrics.relative_intensity(activity.normalized_power, 270)
+    assert activity.stress_score == metrics.stress_score(activity.normalized_power, 270, len(power))
+    _assert_equal(activity.best_interval(1200), metrics.best_interval(power, 1200, mask=moving))
+    _assert_equal(activity.rolling_mean(30, type='ewma'),
+                  streams.rolling_mean(power, 30, mask=moving, type='ewma'))
+    _assert_equal(activity.power_duration_curve, metrics.power_duration_curve(power, mask=moving))
+    _assert_equal(activity.power_zones, streams.compute_zones(streams.mask_fill(power, moving), ftp=270))
+    _assert_equal(activity.time_in_power_zones, metrics.time_in_zones(streams.mask_fill(power, moving), ftp=270))
+    _assert_equal(activity.heart_rate_zones, streams.compute_zones(stream['heartrate'], lthr=160))
+    _assert_equal(activity.time_in_heart_rate_zones, metrics.time_in_zones(stream['heartrate'], lthr=160))
+    _assert_equal(activity.wpk, streams.wpk(streams.mask_fill(power, moving), 75))
+
+
+def test_activity_shares_intermediates(test_stream):
+
+    activity = Activity(test_stream)
+
+    assert activity.rolling_mean(30) is activity.rolling_mean(30)
+    assert activity.rolling_mean(25, type='emwa') is activity.rolling_mean(25)
+    assert activity.energy is activity._running_sums[0]
+    assert not activity.power.flags.writeable
+
+    durations = metrics.log_durations(activity.duration - 1)
+    _assert_equal(activity.power_duration_curve_at(durations),
+                  metrics.power_duration_curve(test_stream['watts'], durations=durations))
+
+
+def test_activity_requires_thresholds(test_stream):
+
+    activity = Activity(test_stream)
+
+    with pytest.raises(ValueError):
+        activity.stress_score
+
+    with pytest.raises(ValueError):
+        activity.time_in_heart_rate_zones
@@ -0,0 +1,136 @@
+import io
+import json
+
+import pytest
+from vmpy import backfill
+from vmpy.strava import StravaClient
+
+
+def _activities(n):
+
+    return [{'id': i, 'start_date': '2017-07-14T02:{:02d}:00Z'.format(i), 'manual': i == 3} for i in range(n)]
+
+
+def _streams(i):
+
+    return [{'type': 'watts', 'data': [100 + i] * 120}, {'type': 'time', 'data': list(range(120))}]
+
+
+def _list(server, after=None):
+    """Pages of 2 of the activities started after the cursor, the stub does not filter itself"""
+
+    query = '' if after is None else 'after={}&'.format(backfill._epoch(after) - 1)
+    activities = [a for a in _activities(5) if after is None or a['start_date'] >= after]
+
+    for page in range(1, 4):
+        path = '/athlete/activities?{}page={}&per_page=2'.format(query, page)
+        server.routes[path] = [(200, activities[2 * (page - 1):2 * page], {})]
+
+
+@pytest.fixture
+def server(strava_server):
+
+    strava_server.routes['/athlete/activities'] = [(200, [], {})]
+    _list(strava_server)
+    for i in range(5):
+        strava_server.routes['/activities/{}/streams/watts,time'.format(i)] = [(200, _streams(i), {})]
+
+    return strava_server
+
+
+def _streams_requested(server):
+
+    return sorted(int(path.split('/')[2]) for path, _ in server.requests if '/streams/' in path)
+
+
+def test_list_activities(server):
+
+    with StravaClient('abc123', base_url=server.url, max_workers=2) as client:
+        rv = client.list_activities(per_page=2)
+
+    assert [a['id'] for a in rv] == [0, 1, 2, 3, 4]
+
+
+def test_list_activities_failed_page(server):
+
+    server.routes['/athlete/activities?page=2&per_page=2'] = [(500, {}, {})]
+
+    with StravaClient('abc123', base_url=server.url, max_workers=2, retries=0) as client:
+        assert client.list_activities(per_page=2) is None
+
+
+def test_backfill(server, tmp_path):
+
+    state = str(tmp_path / 'state.json')
+    output = io.StringIO()
+
+    with StravaClient('abc123', base_url=server.url, max_workers=2) as client:
+        rv = backfill.backfill(client, state, output, ftp=200, per_page=2, chunk_size=2, types='watts,time')
+
+    assert rv == (5, 0)
+    results = {r['activity']: r for r in map(json.loads, output.getvalue().splitlines())}
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert results[1]['normalized_power'] == pytest.approx(101.0)
+    assert 'normalized_power' not in results[3]
+    assert _streams_requested(server) == [0, 1, 2, 4]
+
+    saved = backfill.load_state(state)
+    assert saved.after == backfill._epoch('2017-07-14T02:04:00Z')
+    assert saved.done == {4}
+
+    # Nothing new, nothing downloaded
+    _list(server, after='2017-07-14T02:04:00Z')
+    del server.requests[:]
+    with StravaClient('abc123', base_url=server.url, max_workers=2) as client:
+        assert backfill.backfill(client, state, output, ftp=200, per_page=2, types='watts,time') == (0, 0)
+    assert _streams_requested(server) == []
+    assert any('after=' in path for path, _ in server.requests)
+
+
+def test_backfill_resumes_failed(server, tmp_path):
+
+    state = str(tmp_path / 'state.json')
+    server.routes['/activities/1/streams/watts,time'] = [(500, {}, {})]
+
+    with StravaClient('abc123', base_url=server.url, max_workers=2, retries=0) as client:
+        assert backfill.backfill(client, state, io.StringIO(), per_page=2, types='watts,time') == (4, 1)
+
+    saved = backfill.load_state(state)
+    assert saved.after == backfill._epoch('2017-07-14T02:00:00Z')
+    assert saved.done == {0, 2, 3, 4}
+
+    server.routes['/activities/1/streams/watts,time'] = [(200, _streams(1), {})]
+    _list(server, after='2017-07-14T02:00:00Z')
+    del server.requests[:]
+
+    with StravaClient('abc123', base_url=server.url, max_workers=2) as client:
+        assert backfill.backfill(client, state, io.StringIO(), per_page=2, types='watts,time') == (1, 0)
+
+    assert _streams_requested(server) == [1]
+    assert backfill.load_state(state).after == backfill._epoch('2017-07-14T02:04:00Z')
+
+
+def test_backfill_continues_after_exception(server, tmp_path):
+
+    state = str(tmp_path / 'state.json')
+    output = io.StringIO()
+    server.routes['/activities/2/streams/watts,time'] = [(200, b'[{"type": "watts", "data": [1, ', {})]
+
+    with StravaClient('abc123', base_url=server.url, max_workers=2) as client:
+        rv = backfill.backfill(client, state, output, per_page=2, types='watts,time')
+
+    assert rv == (4, 1)
+    results = {r['activity']: r for r in map(json.loads, output.getvalue().splitlines())}
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert results[2]['error'].startswith('JSONDecodeError')
+
+    saved = backfill.load_state(state)
+    assert saved.after == backfill._epoch('2017-07-14T02:01:00Z')
+    assert saved.done == {1, 3, 4}
+
+
+def test_load_state_initial_cursor(tmp_path):
+
+    rv = backfill.load_state(str(tmp_path / 'missing.json'), after='2018-01-01')
+
+    assert rv == backfill.State(1514764800, set())
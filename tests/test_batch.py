@@ -0,0 +1,73 @@
+import numpy as np
+from vmpy import batch, metrics
+
+
+def _ragged(test_stream, test_stream_with_nans):
+
+    rows = [np.asarray(test_stream['watts'], dtype=float)[:3000],
+            np.asarray(test_stream_with_nans['watts'], dtype=float),
+            np.asarray(test_stream['watts'], dtype=float)[3000:]]
+    offsets = np.cumsum([0] + [len(r) for r in rows])
+
+    return rows, np.concatenate(rows), offsets
+
+
+def test_normalized_power_ragged(test_stream, test_stream_with_nans):
+
+    rows, values, offsets = _ragged(test_stream, test_stream_with_nans)
+
+    rv = batch.normalized_power(values, offsets=offsets)
+    expected = [metrics.normalized_power(r) for r in rows]
+
+    assert np.allclose(rv, expected)
+
+
+def test_normalized_power_padded():
+
+    arg = np.asarray([[100, 100, 100, 0],
+                      [200, 200, 0, 0]])
+
+    rv = batch.normalized_power(arg, lengths=[3, 2])
+
+    assert np.allclose(rv, [100, 200])
+
+
+def test_best_interval_with_mask(test_stream):
+
+    watts = np.asarray(test_stream['watts'], dtype=float)
+    moving = np.asarray(test_stream['moving'])
+    arg = np.stack([watts, watts[::-1]])
+    mask = np.stack([moving, moving[::-1]])
+
+    rv = batch.best_interval(arg, 60, mask=mask)
+
+    assert np.allclose(rv[0], metrics.best_interval(watts, 60, mask=moving))
+    assert np.allclose(rv[1], metrics.best_interval(watts[::-1], 60, mask=moving[::-1]))
+
+
+def test_time_in_zones_per_row_ftp():
+
+    arg = np.asarray([[0.55, 0.75, 0.9, 1.05, 1.2, 1.5, 10.0],
+                      [1.1, 1.5, 1.8, 2.1, 2.4, 3.0, 20.0]])
+
+    rv = batch.time_in_zones(arg, ftp=[1.0, 2.0])
+
+    assert rv.shape == (2, 7)
+    assert (rv == 1).all()
+
+
+def test_time_in_zones_shared_zones():
+
+    values = [60, 120, 150, 160, 170, 180, 60, 60]
+    offsets = [0, 6, 6, 8]
+
+    rv = batch.time_in_zones(values, offsets=offsets, zones=[-1, 142, 155, 162, 174, 10000])
+
+    assert rv.tolist() == [[2, 1, 1, 1, 1], [0, 0, 0, 0, 0], [2, 0, 0, 0, 0]]
+
+
+def test_stress_score():
+
+    rv = batch.stress_score([300.0, 150.0], [300.0, 300.0], [3600, 7200])
+
+    assert np.allclose(rv, [100.0, 50.0])
@@ -0,0 +1,151 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from vmpy import cache
+
+
+class _Response(object):
+
+    def __init__(self, status_code, content=b'', headers=None, reason='OK'):
+
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.reason = reason
+        self.ok = status_code < 400
+
+
+def test_streams_key_ignores_types_order():
+
+    assert cache.streams_key(1, 'watts,time') == cache.streams_key(1, 'time, watts')
+    assert cache.streams_key(1, 'watts') != cache.streams_key(1, 'time')
+    assert cache.streams_key(1, 'watts') != cache.streams_key(2, 'watts')
+
+
+def test_put_get(tmp_path):
+
+    c = cache.ResponseCache(str(tmp_path))
+    c.put('activity_1', b'{"id": 1}', {'ETag': '"abc"'})
+
+    entry = c.get('activity_1')
+
+    assert entry.body == b'{"id": 1}'
+    assert entry.etag == '"abc"'
+    assert c.get('activity_2') is None
+    assert len(c) == 1
+
+
+def test_lru_eviction(tmp_path):
+
+    c = cache.ResponseCache(str(tmp_path), max_bytes=30)
+
+    for i in range(3):
+        c.put('activity_{}'.format(i), b'0123456789')
+        os.utime(os.path.join(str(tmp_path), 'activity_{}.body'.format(i)), (i, i))
+
+    # Recently used entry survives
+    c.touch('activity_0')
+    c.put('activity_3', b'0123456789')
+
+    assert c.get('activity_0') is not None
+    assert c.get('activity_1') is None
+    assert c.get('activity_2') is not None
+    assert c.get('activity_3') is not None
+
+
+def test_evict_skips_entries_removed_meanwhile(tmp_path):
+
+    c = cache.ResponseCache(str(tmp_path), max_bytes=4)
+    c.put('a', b'[1]')
+
+    # Listed, but evicted by another process before it is stat'ed
+    gone = (os.path.join(str(tmp_path), 'gone.body'), os.path.join(str(tmp_path), 'gone.meta'))
+    entries = c._entries
+    c._entries = lambda: [gone] + entries()
+
+    c.put('b', b'[2]')
+
+    assert c.get('a') is None
+    assert c.get('b').body == b'[2]'
+
+
+def test_fetch_hit_does_not_request(tmp_path):
+
+    c = cache.ResponseCache(str(tmp_path))
+    requests = []
+
+    def request(headers):
+        requests.append(headers)
+        return _Response(200, b'[1]', {'ETag': '"v1"'})
+
+    assert cache.fetch(c, 'key', request) == (b'[1]', None)
+    assert cache.fetch(c, 'key', request) == (b'[1]', None)
+
+    assert len(requests) == 1
+    assert (c.hits, c.misses) == (1, 1)
+
+
+def test_fetch_counts_concurrent_lookups(tmp_path):
+
+    c = cache.ResponseCache(str(tmp_path))
+    c.put('key', b'[1]')
+
+    def lookups():
+        for _ in range(500):
+            cache.fetch(c, 'key', lambda headers: None)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for future in [executor.submit(lookups) for _ in range(8)]:
+            future.result()
+
+    assert c.hits == 4000
+
+
+def test_fetch_revalidates_stale_entry(tmp_path):
+
+    c = cache.ResponseCache(str(tmp_path), max_age=60)
+    c.put('key', b'[1]', {'ETag': '"v1"'})
+
+    meta_path = os.path.join(str(tmp_path), 'key.meta')
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta['stored'] -= 120
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+    requests = []
+
+    def request(headers):
+        requests.append(headers)
+        return _Response(304)
+
+    assert cache.fetch(c, 'key', request) == (b'[1]', None)
+    assert requests == [{'If-None-Match': '"v1"'}]
+    assert c.revalidations == 1
+    assert c.is_fresh(c.get('key'))
+
+
+@pytest.mark.parametrize('response', [None, _Response(503, reason='Service Unavailable')])
+def test_fetch_serves_stale_entry_when_revalidation_fails(tmp_path, response):
+
+    c = cache.ResponseCache(str(tmp_path), max_age=60)
+    c.put('key', b'[1]', {'ETag': '"v1"'})
+
+    meta_path = os.path.join(str(tmp_path), 'key.meta')
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta['stored'] -= 120
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+    assert cache.fetch(c, 'key', lambda headers: response) == (b'[1]', None)
+    assert (c.stale, c.revalidations, c.misses) == (1, 0, 0)
+    assert not c.is_fresh(c.get('key'))
+
+
+def test_fetch_without_cache():
+
+    rv = cache.fetch(None, 'key', lambda headers: _Response(404, reason='Not Found'))
+
+    assert rv == (None, 'Not Found')
@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+import pytest
+from vmpy import core, kernels
+
+
+def test_mask_fill_in_place():
+
+    stream = np.asarray([1.0, 2.0, 3.0])
+    mask = np.asarray([True, False, True])
+
+    rv = core.mask_fill(stream, mask, out=stream)
+
+    assert rv is stream
+    assert (stream == [1.0, 0.0, 3.0]).all()
+
+
+def test_mask_fill_copy():
+
+    stream = np.asarray([1, 2, 3])
+
+    rv = core.mask_fill(stream, [True, False, True], value=5, dtype=float)
+
+    assert rv.dtype == float
+    assert (rv == [1.0, 5.0, 3.0]).all()
+    assert (stream == [1, 2, 3]).all()
+
+
+def test_rolling_mean_out():
+
+    stream = np.asarray([1.0, 2.0, 3.0, 4.0, 5.0])
+    out = np.empty(5)
+
+    rv = core.rolling_mean(stream, window=2, out=out)
+
+    assert rv is out
+    assert (out == [1, 1.5, 2.5, 3.5, 4.5]).all()
+
+
+def test_rolling_mean_with_nans():
+
+    stream = np.asarray([1.0, np.nan, np.nan, 4.0, 5.0])
+    expected = pd.Series(stream).rolling(2, min_periods=1).mean().values
+
+    rv = core.rolling_mean(stream, window=2)
+
+    assert np.array_equal(rv, expected, equal_nan=True)
+
+
+def test_rolling_mean_2d():
+
+    stream = np.arange(20, dtype=float).reshape(2, 10)
+
+    rv = core.rolling_mean(stream, window=3)
+
+    assert (rv[0] == core.rolling_mean(stream[0], window=3)).all()
+    assert (rv[1] == core.rolling_mean(stream[1], window=3)).all()
+
+
+def test_rolling_mean_ewma():
+
+    stream = np.random.RandomState(0).rand(1000) * 400
+    stream[10:15] = np.nan
+    expected = pd.Series(stream).ewm(span=25, min_periods=1).mean().values
+
+    rv = core.rolling_mean(stream, window=25, type='ewma')
+
+    assert np.allclose(rv, expected)
+
+
+def test_rolling_mean_ewma_window_1():
+
+    stream = np.asarray([np.nan, 1.0, np.nan, 3.0, np.nan, np.nan, 5.0])
+    expected = pd.Series(stream).ewm(span=1, min_periods=1).mean().values
+
+    rv = core.rolling_mean(stream, window=1, type='ewma')
+    np.testing.assert_array_equal(rv, expected)
+
+    rv = core.rolling_mean(np.stack([stream, stream[::-1]]), window=1, type='ewma')
+    np.testing.assert_array_equal(rv[1], pd.Series(stream[::-1]).ewm(span=1, min_periods=1).mean().values)
+
+
+def test_compute_zones():
+
+    stream = np.asarray([-1.0, 0.5, 1.0, 1.5, 3.0, np.nan])
+
+    rv = core.compute_zones(stream, [0, 1, 2])
+
+    assert rv.tolist() == [0, 1, 1, 2, 0, 0]
+
+
+def test_wpk_out():
+
+    power = np.asarray([70.0, 140.0])
+
+    rv = core.wpk(power, 70, out=power)
+
+    assert rv is power
+    assert (power == [1.0, 2.0]).all()
+
+
+def test_median_filter():
+
+    stream = np.ones(60)
+    stream[30] = 10
+
+    rv = core.median_filter(stream)
+
+    assert (rv == np.ones(60)).all()
+    assert stream[30] == 10
+
+
+def test_rolling_median():
+
+    stream = np.random.RandomState(0).rand(100)
+    stream[50] = np.nan
+    expected = pd.Series(stream).rolling(7, min_periods=1).median().values
+
+    rv = core.rolling_median(stream, 7)
+
+    assert np.array_equal(rv, expected)
+
+
+def test_rolling_median_mad():
+
+    stream = np.random.RandomState(0).rand(200)
+    stream[[50, 51, 120]] = np.nan
+    median = pd.Series(stream).rolling(9, min_periods=1).median()
+    expected = (stream - median).abs().rolling(9, min_periods=1).median().values
+
+    rv_median, rv_mad = core.rolling_median_mad(stream, 9)
+
+    assert np.array_equal(rv_median, median.values)
+    assert np.array_equal(rv_mad, expected)
+
+
+@pytest.mark.parametrize('window', [1, 2, 9, 40])
+def test_rolling_median_sorted_windows_match_insort(window, monkeypatch):
+
+    stream = np.random.RandomState(0).rand(300)
+    stream[[0, 50, 51, 120]] = np.nan
+    stream[200:250] = np.nan
+
+    monkeypatch.setattr(kernels, 'rolling_median', None)
+    monkeypatch.setattr(kernels, 'rolling_median_mad', None)
+    monkeypatch.setattr(core, '_SORT_BLOCK', 100)
+    sorted_windows = core.rolling_median(stream, window), core.rolling_median_mad(stream, window)
+
+    monkeypatch.setattr(core, '_SORT_WINDOW', 0)
+    insort = core.rolling_median(stream, window), core.rolling_median_mad(stream, window)
+
+    assert np.array_equal(sorted_windows[0], insort[0], equal_nan=True)
+    for a, b in zip(sorted_windows[1], insort[1]):
+        assert np.array_equal(a, b, equal_nan=True)
+
+
+def test_float_dtype():
+
+    assert core.float_dtype(np.zeros(3, dtype=np.int16)) == np.float32
+    assert core.float_dtype(np.zeros(3, dtype=np.uint8)) == np.float32
+    assert core.float_dtype(np.zeros(3, dtype=np.float32)) == np.float32
+    assert core.float_dtype(np.zeros(3, dtype=np.int32)) == np.float64
+    assert core.float_dtype([1, 2, 3]) == np.float64
+    assert core.float_dtype(np.array([1, None])) == np.float64
+
+
+def test_running_sums_accumulate_in_float64():
+
+    stream = np.full(100000, 30000, dtype=np.int16)
+
+    total, count = core.running_sums(stream)
+
+    assert total.dtype == np.float64
+    assert count is None
+    assert total[-1] == 3e9
+
+
+def test_mask_fill_keeps_dtype():
+
+    stream = np.array([1, 2, 3], dtype=np.int16)
+    mask = np.array([True, False, True])
+
+    assert core.mask_fill(stream, mask).dtype == np.int16
+
+    rv = core.mask_fill(stream, mask, value=np.nan)
+    assert rv.dtype == np.float32
+    assert np.array_equal(rv, [1, np.nan, 3], equal_nan=True)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from vmpy import critical_power, metrics
+
+
+_durations = np.arange(1, 3601, dtype=float)
+
+
+def test_fit_2p():
+
+    curve = 270 + 20000 / _durations
+
+    fit = critical_power.fit_2p(curve)
+
+    assert fit.model == '2p'
+    assert np.isclose(fit.cp, 270)
+    assert np.isclose(fit.w_prime, 20000)
+    assert np.isnan(fit.p_max)
+    assert fit.rmse < 1e-6
+
+
+def test_fit_3p():
+
+    k = 20000 / (1100 - 270)
+    curve = 270 + 20000 / (_durations + k)
+
+    fit = critical_power.fit_3p(curve)
+
+    assert np.isclose(fit.cp, 270, rtol=1e-3)
+    assert np.isclose(fit.w_prime, 20000, rtol=1e-3)
+    assert np.isclose(fit.p_max, 1100, rtol=1e-3)
+    assert np.isclose(fit.time_constant, k, rtol=1e-3)
+    assert np.allclose(critical_power.predict(fit, _durations), curve, atol=0.1)
+
+
+def test_fit_exponential():
+
+    curve = 270 + 830 * np.exp(-_durations / 40)
+
+    fit = critical_power.fit_exponential(curve)
+
+    assert np.isclose(fit.cp, 270, rtol=1e-3)
+    assert np.isclose(fit.p_max, 1100, rtol=1e-3)
+    assert np.isclose(fit.time_constant, 40, rtol=1e-3)
+    assert np.isclose(fit.w_prime, 830 * 40, rtol=1e-3)
+
+
+def test_fit_roster_with_missing_durations():
+
+    k = 20000 / (1100 - 270)
+    curve = 270 + 20000 / (_durations + k)
+    roster = np.vstack([curve, 1.1 * curve, np.full(len(curve), np.nan)])
+    roster[0, 1000:] = np.nan
+
+    fit = critical_power.fit_3p(roster)
+    single = critical_power.fit_3p(roster[1])
+
+    assert fit.cp.shape == (3,)
+    assert fit.residuals.shape == roster.shape
+    assert np.isclose(fit.cp[0], 270, rtol=1e-2)
+    assert np.isclose(fit.cp[1], single.cp, rtol=1e-12)
+    assert np.isnan(fit.cp[2]) and np.isnan(fit.rmse[2])
+    assert np.isnan(fit.residuals[0, 1000:]).all()
+
+
+def test_fit_power_duration_curve(test_stream):
+
+    curve = metrics.power_duration_curve(test_stream['watts'])
+
+    fit = critical_power.fit_2p(curve)
+
+    assert 100 < fit.cp < 400
+    assert fit.w_prime > 0
+
+
+def test_least_squares_sse_of_nearly_linear_points():
+
+    t = np.arange(1, 3601.0)
+    y = 1e6 + 2e4 / t + np.random.RandomState(0).normal(0, 1e-3, len(t))
+
+    intercept, slope, sse = critical_power._least_squares(1.0 / t, y[np.newaxis], np.ones((1, len(t)), dtype=bool))
+    residuals = y - (intercept[0, 0] + slope[0, 0] / t)
+
+    assert sse[0, 0] == pytest.approx(residuals @ residuals, rel=1e-6)
@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+from vmpy import geo
+
+
+def _douglas_peucker(xy, tolerance, start, stop, rv):
+    """Recursive reference implementation"""
+
+    rv.add(start)
+    rv.add(stop)
+    if stop - start < 2:
+        return
+    offset = geo._segment_distance(xy[start:stop + 1], xy[[start]], xy[[stop]])
+    i = int(np.argmax(offset))
+    if offset[i] > tolerance:
+        _douglas_peucker(xy, tolerance, start, start + i, rv)
+        _douglas_peucker(xy, tolerance, start + i, stop, rv)
+
+
+def _turning_points(y, threshold):
+    """Sample by sample reference implementation of the hysteresis, for streams without plateaus"""
+
+    valid = np.flatnonzero(~np.isnan(y))
+    rv = list(valid[:1])
+    low = high = extreme = valid[0]
+    rising = None
+    for i in valid[1:]:
+        x = y[i]
+        if rising is None:
+            low = i if x < y[low] else low
+            high = i if x > y[high] else high
+            if y[high] - y[low] >= threshold:
+                rising = high > low
+                rv[0], extreme = (low, high) if rising else (high, low)
+        elif (x >= y[extreme]) if rising else (x <= y[extreme]):
+            extreme = i
+        elif abs(y[extreme] - x) >= threshold:
+            rv.append(extreme)
+            extreme, rising = i, not rising
+
+    if rising is not None:
+        rv.append(extreme)
+
+    return rv
+
+
+def test_haversine():
+
+    # One degree of latitude
+    assert np.isclose(geo.haversine([0.0, 0.0], [1.0, 0.0]), geo.EARTH_RADIUS * np.pi / 180)
+    assert geo.haversine([[52.0, 4.0]], [[52.0, 4.0]])[0] == 0.0
+
+
+def test_distance(test_stream):
+
+    latlng = np.asarray(test_stream['latlng'])
+
+    rv = geo.distance(latlng)
+
+    assert rv[0] == 0.0
+    assert np.all(np.diff(rv) >= 0)
+    assert np.isclose(rv[-1], geo.haversine(latlng[:-1], latlng[1:]).sum())
+    assert type(geo.distance(test_stream['latlng'])) == list
+
+
+def test_distance_float32(test_stream):
+
+    latlng = np.asarray(test_stream['latlng'])
+
+    rv = geo.distance(latlng.astype(np.float32))
+
+    assert rv.dtype == np.float32
+    assert np.isclose(rv[-1], geo.distance(latlng)[-1], rtol=1e-3)
+
+
+def test_elevation_change():
+
+    altitude = [100, 101, 100, 101, 100, 110, 109, 110, 120, 115, 121, 100, np.nan, 102]
+
+    assert geo.elevation_change(altitude, threshold=3.0) == (26.0, 26.0)
+    assert geo.elevation_change(altitude, threshold=0.0) == (31.0, 29.0)
+    assert geo.elevation_change([100, 101, 102], threshold=3.0) == (0.0, 0.0)
+
+
+@pytest.mark.parametrize('threshold', [0.0, 1.0, 3.0, 10.0])
+def test_turning_points_match_reference(threshold):
+
+    random = np.random.RandomState(0)
+    for _ in range(50):
+        # Integer steps without plateaus, but with many ties between the extremes
+        y = np.cumsum(random.choice([-3, -2, -1, 1, 2, 3], 500) * random.choice([1, 2, 5])).astype(float)
+
+        assert geo._turning_points(y, threshold).tolist() == _turning_points(y, threshold)
+
+
+def test_climbs():
+
+    altitude = np.concatenate([np.linspace(100, 200, 101), np.linspace(200, 195, 6), np.linspace(195, 250, 56),
+                               np.linspace(250, 100, 151)])
+    distance = np.arange(len(altitude)) * 20.0
+
+    rv = geo.climbs(altitude, distance)
+
+    assert len(rv) == 1
+    assert (rv[0].start, rv[0].stop, rv[0].gain) == (0, 162, 150.0)
+    assert geo.climbs(altitude, distance, min_grade=0.1) == []
+
+
+@pytest.mark.parametrize('tolerance', [1.0, 5.0, 20.0])
+def test_simplify_matches_recursion(test_stream, tolerance):
+
+    latlng = np.asarray(test_stream['latlng'])
+
+    rv = geo.simplify(latlng, tolerance=tolerance)
+
+    expected = set()
+    _douglas_peucker(geo._project(latlng), tolerance, 0, len(latlng) - 1, expected)
+    assert rv.tolist() == sorted(expected)
+    assert len(rv) < len(latlng) / 5
+
+
+def test_simplify_short():
+
+    assert geo.simplify([]).tolist() == []
+    assert geo.simplify([[0.0, 0.0], [1.0, 1.0]]).tolist() == [0, 1]
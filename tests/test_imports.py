@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Generous upper bound of the cumulative import time of the NumPy-only modules
+IMPORT_TIME_BUDGET = 1.0
+
+
+def _import(modules):
+    """Import the modules in a fresh interpreter, returns the loaded modules and the import times in sec"""
+
+    code = 'import sys; import {}; print(" ".join(sys.modules))'.format(', '.join(modules))
+    rv = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=_root,
+                        capture_output=True, text=True, check=True)
+
+    times = {}
+    for line in rv.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) / 1e6
+
+    return set(rv.stdout.split()), times
+
+
+@pytest.mark.parametrize('modules', [
+    ['vmpy.metrics', 'vmpy.streams'],
+    ['vmpy.activity', 'vmpy.pmc', 'vmpy.critical_power', 'vmpy.io', 'vmpy.streaming', 'vmpy.resample',
+     'vmpy.geo'],
+    ['vmpy.strava', 'vmpy.pipeline', 'vmpy.batch', 'vmpy.cache', 'vmpy.backfill'],
+])
+def test_import_without_pandas_and_requests(modules):
+
+    loaded, _ = _import(modules)
+
+    assert 'numpy' in loaded
+    for heavy in ('pandas', 'requests', 'urllib3', 'numba'):
+        assert heavy not in loaded
+
+
+def test_import_time():
+
+    _, times = _import(['vmpy.metrics', 'vmpy.streams'])
+
+    assert times['vmpy.metrics'] < IMPORT_TIME_BUDGET
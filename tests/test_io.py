@@ -0,0 +1,162 @@
+import json
+import os
+import numpy as np
+import pytest
+from vmpy import io, metrics, streams
+from vmpy.strava import stream2dict
+
+
+_assets = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+
+def _load_asset(name):
+
+    with open(os.path.join(_assets, name)) as f:
+        return stream2dict(json.load(f))
+
+
+def test_stream2arrays_dtypes():
+
+    rv = io.stream2arrays({'watts': [100, 200], 'heartrate': [120, 130],
+                           'latlng': [[52.1, 4.3], [52.2, 4.4]], 'moving': [True, False],
+                           'custom': [1, 2]})
+
+    assert rv['watts'].dtype == np.int16
+    assert rv['heartrate'].dtype == np.uint8
+    assert rv['latlng'].dtype == np.float32
+    assert rv['latlng'].shape == (2, 2)
+    assert rv['moving'].dtype == np.bool_
+    assert rv['custom'].dtype == np.float64
+
+
+def test_stream2arrays_falls_back_to_float32():
+
+    rv = io.stream2arrays({'watts': [100, None, 200], 'heartrate': [120, 300]})
+
+    assert rv['watts'].dtype == np.float32
+    assert np.isnan(rv['watts'][1])
+    assert rv['heartrate'].dtype == np.float32
+    assert rv['heartrate'][1] == 300
+
+
+def test_save_load_round_trip(tmp_path):
+
+    stream_dict = _load_asset('streams_1202065_1354978421.json')
+    path = str(tmp_path / 'activity.vmpy')
+
+    io.save_streams(path, stream_dict)
+    rv = io.load_streams(path)
+
+    assert set(rv) == set(stream_dict)
+    for name, data in io.stream2arrays(stream_dict).items():
+        assert rv[name].dtype == data.dtype
+        np.testing.assert_array_equal(rv[name], data)
+        assert not rv[name].flags.writeable
+
+    assert os.path.getsize(path) < os.path.getsize(os.path.join(_assets, 'streams_1202065_1354978421.json')) / 3
+
+
+def test_load_without_mmap(tmp_path):
+
+    path = str(tmp_path / 'activity.vmpy')
+    io.save_streams(path, {'watts': [100, 200, 300]})
+
+    rv = io.load_streams(path, mmap_mode=False)
+
+    np.testing.assert_array_equal(rv['watts'], [100, 200, 300])
+
+
+def test_load_rejects_other_files(tmp_path):
+
+    path = tmp_path / 'activity.json'
+    path.write_bytes(b'[{"type": "watts", "data": [1, 2, 3]}]')
+
+    with pytest.raises(ValueError):
+        io.load_streams(str(path))
+
+
+@pytest.mark.parametrize('name', ['streams_1202065_1354978421.json', 'streams_1202065_1299011495.json'])
+def test_metrics_on_mapped_arrays(tmp_path, name):
+
+    stream_dict = _load_asset(name)
+    path = str(tmp_path / 'activity.vmpy')
+    io.save_streams(path, stream_dict)
+    rv = io.load_streams(path)
+
+    power = np.asarray(stream_dict['watts'], dtype=float)
+    mapped = rv['watts']
+
+    assert metrics.normalized_power(mapped) == metrics.normalized_power(power)
+    assert metrics.best_interval(mapped, 1200) == metrics.best_interval(power, 1200)
+    np.testing.assert_array_equal(metrics.power_duration_curve(mapped), metrics.power_duration_curve(power))
+    np.testing.assert_array_equal(streams.compute_zones(mapped, ftp=270), streams.compute_zones(power, ftp=270))
+    np.testing.assert_array_equal(streams.mask_fill(mapped, rv['moving']),
+                                  streams.mask_fill(power, stream_dict['moving']))
+    np.testing.assert_array_equal(streams.median_filter(rv['heartrate']),
+                                  streams.median_filter(np.asarray(stream_dict['heartrate'], dtype=float)))
+
+    altitude = rv['altitude'].copy()
+    assert rv['altitude'].dtype == np.float32 and not rv['altitude'].flags.writeable
+    np.testing.assert_array_equal(streams.median_filter(rv['altitude']),
+                                  streams.median_filter(np.asarray(stream_dict['altitude'], dtype=np.float32)))
+    np.testing.assert_array_equal(rv['altitude'], altitude)
+
+
+@pytest.mark.parametrize('name', ['streams_1202065_1354978421.json', 'streams_1202065_1299011495.json'])
+@pytest.mark.parametrize('chunk_size', [7, 65536])
+def test_decode_streams_matches_json(name, chunk_size):
+
+    expected = io.stream2arrays(_load_asset(name))
+
+    with open(os.path.join(_assets, name), 'rb') as f:
+        rv = io.decode_streams(f, chunk_size=chunk_size)
+
+    assert set(rv) == set(expected)
+    for name, data in expected.items():
+        assert rv[name].dtype == data.dtype
+        assert rv[name].shape == data.shape
+        np.testing.assert_array_equal(rv[name], data)
+
+
+def test_decode_streams_chunks_split_tokens():
+
+    body = (b'[{"data":[100,null,-2.5e1],"type":"watts","series_type":"time","original_size":3},'
+            b'{"type":"moving","data":[true,false,true]},'
+            b'{"type":"latlng","data":[[52.1,4.3],[52.2,4.4],[52.3,4.5]]}]')
+
+    rv = io.decode_streams(body[i:i + 1] for i in range(len(body)))
+
+    assert rv['watts'].dtype == np.float32
+    np.testing.assert_array_equal(rv['watts'], [100, np.nan, -25])
+    assert rv['moving'].dtype == np.bool_
+    np.testing.assert_array_equal(rv['moving'], [True, False, True])
+    assert rv['latlng'].shape == (3, 2)
+    np.testing.assert_array_equal(rv['latlng'], np.float32([[52.1, 4.3], [52.2, 4.4], [52.3, 4.5]]))
+
+
+def test_decode_streams_empty():
+
+    assert io.decode_streams(b' [ ] ') == {}
+    assert io.decode_streams('[{"type": "watts", "data": []}]')['watts'].size == 0
+
+
+@pytest.mark.parametrize('body', [b'[{"type": "watts", "data": [1, 2]', b'{"watts": [1, 2]}',
+                                  b'[{"type": "watts", "data": [1, x]}]', b'[{"data": [1, 2]}]',
+                                  b'[{"type": "watts", "data": [1, 2, ]}]',
+                                  b'[{"type": "watts", "data": [1, , 2]}]',
+                                  b'[{"type": "watts", "data": [, 1]}]',
+                                  b'[{"type": "latlng", "data": [[1, 2], [3, 4], ]}]',
+                                  b'[{"type": "latlng", "data": [[1, 2, ], [3, 4, ]]}]',
+                                  b'[{"type": "watts", "data": [1],}]',
+                                  b'[{"type": "watts", "data": [1, 2x, 3, 4]}]',
+                                  b'[{"type": "watts", "data": [1 2]}]',
+                                  b'[{"type": "watts", "data": [1, "a"]}]',
+                                  b'[{"type": "watts", "data": [+1, 2]}]',
+                                  b'[{"type": "latlng", "data": [[1, 2], 3]}]',
+                                  b'[{"type": "latlng", "data": [1, [2, 3]]}]'])
+def test_decode_streams_rejects_invalid_json(body):
+
+    with pytest.raises(ValueError):
+        io.decode_streams(body)
+    with pytest.raises(ValueError):
+        io.decode_streams(body[i:i + 1] for i in range(len(body)))
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from vmpy import core, kernels, metrics, streams
+
+
+pytestmark = pytest.mark.skipif(kernels.BACKEND != 'numba', reason='numba is not installed')
+
+
+def _both_backends(monkeypatch, func, *args):
+    """Results of the compiled kernels and of the NumPy fallback"""
+
+    compiled = func(*args)
+
+    with monkeypatch.context() as m:
+        for name in ('exponential_filter', 'rolling_median', 'rolling_median_mad'):
+            m.setattr(kernels, name, None)
+        fallback = func(*args)
+
+    return compiled, fallback
+
+
+def _assert_identical(a, b):
+
+    assert np.array_equal(a, b, equal_nan=True)
+
+
+@pytest.mark.parametrize('fixture', ['test_stream', 'test_stream_with_nans'])
+def test_kernels_bit_identical(fixture, request, monkeypatch):
+
+    power = np.asarray(request.getfixturevalue(fixture)['watts'], dtype=float)
+
+    cases = [
+        lambda: streams.rolling_mean(power, 30, type='ewma'),
+        lambda: metrics.normalized_power(power, type='xPower'),
+        lambda: streams.median_filter(power.copy()),
+        lambda: core.rolling_median(power, 31),
+        lambda: core.rolling_median_mad(power, 31),
+        lambda: metrics.power_duration_curve(power),
+        lambda: streams.w_prime_balance(power, 250, 20000, model='integral'),
+    ]
+
+    for case in cases:
+        _assert_identical(*_both_backends(monkeypatch, case))
+
+
+def test_exponential_filter_rows(monkeypatch):
+
+    arg = np.random.RandomState(0).rand(3, 2000)
+
+    compiled, fallback = _both_backends(monkeypatch, core.exponential_filter, arg, 0.999, None, [1.0, 2.0, 3.0])
+
+    assert np.array_equal(compiled, fallback)
@@ -13,11 +13,59 @@ def test_best_interval(test_rolling_mean):
     assert metrics.best_interval(stream, 5) == 1
 
 
-@mock.patch('vmpy.streams.compute_zones')
-def test_time_in_zones(zones):
+def test_best_intervals():
+
+    stream = [1, 2, 3, 4, 5, 1]
+
+    rv = metrics.best_intervals(stream, windows=[1, 2, 10])
+
+    assert rv[1] == (5.0, 4)
+    assert rv[2] == (4.5, 3)
+    assert rv[10] == (3.0, 0)
+
+
+def test_best_intervals_match_best_interval(test_stream_with_nans):
+
+    watts = test_stream_with_nans['watts']
+    moving = test_stream_with_nans['moving']
+
+    rv = metrics.best_intervals(watts, windows=[5, 30, 300], mask=moving)
+
+    for window in [5, 30, 300]:
+        expected = metrics.best_interval(watts, window, mask=moving)
+        assert np.isclose(rv[window][0], expected)
+
+
+def test_best_interval_series_skips_nan():
+
+    stream = pd.Series([100.0, np.nan, 300.0, 200.0])
+
+    assert metrics.best_interval(stream, 1) == 300.0
+    assert metrics.best_interval(stream, 2) == 300.0
+    assert np.isnan(metrics.best_interval(stream.tolist(), 1))
+    assert np.isnan(metrics.best_interval(pd.Series([np.nan, np.nan]), 1))
+
+
+def test_best_intervals_all_nan_window():
+
+    stream = [1, 2, np.nan, np.nan, np.nan, np.nan, np.nan, 4, 3]
+    windows = [1, 2, 5, 6]
+
+    rv = metrics.best_intervals(stream, windows=windows)
+
+    for window in windows:
+        expected = metrics.best_interval(pd.Series(stream), window)
+        assert rv[window][0] == expected
+    assert rv[5] == (4.0, 3)
+    assert rv[6] == (4.0, 2)
+
+    rv = metrics.best_intervals([np.nan, np.nan], windows=[1, 2])
+    assert np.isnan(rv[1][0]) and rv[1][1] == -1
+
+
+def test_time_in_zones():
 
     power = [0.55, 0.75, 0.9, 1.05, 1.2, 1.5, 10.0]
-    zones.return_value = [1,2,3,4,5,6,7]
 
     rv = metrics.time_in_zones(power, ftp=1.0)
     expected = [1, 1, 1, 1, 1, 1, 1]
@@ -100,4 +148,90 @@ def test_power_duration_curve_series():
     rv = metrics.power_duration_curve(stream)
 
     assert type(rv) == pd.Series
-    assert (rv == expected).all()
\ No newline at end of file
+    assert (rv == expected).all()
+
+
+def test_power_duration_curve_durations():
+
+    power = np.arange(101)
+    rv = metrics.power_duration_curve(power, durations=[1, 50, 100, 101])
+
+    assert rv[0] == 100.0
+    assert rv[1] == 75.5
+    assert rv[2] == 50.5
+    assert np.isnan(rv[3])
+
+
+def test_power_duration_curve_with_nans():
+
+    power = [100, None, 100, 200]
+    rv = metrics.power_duration_curve(power)
+
+    assert type(rv) == list
+    assert rv == [200.0, 50.0, 100.0]
+
+
+def test_log_durations():
+
+    rv = metrics.log_durations(3600, num=50)
+
+    assert rv[0] == 1
+    assert rv[-1] == 3600
+    assert (np.diff(rv) > 0).all()
+
+
+def test_power_duration_curve_accumulator():
+
+    pdc = metrics.PowerDurationCurve()
+
+    improved = pdc.update([300, 250], activity_id=1, date='2018-01-01T10:00:00Z')
+    assert improved.all()
+
+    improved = pdc.update([280, 260, 200], activity_id=2, date='2018-01-02')
+    assert improved.tolist() == [False, True, True]
+
+    assert pdc.power.tolist() == [300, 260, 200]
+    assert pdc.activity_id.tolist() == [1, 2, 2]
+    assert pdc.date[0] == np.datetime64('2018-01-01T10:00:00')
+    assert (pdc.durations == [1, 2, 3]).all()
+
+
+def test_power_duration_curve_accumulator_merge():
+
+    a = metrics.PowerDurationCurve()
+    a.update([300, 250], activity_id=1)
+
+    b = metrics.PowerDurationCurve()
+    b.update([310, 240, 220], activity_id=2)
+
+    a.merge(b)
+
+    assert a.power.tolist() == [310, 250, 220]
+    assert a.activity_id.tolist() == [2, 1, 2]
+    assert np.isnat(a.date).all()
+
+
+def test_power_duration_curve_accumulator_serialization():
+
+    pdc = metrics.PowerDurationCurve()
+    pdc.update(metrics.power_duration_curve(np.arange(101)), activity_id=1, date='2018-01-01')
+    pdc.update([np.nan, 200.0], activity_id=2)
+
+    rv = metrics.PowerDurationCurve.from_bytes(pdc.to_bytes())
+
+    assert len(rv) == 100
+    assert (rv.power == pdc.power).all()
+    assert (rv.activity_id == pdc.activity_id).all()
+    assert (rv.date.astype(np.int64) == pdc.date.astype(np.int64)).all()
+
+
+def test_power_duration_curve_int16(test_stream):
+
+    power = np.array(test_stream['watts'], dtype=np.int16)
+
+    rv = metrics.power_duration_curve(power)
+
+    assert rv.dtype == np.float64
+    assert np.array_equal(rv, metrics.power_duration_curve(power.astype(float)))
+    assert metrics.best_interval(power, 1200) == metrics.best_interval(power.astype(float), 1200)
+    assert metrics.best_intervals(power, [60]) == metrics.best_intervals(power.astype(float), [60])
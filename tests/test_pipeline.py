@@ -0,0 +1,71 @@
+import io
+import json
+import os
+import numpy as np
+from vmpy import pipeline, metrics
+
+
+_assets = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+
+def test_score_streams(test_stream):
+
+    rv = pipeline.score_streams(test_stream, ftp=270, lthr=160)
+
+    assert rv['duration'] == len(test_stream['watts'])
+    assert rv['normalized_power'] == metrics.normalized_power(test_stream['watts'])
+    assert np.isclose(rv['stress_score'], metrics.stress_score(rv['normalized_power'], 270, rv['duration']))
+    assert rv['time_in_power_zones'].sum() == rv['duration']
+    assert len(rv['time_in_heart_rate_zones']) == 5
+    assert rv['power_duration_curve']['durations'][0] == 1
+
+
+def test_score_streams_without_thresholds(test_stream):
+
+    rv = pipeline.score_streams(test_stream)
+
+    assert 'stress_score' not in rv
+    assert 'time_in_heart_rate_zones' not in rv
+
+
+def test_score_file_error(tmp_path):
+
+    path = tmp_path / 'streams_broken.json'
+    path.write_text('not a json')
+
+    rv = pipeline.score_file(str(path))
+
+    assert rv['activity'] == 'streams_broken'
+    assert rv['error'].startswith('JSONDecodeError')
+
+
+def test_run(tmp_path):
+
+    paths = [os.path.join(_assets, 'streams_1202065_1354978421.json'),
+             os.path.join(_assets, 'streams_1202065_1299011495.json')]
+    broken = tmp_path / 'streams_broken.json'
+    broken.write_text('[')
+
+    output = io.StringIO()
+    calls = []
+
+    scored, failed = pipeline.run(paths + [str(broken)], output, processes=2, chunk_size=1,
+                                  progress=lambda *args: calls.append(args), ftp=270)
+
+    assert (scored, failed) == (2, 1)
+    assert calls[-1] == (3, 3, 1)
+
+    results = {r['activity']: r for r in map(json.loads, output.getvalue().splitlines())}
+    assert set(results) == {'streams_1202065_1354978421', 'streams_1202065_1299011495', 'streams_broken'}
+    assert 'error' in results['streams_broken']
+    assert results['streams_1202065_1354978421']['stress_score'] > 0
+
+
+def test_main(tmp_path):
+
+    output = tmp_path / 'scores.jsonl'
+
+    rv = pipeline.main(['score', _assets, '--ftp', '270', '--processes', '1', '--output', str(output), '-q'])
+
+    assert rv == 0
+    assert len(output.read_text().splitlines()) == 2
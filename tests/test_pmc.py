@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from vmpy import pmc
+
+
+def _reference(load, ctl_days=42, atl_days=7):
+
+    ctl = atl = 0.0
+    rv = []
+    for x in load:
+        tsb = ctl - atl
+        ctl += (x - ctl) / ctl_days
+        atl += (x - atl) / atl_days
+        rv.append((ctl, atl, tsb))
+
+    return np.array(rv).T
+
+
+def test_daily_load():
+
+    days, load = pmc.daily_load(['2018-01-01T07:00:00Z', '2018-01-01T18:00:00Z', '2018-01-04T07:00:00'],
+                                [50, 30, 100], end='2018-01-05')
+
+    assert days[0] == np.datetime64('2018-01-01')
+    assert len(days) == 5
+    assert load.tolist() == [80, 0, 0, 100, 0]
+
+
+def test_training_load():
+
+    load = np.random.RandomState(0).uniform(0, 150, 500)
+
+    ctl, atl, tsb = pmc.training_load(load)
+    expected = _reference(load)
+
+    assert np.allclose(ctl, expected[0], rtol=1e-12)
+    assert np.allclose(atl, expected[1], rtol=1e-12)
+    assert np.allclose(tsb, expected[2], rtol=1e-12, atol=1e-9)
+
+
+def test_training_load_many_athletes():
+
+    load = np.random.RandomState(0).uniform(0, 150, (3, 200))
+
+    ctl, atl, tsb = pmc.training_load(load)
+
+    for i in range(3):
+        assert np.allclose(ctl[i], _reference(load[i])[0], rtol=1e-12)
+
+
+def test_training_load_append():
+
+    rng = np.random.RandomState(0)
+    dates = np.datetime64('2018-01-01') + np.sort(rng.randint(0, 300, 200))
+    tss = rng.uniform(20, 200, 200)
+    athletes = rng.randint(0, 3, 200)
+
+    history = pmc.TrainingLoad('2018-01-01')
+    for chunk in np.array_split(np.arange(200), 5):
+        history.append(dates[chunk], tss[chunk], athletes=athletes[chunk])
+    history.append([], [], end='2018-12-31')
+
+    assert len(history) == 365
+    for athlete in range(3):
+        _, load = pmc.daily_load(dates[athletes == athlete], tss[athletes == athlete],
+                                 start='2018-01-01', end='2018-12-31')
+        expected = pmc.training_load(load)
+        for rv, e in zip(history[athlete], expected):
+            assert np.allclose(rv, e, rtol=1e-12, atol=1e-9)
+
+
+def test_training_load_append_past_day():
+
+    history = pmc.TrainingLoad('2018-01-01')
+    history.append(['2018-01-10'], [100.0])
+    history.append(['2018-01-05'], [50.0])
+
+    _, load = pmc.daily_load(['2018-01-10', '2018-01-05'], [100.0, 50.0], start='2018-01-01')
+
+    assert np.allclose(history[None][0], pmc.training_load(load)[0], rtol=1e-12)
+
+    with pytest.raises(ValueError):
+        history.append(['2017-12-31'], [10.0])
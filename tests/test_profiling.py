@@ -0,0 +1,119 @@
+import tracemalloc
+import numpy as np
+import pytest
+from vmpy import metrics, profiling, streams
+from vmpy.cache import ResponseCache
+from vmpy.strava import StravaClient
+
+
+@pytest.fixture
+def profiled():
+
+    profiling.reset()
+    profiling.enable()
+    yield profiling
+    profiling.disable()
+    profiling.reset()
+
+
+def test_disabled_records_nothing():
+
+    profiling.reset()
+
+    streams.rolling_mean([1, 2, 3], window=2)
+
+    assert not profiling.is_enabled()
+    assert profiling.snapshot()['functions'] == {}
+
+
+def test_function_calls(profiled):
+
+    streams.rolling_mean([1, 2, 3], window=2)
+    streams.rolling_mean(np.arange(10), window=2)
+    metrics.normalized_power(np.arange(100))
+
+    rv = profiling.snapshot()['functions']
+
+    assert rv['streams.rolling_mean']['calls'] == 2
+    assert rv['streams.rolling_mean']['samples'] == 13
+    assert rv['streams.rolling_mean']['max_length'] == 10
+    assert rv['streams.rolling_mean']['seconds'] > 0
+    assert 'utils.cast_array_to_original_type' not in rv
+    assert rv['metrics.normalized_power']['calls'] == 1
+
+
+def test_allocated_bytes():
+
+    profiling.reset()
+    profiling.enable(memory=True)
+    try:
+        metrics.power_duration_curve(np.arange(1000.0))
+        metrics.relative_intensity(250, 270)
+    finally:
+        profiling.disable()
+
+    rv = profiling.snapshot()['functions']
+
+    assert rv['metrics.power_duration_curve']['bytes'] >= 8000
+    assert rv['metrics.relative_intensity']['samples'] == 0
+
+
+def test_memory_keeps_callers_tracemalloc():
+
+    profiling.reset()
+    tracemalloc.start()
+    try:
+        # Peak of an array freed before the profiled calls
+        np.zeros(10**6).sum()
+        profiling.enable(memory=True)
+        metrics.power_duration_curve(np.arange(1000.0))
+        profiling.disable()
+
+        assert tracemalloc.is_tracing()
+        assert tracemalloc.get_traced_memory()[1] >= 8 * 10**6
+        assert profiling.snapshot()['functions']['metrics.power_duration_curve']['bytes'] == 0
+    finally:
+        tracemalloc.stop()
+        profiling.reset()
+
+    profiling.enable(memory=True)
+    profiling.disable()
+
+    assert not tracemalloc.is_tracing()
+
+
+def test_http_and_cache(profiled, strava_server, tmp_path):
+
+    strava_server.routes['/activities/1'] = [(200, {'id': 1}, {})]
+    strava_server.routes['/activities/2'] = [(404, {}, {})]
+
+    with StravaClient('abc123', base_url=strava_server.url, cache=ResponseCache(str(tmp_path))) as client:
+        client.retrieve_activity(1)
+        client.retrieve_activity(1)
+        client.retrieve_activity(2)
+
+    rv = profiling.snapshot()
+
+    assert rv['http']['requests'] == 2
+    assert rv['http']['status'][200]['requests'] == 1
+    assert rv['http']['status'][404]['requests'] == 1
+    assert rv['http']['latency'] > 0
+    assert rv['cache']['hits'] == 1
+    assert rv['cache']['misses'] == 1
+    assert rv['cache']['hit_rate'] == 0.5
+    assert rv['functions']['strava.StravaClient.retrieve_activity']['calls'] == 3
+
+
+def test_to_prometheus(profiled):
+
+    streams.wpk([100, 200], 75)
+    profiling.record_http(None, 0.5)
+
+    rv = profiling.to_prometheus()
+
+    assert '# TYPE vmpy_function_calls_total counter' in rv
+    assert 'vmpy_function_calls_total{function="streams.wpk"} 1' in rv
+    assert 'vmpy_function_samples_total{function="streams.wpk"} 2' in rv
+    assert 'vmpy_http_requests_total{status="error"} 1' in rv
+    assert 'vmpy_cache_lookups_total{result="hit"} 0' in rv
+    assert rv.endswith('\n')
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from vmpy.resample import resample
+
+
+def _stream():
+
+    return {'time': [0, 1, 2, 5, 6, 20, 21],
+            'watts': [100, 110, 120, 150, 160, 200, 210],
+            'heartrate': [120, 121, 122, 125, None, 130, 131],
+            'moving': [True, True, True, True, True, True, True],
+            'latlng': [[0.0, 0.0], [0.0, 1.0], [0.0, 2.0], [0.0, 5.0], [0.0, 6.0], [0.0, 20.0], [0.0, 21.0]]}
+
+
+def test_resample_uniform_without_copy():
+
+    stream = {'time': np.arange(10), 'watts': np.arange(10, dtype=np.int16)}
+
+    rv = resample(stream)
+
+    assert rv['watts'] is stream['watts']
+    assert rv['time'] is stream['time']
+
+
+def test_resample_grid():
+
+    rv = resample(_stream())
+
+    assert rv['time'].tolist() == list(range(22))
+    assert all(len(v) == 22 for v in rv.values())
+    assert rv['watts'][:7].tolist() == [100, 110, 120, 130, 140, 150, 160]
+    assert rv['moving'].all()
+    assert rv['latlng'].shape == (22, 2)
+    assert np.array_equal(rv['latlng'][:, 1], np.arange(22))
+
+
+@pytest.mark.parametrize('fill', ['zero', 'nan', 'ffill', 'linear'])
+def test_resample_matches_pandas(fill):
+
+    stream = _stream()
+    series = pd.Series(stream['watts'], index=stream['time'], dtype=float)
+    grid = range(22)
+
+    if fill == 'zero':
+        expected = series.reindex(grid, fill_value=0.0)
+    elif fill == 'nan':
+        expected = series.reindex(grid)
+    elif fill == 'ffill':
+        expected = series.reindex(grid, method='ffill')
+    else:
+        expected = series.reindex(grid).interpolate(method='index')
+
+    rv = resample(stream, fill=fill)
+
+    assert np.allclose(rv['watts'], expected.values, rtol=1e-12, equal_nan=True)
+
+
+def test_resample_max_gap():
+
+    rv = resample(_stream(), max_gap=5)
+
+    # 2..5 is a gap, 6..20 a pause
+    assert rv['watts'][3] == 130
+    assert (rv['watts'][7:20] == 0).all()
+    assert np.isnan(rv['heartrate'][7:20]).all()
+    assert not rv['moving'][7:20].any()
+    assert (rv['latlng'][7:20, 1] == 6.0).all()
+    assert rv['watts'][20] == 200
+
+
+def test_resample_missing_values_and_step():
+
+    rv = resample(_stream(), step=2, fill={'watts': 'nan'})
+
+    assert rv['time'].tolist() == list(range(0, 22, 2))
+    assert np.isnan(rv['watts'][2])
+    assert np.isnan(rv['heartrate'][3])
+
+
+def test_resample_errors():
+
+    with pytest.raises(ValueError):
+        resample({'time': [0, 2, 1], 'watts': [1, 2, 3]})
+
+    with pytest.raises(ValueError):
+        resample(_stream(), fill='cubic')
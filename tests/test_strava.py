@@ -1,6 +1,10 @@
+import numpy as np
+from vmpy import strava
 from vmpy.strava import authorization_header
 from vmpy.strava import stream2dict
 from vmpy.strava import zones2list
+from vmpy.strava import RateLimiter, StravaClient
+from vmpy.cache import ResponseCache
 
 
 def test_authorization_header():
@@ -32,6 +36,21 @@ def test_stream2dict():
     assert stream2dict(stream_list) == expected
 
 
+def test_stream2dict_compact(test_stream):
+
+    stream_list = [{'type': k, 'data': v} for k, v in test_stream.items()]
+
+    rv = stream2dict(stream_list, compact=True)
+
+    assert rv['watts'].dtype == np.int16
+    assert rv['heartrate'].dtype == np.uint8
+    assert rv['watts'].tolist() == test_stream['watts']
+
+    compact = sum(v.nbytes for v in rv.values())
+    full = sum(np.asarray(v, dtype=float).nbytes for v in test_stream.values())
+    assert full / compact > 2.5
+
+
 def test_zones2list_power(test_zones):
 
     rv = zones2list(test_zones, type="power")
@@ -44,3 +63,169 @@ def test_zones2list_heart_rate(test_zones):
     rv = zones2list(test_zones, type="heart_rate")
     expected = [-1, 142, 155, 162, 174, 10000]
     assert rv == expected
+
+
+def test_rate_limiter_waits_for_short_window():
+
+    now = [1000.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter(short_limit=2, long_limit=100, clock=lambda: now[0], sleep=sleep)
+
+    limiter.acquire()
+    limiter.acquire()
+    limiter.acquire()
+
+    assert sleeps == [800.0]
+    assert limiter.usage == [1, 3]
+
+
+def test_rate_limiter_update_from_headers():
+
+    limiter = RateLimiter(clock=lambda: 1000.0)
+    limiter.acquire()
+
+    limiter.update({'X-RateLimit-Limit': '100,1000', 'X-RateLimit-Usage': '42,900'})
+
+    assert limiter.limits == [100, 1000]
+    assert limiter.usage == [42, 900]
+
+
+def test_client_retrieve(strava_server):
+
+    headers = {'X-RateLimit-Limit': '600,30000', 'X-RateLimit-Usage': '10,20'}
+    strava_server.routes['/athlete'] = [(200, {'id': 1202065}, headers)]
+    strava_server.routes['/activities/1/streams/watts'] = [(200, [{'type': 'watts', 'data': [1, 2]}], {})]
+
+    with StravaClient('abc123', base_url=strava_server.url) as client:
+        athlete = client.retrieve_athlete()
+        streams = client.retrieve_streams(1, types='watts')
+        missing = client.retrieve_activity(2)
+
+    assert athlete == {'id': 1202065}
+    assert streams == {'watts': [1, 2]}
+    assert missing is None
+    assert strava_server.requests[0][1]['Authorization'] == 'Bearer abc123'
+    assert client.rate_limiter.usage[1] == 22
+
+
+def test_client_retrieve_streams_compact(strava_server):
+
+    strava_server.routes['/activities/1/streams/watts,heartrate'] = [
+        (200, [{'type': 'watts', 'data': [100, 200]}, {'type': 'heartrate', 'data': [120, 130]}], {})]
+
+    with StravaClient('abc123', base_url=strava_server.url) as client:
+        streams = client.retrieve_streams(1, types='watts,heartrate', compact=True)
+
+    assert streams['watts'].dtype == np.int16
+    np.testing.assert_array_equal(streams['watts'], [100, 200])
+    assert streams['heartrate'].dtype == np.uint8
+
+
+def test_retrieve_streams_compact_is_streamed(strava_server, monkeypatch, tmp_path):
+
+    strava_server.routes['/activities/1/streams/watts'] = [(200, [{'type': 'watts', 'data': [100, 200]}], {})]
+
+    bodies = []
+    decode_streams = strava.decode_streams
+
+    def recording_decode_streams(body):
+        bodies.append(body)
+        return decode_streams(body)
+
+    monkeypatch.setattr(strava, 'decode_streams', recording_decode_streams)
+
+    with StravaClient('abc123', base_url=strava_server.url) as client:
+        streams = client.retrieve_streams(1, types='watts', compact=True)
+    np.testing.assert_array_equal(streams['watts'], [100, 200])
+    assert not isinstance(bodies[-1], bytes)
+
+    # The cached body is downloaded in full
+    with StravaClient('abc123', base_url=strava_server.url, cache=ResponseCache(str(tmp_path))) as client:
+        streams = client.retrieve_streams(1, types='watts', compact=True)
+    np.testing.assert_array_equal(streams['watts'], [100, 200])
+    assert isinstance(bodies[-1], bytes)
+
+    # The module level function streams the same way
+    calls = []
+    http_get = strava._http_get
+
+    def local_http_get(url, **kwargs):
+        calls.append(kwargs)
+        return http_get(url.replace('https://www.strava.com/api/v3', strava_server.url), **kwargs)
+
+    monkeypatch.setattr(strava, '_http_get', local_http_get)
+    streams = strava.retrieve_streams(1, 'abc123', types='watts', compact=True)
+    np.testing.assert_array_equal(streams['watts'], [100, 200])
+    assert calls[-1]['stream'] is True
+    assert not isinstance(bodies[-1], bytes)
+
+
+def test_client_retries_transient_failures(strava_server):
+
+    strava_server.routes['/activities/1'] = [(503, {}, {}), (502, {}, {}), (200, {'id': 1}, {})]
+
+    client = StravaClient('abc123', base_url=strava_server.url, backoff_factor=0)
+
+    assert client.retrieve_activity(1) == {'id': 1}
+    assert len(strava_server.requests) == 3
+    assert client.rate_limiter.usage == [3, 3]
+
+
+def test_client_gives_up_after_retries(strava_server):
+
+    strava_server.routes['/activities/1'] = [(503, {}, {})] * 3
+
+    client = StravaClient('abc123', base_url=strava_server.url, retries=2, backoff_factor=0)
+
+    assert client.retrieve_activity(1) is None
+    assert len(strava_server.requests) == 3
+    assert client.rate_limiter.usage == [3, 3]
+
+
+def test_client_waits_on_too_many_requests(strava_server):
+
+    strava_server.routes['/activities/1'] = [(429, {}, {}), (200, {'id': 1}, {})]
+    now = [1000.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter(clock=lambda: now[0], sleep=sleep)
+
+    client = StravaClient('abc123', base_url=strava_server.url, rate_limiter=limiter)
+
+    assert client.retrieve_activity(1) == {'id': 1}
+    assert sleeps == [800.0]
+
+
+def test_client_retrieve_activities_concurrently(strava_server):
+
+    for i in range(20):
+        strava_server.routes['/activities/{}'.format(i)] = [(200, {'id': i}, {})]
+
+    with StravaClient('abc123', base_url=strava_server.url, max_workers=4) as client:
+        rv = client.retrieve_activities(list(range(20)) + [99])
+
+    assert rv[:20] == [{'id': i} for i in range(20)]
+    assert rv[20] is None
+
+
+def test_client_cache(strava_server, tmp_path):
+
+    strava_server.routes['/activities/1'] = [(200, {'id': 1}, {'ETag': '"v1"'})]
+    response_cache = ResponseCache(str(tmp_path))
+
+    with StravaClient('abc123', base_url=strava_server.url, cache=response_cache) as client:
+        first = client.retrieve_activity(1)
+        second = client.retrieve_activity(1)
+
+    assert first == second == {'id': 1}
+    assert len(strava_server.requests) == 1
+    assert response_cache.hits == 1
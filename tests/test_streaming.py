@@ -0,0 +1,78 @@
+import numpy as np
+from vmpy import streaming, streams, metrics
+
+
+def _watts(test_stream_with_nans):
+
+    return np.asarray(test_stream_with_nans['watts'], dtype=float)
+
+
+def test_rolling_mean_push_sample():
+
+    rolling_mean = streaming.RollingMean(window=2)
+
+    rv = [rolling_mean.push(x) for x in [1, 2, 3, 4, 5]]
+
+    assert rv == [1, 1.5, 2.5, 3.5, 4.5]
+    assert rolling_mean.value == 4.5
+
+
+def test_rolling_mean_matches_batch(test_stream_with_nans):
+
+    watts = _watts(test_stream_with_nans)
+
+    for kwargs in [dict(window=30), dict(window=25, type='ewma'), dict(window=1, type='ewma')]:
+        rolling_mean = streaming.RollingMean(**kwargs)
+        rv = np.concatenate([rolling_mean.push(chunk) for chunk in np.array_split(watts, 7)])
+
+        assert np.array_equal(rv, streams.rolling_mean(watts, **kwargs), equal_nan=True)
+
+
+def test_normalized_power_matches_batch(test_stream_with_nans):
+
+    watts = _watts(test_stream_with_nans)
+
+    normalized_power = streaming.NormalizedPower()
+    for x in watts:
+        normalized_power.push(x)
+
+    assert normalized_power.value == metrics.normalized_power(watts)
+
+
+def test_best_interval_matches_batch(test_stream):
+
+    best_interval = streaming.BestInterval(60)
+    best_interval.push(test_stream['watts'])
+
+    assert best_interval.value == metrics.best_interval(test_stream['watts'], 60)
+
+
+def test_zones():
+
+    zones = streaming.Zones(ftp=1.0)
+
+    rv = zones.push([0.55, 0.75, 0.9, 1.05, 1.2, 1.5, 10.0])
+
+    assert rv.tolist() == [1, 2, 3, 4, 5, 6, 7]
+    assert np.isnan(zones.push(11.0))
+
+
+def test_median_filter_matches_batch(test_stream):
+
+    grade = np.asarray(test_stream['grade_smooth'], dtype=float)
+
+    median_filter = streaming.MedianFilter(window=31, threshold=1)
+    rv = median_filter.push(grade)
+
+    assert np.array_equal(rv, streams.median_filter(grade.copy()))
+
+
+def test_w_prime_balance(test_stream_with_nans):
+
+    power = test_stream_with_nans['watts']
+    live = streaming.WPrimeBalance(cp=250, w_prime=20000)
+
+    rv = live.push(power)
+
+    assert np.allclose(rv, streams.w_prime_balance(power, 250, 20000), rtol=1e-12, atol=1e-8)
+    assert live.value == rv[-1]
@@ -1,6 +1,6 @@
 import numpy as np
 import pandas as pd
-from vmpy import streams
+from vmpy import streams, strava
 
 
 def test_mask_filter_mask_none():
@@ -168,6 +168,19 @@ def test_hampel_filter_with_replacement():
     assert (rv == expected).all()
 
 
+def test_hampel_filter_inplace():
+
+    stream = np.ones(60)
+    stream[-1] = 2
+
+    rv = streams.median_filter(stream)
+    assert stream[-1] == 2
+
+    rv = streams.median_filter(stream, inplace=True)
+    assert rv is stream
+    assert (stream == np.ones(60)).all()
+
+
 
 def test_wpk():
 
@@ -268,3 +281,146 @@ def test_zones_power_ftp_ndarray():
 
     assert type(rv) == np.ndarray
     assert (rv == expected).all()
+
+
+def test_zone_binner_lookup_table_matches_search():
+
+    binner = streams.ZoneBinner(ftp=270)
+    stream = np.arange(-5, 3000)
+
+    rv = binner.zone_index(stream[5:])
+    expected = binner.zone_index(stream[5:].astype(float))
+
+    assert (rv == expected).all()
+    assert (binner.zone_index(stream) == binner.zone_index(stream.astype(float))).all()
+
+
+def test_zone_binner_strava_zones():
+
+    zones = {'power': {'zones': [{'min': 0, 'max': 144}, {'min': 144, 'max': 196}, {'min': 196, 'max': -1}]}}
+    binner = streams.ZoneBinner(zones=strava.zones2list(zones))
+
+    rv = binner.compute_zones([1, 144, 145, 196, 500])
+
+    assert len(binner) == 3
+    assert rv == [1, 1, 2, 2, 3]
+
+
+def test_zone_binner_time_in_zones():
+
+    binner = streams.ZoneBinner(zones=[-1, 144, 196, 235, 10000])
+    stream = [100, 150, 160, 300, 310, 320]
+
+    assert binner.time_in_zones(stream) == [1, 2, 3]
+    assert (binner.time_in_zones(np.asarray(stream)) == [1, 2, 3]).all()
+
+    rv = binner.time_in_zones(pd.Series(stream))
+    assert list(rv.index) == [1, 2, 3, 4]
+    assert list(rv) == [1, 2, 0, 3]
+
+    rv = binner.compute_zones(pd.Series(stream))
+    assert isinstance(rv.dtype, pd.CategoricalDtype)
+    assert list(rv.cat.categories) == [1, 2, 3, 4]
+    assert list(rv) == [1, 2, 2, 4, 4, 4]
+
+
+def test_compute_zones_list_with_nan():
+
+    rv = streams.compute_zones([50, 500, np.nan, 150], ftp=200)
+
+    assert rv[:2] == [1, 7] and rv[3] == 2
+    assert all(type(v) == int for v in rv[:2] + rv[3:])
+    assert np.isnan(rv[2])
+
+
+def test_zone_binner_integer_samples_outside_of_zones():
+
+    expected = [np.nan, 1, 2]
+
+    rv = streams.compute_zones([0, 50, 150], zones=[0, 100, 200])
+    np.testing.assert_array_equal(rv, expected)
+
+    rv = streams.ZoneBinner(zones=[0, 100, 200]).compute_zones(np.array([0, 50, 150]))
+    np.testing.assert_array_equal(rv, expected)
+
+
+def _w_prime_balance_reference(power, cp, w_prime):
+
+    expended = 0.0
+    rv = []
+    for x in power:
+        if x > cp:
+            expended += x - cp
+        else:
+            expended *= np.exp(-(cp - x) / w_prime)
+        rv.append(w_prime - expended)
+
+    return rv
+
+
+def test_w_prime_balance(test_stream):
+
+    power = test_stream['watts']
+
+    rv = streams.w_prime_balance(power, 250, 20000)
+
+    assert type(rv) == list
+    assert np.allclose(rv, _w_prime_balance_reference(power, 250, 20000), rtol=1e-12, atol=1e-8)
+
+
+def test_w_prime_balance_mask_series():
+
+    power = pd.Series([400.0, 400.0, 100.0, 100.0])
+    mask = [True, True, False, True]
+
+    rv = streams.w_prime_balance(power, 300, 1000, mask=mask)
+
+    assert type(rv) == pd.Series
+    assert np.allclose(rv, _w_prime_balance_reference([400, 400, 0, 100], 300, 1000))
+
+
+def test_w_prime_balance_chunks(test_stream):
+
+    power = np.asarray(test_stream['watts'], dtype=float)
+
+    expected = streams.w_prime_balance(power, 250, 20000)
+    first = streams.w_prime_balance(power[:3000], 250, 20000)
+    second = streams.w_prime_balance(power[3000:], 250, 20000, initial=first[-1])
+
+    assert np.allclose(np.concatenate([first, second]), expected, rtol=1e-12, atol=1e-8)
+
+
+def test_w_prime_balance_integral():
+
+    power = np.array([400.0] * 60 + [150.0] * 600)
+    tau = 546 * np.exp(-0.01 * 150) + 316
+
+    rv = streams.w_prime_balance(power, 300, 20000, model='integral')
+
+    expended = 0.0
+    expected = []
+    for x in power:
+        expended = np.exp(-1 / tau) * expended + max(x - 300, 0)
+        expected.append(20000 - expended)
+
+    assert np.allclose(rv, expected, rtol=1e-12)
+
+
+def test_narrow_dtypes_preserved(test_stream):
+
+    watts = np.array(test_stream['watts'], dtype=np.int16)
+    moving = np.array(test_stream['moving'])
+    expected = np.array(test_stream['watts'], dtype=float)
+
+    rv = streams.rolling_mean(watts, 30, mask=moving)
+    assert rv.dtype == np.float32
+    assert np.allclose(rv, streams.rolling_mean(expected, 30, mask=moving), rtol=1e-6)
+
+    rv = streams.rolling_mean(watts, 30, type='ewma')
+    assert rv.dtype == np.float32
+    assert np.allclose(rv, streams.rolling_mean(expected, 30, type='ewma'), rtol=1e-6)
+
+    assert streams.wpk(watts, 75).dtype == np.float32
+    assert streams.wpk(watts.astype(np.float32), 75).dtype == np.float32
+    assert streams.mask_fill(watts, moving).dtype == np.int16
+    assert streams.median_filter(np.array(test_stream['heartrate'], dtype=np.uint8)).dtype == np.float32
@@ -1,6 +1,6 @@
 import numpy as np
 import pandas as pd
-from vmpy.utils import cast_array_to_original_type
+from vmpy.utils import cast_array_to_original_type, to_datetime64
 
 
 def test_cast_array_to_original_type():
@@ -27,4 +27,11 @@ def test_cast_array_to_original_type():
     assert type(rv) == type(arg)
 
     rv = cast_array_to_original_type(np.array(arg), type(arg))
-    assert type(rv) == type(arg)
\ No newline at end of file
+    assert type(rv) == type(arg)
+
+
+def test_to_datetime64():
+
+    assert to_datetime64('2018-01-02T07:30:00Z') == np.datetime64('2018-01-02T07:30:00', 's')
+    assert to_datetime64('2018-01-02').dtype == np.dtype('datetime64[s]')
+    assert np.isnat(to_datetime64(None))
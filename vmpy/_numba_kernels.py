@@ -0,0 +1,118 @@
+"""numba implementations of the kernels, imported by vmpy.kernels on first use"""
+
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def exponential_filter(arg, decay, powers, inverse, state, out):
+    """Block-wise s[t] = decay * s[t-1] + arg[t] of every row, see core.exponential_filter"""
+
+    rows, n = arg.shape
+    block = len(powers)
+
+    for r in range(rows):
+        s = state[r]
+        for start in range(0, n, block):
+            stop = min(start + block, n)
+            carry = decay * s
+            partial = 0.0
+            for k in range(stop - start):
+                partial += arg[r, start + k] * inverse[k]
+                s = (partial + carry) * powers[k]
+                out[r, start + k] = s
+
+
+@njit(cache=True)
+def _insort(ordered, size, x):
+    """Insert x into the first size elements of ordered, after equal values"""
+
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if x < ordered[mid]:
+            hi = mid
+        else:
+            lo = mid + 1
+    for j in range(size, lo, -1):
+        ordered[j] = ordered[j - 1]
+    ordered[lo] = x
+
+    return size + 1
+
+
+@njit(cache=True)
+def _remove(ordered, size, x):
+    """Remove x from the first size elements of ordered, NaN was never inserted"""
+
+    if x != x:
+        return size
+
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ordered[mid] < x:
+            lo = mid + 1
+        else:
+            hi = mid
+    for j in range(lo, size - 1):
+        ordered[j] = ordered[j + 1]
+
+    return size - 1
+
+
+@njit(cache=True)
+def _median(ordered, size):
+
+    if size == 0:
+        return np.nan
+    if size % 2:
+        return ordered[size // 2]
+
+    return (ordered[size // 2 - 1] + ordered[size // 2]) / 2
+
+
+@njit(cache=True)
+def rolling_median(values, window, out):
+    """Trailing rolling median skipping NaN, see core.rolling_median"""
+
+    ordered = np.empty(window)
+    size = 0
+
+    for i in range(len(values)):
+        if i >= window:
+            size = _remove(ordered, size, values[i - window])
+        x = values[i]
+        if x == x:
+            size = _insort(ordered, size, x)
+        out[i] = _median(ordered, size)
+
+
+@njit(cache=True)
+def rolling_median_mad(values, window, medians, median_abs_deviations):
+    """Trailing rolling median and MAD in a single pass, see core.rolling_median_mad"""
+
+    n = len(values)
+    deviations = np.empty(n)
+    ordered = np.empty(window)
+    ordered_deviations = np.empty(window)
+    size = 0
+    size_deviations = 0
+
+    for i in range(n):
+        if i >= window:
+            size = _remove(ordered, size, values[i - window])
+            size_deviations = _remove(ordered_deviations, size_deviations, deviations[i - window])
+        x = values[i]
+        if x == x:
+            size = _insort(ordered, size, x)
+
+        median = _median(ordered, size)
+        medians[i] = median
+
+        deviation = abs(x - median)
+        deviations[i] = deviation
+        if deviation == deviation:
+            size_deviations = _insort(ordered_deviations, size_deviations, deviation)
+
+        median_abs_deviations[i] = _median(ordered_deviations, size_deviations)
@@ -0,0 +1,242 @@
+"""Metrics of a single activity computed lazily from shared intermediates
+
+The streams are masked and converted once. Intermediates needed by several
+metrics, e.g. the running sums of power behind both the rolling means and the
+Power-Duration Curve, or the zone index stream behind both the zones and the
+time in zones, are computed on first access and reused afterwards. All values
+equal the respective streams and metrics functions.
+
+>>> activity = Activity(stream, ftp=270, lthr=160, weight=75, mask='moving')
+>>> activity.normalized_power, activity.stress_score, activity.time_in_power_zones
+"""
+
+from functools import cached_property
+
+import numpy as np
+from vmpy import core
+from vmpy.metrics import relative_intensity, stress_score
+from vmpy.streams import ZoneBinner
+
+
+class Activity(object):
+    """Streams of a single activity with memoized metrics
+
+    Streams are returned as read-only ndarrays of float, float32 for narrow
+    streams e.g. from io.load_streams, see core.float_dtype. The activity must not
+    be modified after creation, create a new one instead
+
+    Parameters
+    ----------
+    streams : dict
+        Streams in dict form, see strava.stream2dict
+    ftp : number, optional
+        Value for FTP, required for IF, TSS and power zones
+    lthr : number, optional
+        Value for LTHR, required for heart rate zones
+    weight : number, optional
+        Athlete weight in kg, required for watts per kilo
+    mask : str or array-like of bool, optional
+        Replacement mask of the power stream, or the name of the stream to use
+        as the mask e.g. 'moving', default=None means no masking
+    value : number, optional
+        Value to use for replacement, default=0.0
+    """
+
+    def __init__(self, streams, ftp=None, lthr=None, weight=None, mask=None, value=0.0):
+
+        self.streams = streams
+        self.ftp = ftp
+        self.lthr = lthr
+        self.weight = weight
+        self.mask = streams[mask] if isinstance(mask, str) else mask
+        self.value = value
+
+        self._rolling_means = {}
+
+    @cached_property
+    def power(self):
+        """Masked power stream"""
+
+        watts = self.streams['watts']
+
+        return _read_only(core.mask_fill(watts, mask=self.mask, value=self.value, dtype=core.float_dtype(watts)))
+
+    @cached_property
+    def heartrate(self):
+        """Heart rate stream"""
+
+        heartrate = self.streams['heartrate']
+
+        return _read_only(np.array(heartrate, dtype=core.float_dtype(heartrate)))
+
+    @cached_property
+    def duration(self):
+        """Duration in seconds"""
+
+        return len(self.power)
+
+    @cached_property
+    def energy(self):
+        """Accumulated energy, NaN at missing samples, see metrics.power_duration_curve"""
+
+        total, count = self._running_sums
+        if count is None:
+            return total
+
+        return _read_only(np.where(np.isnan(self.power), np.nan, total))
+
+    def rolling_mean(self, window=10, type='uniform'):
+        """Rolling mean of the power stream, see streams.rolling_mean
+
+        Parameters
+        ----------
+        window : int
+        type : {"uniform", "ewma"}, optional
+
+        Returns
+        -------
+        ndarray of float
+        """
+
+        # Any type other than ewma is the uniform mean, same as core.rolling_mean
+        key = (window, type if type == 'ewma' else 'uniform')
+
+        if key not in self._rolling_means:
+            if type == 'ewma':
+                rv = core.rolling_mean(self.power, window=window, type='ewma', out=np.empty(self.duration))
+            else:
+                rv = core.uniform_mean(*self._running_sums, window=window)
+            self._rolling_means[key] = _read_only(rv)
+
+        return self._rolling_means[key]
+
+    def best_interval(self, window):
+        """Best interval of the power stream, see metrics.best_interval
+
+        Parameters
+        ----------
+        window : int
+            Duration of the interval in seconds
+
+        Returns
+        -------
+        float
+        """
+
+        return np.max(self.rolling_mean(window))
+
+    @cached_property
+    def normalized_power(self):
+        """NP, see metrics.normalized_power"""
+
+        return core.quartic_mean(self.rolling_mean(30))
+
+    @cached_property
+    def xpower(self):
+        """xPower, see metrics.normalized_power with type='xPower'"""
+
+        return core.quartic_mean(self.rolling_mean(25, type='emwa'))
+
+    @cached_property
+    def relative_intensity(self):
+        """IF, see metrics.relative_intensity"""
+
+        return relative_intensity(self.normalized_power, self._required('ftp'))
+
+    @cached_property
+    def stress_score(self):
+        """TSS, see metrics.stress_score"""
+
+        return stress_score(self.normalized_power, self._required('ftp'), self.duration)
+
+    @cached_property
+    def power_duration_curve(self):
+        """Power-Duration Curve for every duration, see metrics.power_duration_curve"""
+
+        return _read_only(self.power_duration_curve_at(np.arange(1, self.duration)))
+
+    def power_duration_curve_at(self, durations):
+        """Power-Duration Curve at the given durations, see metrics.log_durations
+
+        Parameters
+        ----------
+        durations : array-like of int
+
+        Returns
+        -------
+        ndarray of float
+        """
+
+        return core.max_mean_power(self.energy, durations)
+
+    @cached_property
+    def wpk(self):
+        """Watts per kilo stream, see streams.wpk"""
+
+        return _read_only(core.wpk(self.power, self._required('weight')))
+
+    @cached_property
+    def power_zones(self):
+        """Power zones stream, see streams.compute_zones"""
+
+        return _read_only(self._power_binner.zone_labels(self._power_zone_index))
+
+    @cached_property
+    def time_in_power_zones(self):
+        """Time [sec] in every power zone with at least one sample, see metrics.time_in_zones"""
+
+        return self._power_binner.zone_counts(self._power_zone_index)[0]
+
+    @cached_property
+    def heart_rate_zones(self):
+        """Heart rate zones stream, see streams.compute_zones"""
+
+        return _read_only(self._heart_rate_binner.zone_labels(self._heart_rate_zone_index))
+
+    @cached_property
+    def time_in_heart_rate_zones(self):
+        """Time [sec] in every heart rate zone with at least one sample, see metrics.time_in_zones"""
+
+        return self._heart_rate_binner.zone_counts(self._heart_rate_zone_index)[0]
+
+    @cached_property
+    def _running_sums(self):
+
+        total, count = core.running_sums(self.power)
+
+        return _read_only(total), count
+
+    @cached_property
+    def _power_binner(self):
+
+        return ZoneBinner(ftp=self._required('ftp'))
+
+    @cached_property
+    def _power_zone_index(self):
+
+        return self._power_binner.zone_index(self.power)
+
+    @cached_property
+    def _heart_rate_binner(self):
+
+        return ZoneBinner(lthr=self._required('lthr'))
+
+    @cached_property
+    def _heart_rate_zone_index(self):
+
+        return self._heart_rate_binner.zone_index(self.heartrate)
+
+    def _required(self, name):
+
+        rv = getattr(self, name)
+        if rv is None:
+            raise ValueError("{} is required".format(name))
+
+        return rv
+
+
+def _read_only(arr):
+
+    arr.flags.writeable = False
+
+    return arr
@@ -0,0 +1,250 @@
+"""Backfill of an athlete's activity history from the Strava API
+
+The activity list is paged concurrently, streams of the new activities are
+downloaded by a pool of threads and every activity is scored as soon as its
+streams arrive, while the next ones are still downloading. Results are
+written as JSON Lines, one activity per line, see pipeline.score_streams.
+
+Progress is kept in a JSON state file: the *after* cursor, the start time
+of the latest activity up to which everything is scored, and the ids of the
+activities scored beyond it. The state is replaced atomically after every
+chunk, so an interrupted backfill resumes where it stopped, and a later run
+only pulls activities recorded since.
+
+>>> with StravaClient(access_token=STRAVA_ACCESS_TOKEN) as client, open('scores.jsonl', 'a') as output:
+...     scored, failed = backfill(client, 'backfill.json', output, ftp=270, after='2014-01-01')
+"""
+
+import collections
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from vmpy.pipeline import score_streams
+from vmpy.utils import to_datetime64, to_json, write_atomic, write_lines
+
+logger = logging.getLogger(__name__)
+
+
+# Progress of a backfill, see load_state
+State = collections.namedtuple('State', ['after', 'done'])
+
+
+def backfill(client, state_path, output, ftp=None, lthr=None, full_curve=False, after=None, per_page=200,
+             chunk_size=100, progress=None, **kwargs):
+    """Score every activity of the athlete not scored by a previous run
+
+    Parameters
+    ----------
+    client : strava.StravaClient
+    state_path : str
+        JSON state file, created if missing
+    output : file-like
+        Text stream the JSON Lines results are written to
+    ftp, lthr, full_curve : optional
+        See pipeline.score_streams
+    after : int, str or datetime, optional
+        Start of the history if there is no state yet, epoch sec or date,
+        default=None means the whole history
+    per_page : int, optional
+        Activities per page of the activity list, default=200
+    chunk_size : int, optional
+        Results buffered before they are written out and the state is saved, default=100
+    progress : callable, optional
+        Called as progress(done, total, failed) after every activity
+    kwargs : see strava.retrieve_streams e.g. types
+
+    Returns
+    -------
+    (int, int)
+        Number of scored and failed activities, failed ones are retried by the next run.
+        None if listing the activities failed, the state is unchanged then
+    """
+
+    state = load_state(state_path, after=after)
+
+    activities = client.list_activities(after=None if state.after is None else state.after - 1, per_page=per_page)
+    if activities is None:
+        logger.error('Backfill Failed with a reason Listing the activities failed')
+        return None
+
+    # Oldest first, so the cursor can advance over the scored ones
+    activities = sorted(activities, key=lambda a: (_epoch(a['start_date']), a['id']))
+    pending = [a for a in activities
+               if (state.after is None or _epoch(a['start_date']) >= state.after) and a['id'] not in state.done]
+
+    cursor = _Cursor(state, activities)
+    total = len(pending)
+    done = failed = 0
+    buffer = []
+
+    def save():
+        write_lines(output, buffer)
+        save_state(state_path, cursor.state())
+
+    with ThreadPoolExecutor(max_workers=client.max_workers) as executor:
+
+        # Only a bounded number of downloads is in flight, so finished streams
+        # are scored and released while the next ones are still downloading
+        queue = iter(pending)
+        in_flight = {}
+        _submit(executor, client, queue, in_flight, 2 * client.max_workers, kwargs)
+
+        while in_flight:
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                activity = in_flight.pop(future)
+                result, line = _result(activity, future, ftp=ftp, lthr=lthr, full_curve=full_curve)
+
+                done += 1
+                if 'error' in result:
+                    failed += 1
+                else:
+                    cursor.scored(activity)
+                buffer.append(line)
+
+                if len(buffer) >= chunk_size:
+                    save()
+
+                if progress:
+                    progress(done, total, failed)
+
+            _submit(executor, client, queue, in_flight, len(finished), kwargs)
+
+    save()
+
+    return done - failed, failed
+
+
+def load_state(path, after=None):
+    """Progress of a previous run
+
+    Parameters
+    ----------
+    path : str
+    after : int, str or datetime, optional
+        Cursor if the file does not exist yet
+
+    Returns
+    -------
+    State
+        after: epoch sec of the latest activity up to which everything is scored or None,
+        done: set of the ids of the activities scored after the cursor
+    """
+
+    if not os.path.exists(path):
+        return State(None if after is None else _epoch(after), set())
+
+    with open(path) as f:
+        state = json.load(f)
+
+    return State(state.get('after', None), set(state.get('done', [])))
+
+
+def save_state(path, state):
+    """Replace the state file atomically
+
+    Parameters
+    ----------
+    path : str
+    state : State
+    """
+
+    data = json.dumps({'after': state.after, 'done': sorted(state.done)}, indent=2)
+    write_atomic(path, data.encode())
+
+
+class _Cursor(object):
+    """Advances over the listed activities scored without a gap, oldest first"""
+
+    def __init__(self, state, activities):
+
+        self.after = state.after
+        self.done = set(state.done)
+        self._start = {a['id']: _epoch(a['start_date']) for a in activities}
+        self._order = [a['id'] for a in activities if self.after is None or self._start[a['id']] >= self.after]
+        self._next = 0
+        self._advance()
+
+    def scored(self, activity):
+
+        self.done.add(activity['id'])
+        self._advance()
+
+    def state(self):
+
+        return State(self.after, set(self.done))
+
+    def _advance(self):
+
+        if self._next >= len(self._order) or self._order[self._next] not in self.done:
+            return
+
+        while self._next < len(self._order) and self._order[self._next] in self.done:
+            self.after = self._start[self._order[self._next]]
+            self._next += 1
+
+        # Activities started before the cursor are not listed again, at the cursor they are
+        self.done = {i for i in self.done if self._start.get(i, self.after) >= self.after}
+
+
+def _submit(executor, client, queue, in_flight, n, kwargs):
+
+    for activity in queue:
+        in_flight[executor.submit(_retrieve_streams, client, activity, kwargs)] = activity
+        n -= 1
+        if n <= 0:
+            break
+
+
+def _retrieve_streams(client, activity, kwargs):
+
+    if activity.get('manual', False):
+        # Manual activities have no streams
+        return {}
+
+    return client.retrieve_streams(activity['id'], **kwargs)
+
+
+def _result(activity, future, **kwargs):
+    """Result of a finished download and its JSON line, errors become error results"""
+
+    try:
+        result = _score(activity, future.result(), **kwargs)
+        return result, json.dumps(to_json(result))
+    except Exception as e:
+        logger.warning('Backfill of {} failed with a reason {!r}'.format(activity['id'], e))
+        result = {'activity': activity['id'], 'start_date': activity['start_date'],
+                  'error': '{}: {}'.format(type(e).__name__, e)}
+        return result, json.dumps(result)
+
+
+def _score(activity, streams, **kwargs):
+    """Metrics of a single activity with its id and start date, or the error message"""
+
+    rv = {'activity': activity['id'], 'start_date': activity['start_date']}
+
+    if streams is None:
+        rv['error'] = 'Retrieving the streams failed'
+        return rv
+
+    try:
+        rv.update(score_streams(streams, **kwargs))
+    except Exception as e:
+        logger.warning('Scoring {} failed with a reason {!r}'.format(activity['id'], e))
+        rv['error'] = '{}: {}'.format(type(e).__name__, e)
+
+    return rv
+
+
+def _epoch(date):
+    """Epoch sec of an epoch number, a date string or datetime"""
+
+    if isinstance(date, (int, float, np.integer, np.floating)):
+        return int(date)
+
+    return int(to_datetime64(date).astype('datetime64[s]').astype(np.int64))
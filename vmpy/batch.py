@@ -0,0 +1,234 @@
+"""Batch variants of the metrics, computed for many activities at once
+
+Every function accepts either a padded 2-D array with one activity per row,
+optionally with the valid *lengths* of the rows, or a ragged pair of 1-D
+*values* and *offsets*, where activity i is values[offsets[i]:offsets[i+1]].
+Per-activity parameters e.g. FTP or LTHR are passed as arrays with one value
+per row. All rows are processed together with vectorized NumPy operations.
+Narrow streams, e.g. int16 power, are processed as float32 rows with sums
+accumulated in float64, see core.float_dtype.
+"""
+
+import numpy as np
+from vmpy import core
+from vmpy.streams import POWER_ZONES_THRESHOLD, HEART_RATE_ZONES
+
+
+def normalized_power(arg, offsets=None, lengths=None, mask=None, value=0.0, **kwargs):
+    """Normalized power of every activity
+
+    Parameters
+    ----------
+    arg : ndarray
+        Padded 2-D power streams or 1-D values of ragged streams
+    offsets : array-like of int, optional
+        Row boundaries of ragged streams, default=None means arg is padded
+    lengths : array-like of int, optional
+        Valid length of every padded row, default=None means the full width
+    mask: array-like of bool, optional
+        Same layout as arg, default=None, which means no masking
+    value : number, optional
+        Value to use for replacement, default=0.0
+    type : {"xPower", "NP}
+        Determines calculation method to use, default='NP'
+
+    Returns
+    -------
+    ndarray of float
+    """
+
+    y, lengths = _as_padded(arg, offsets, lengths, mask, value)
+
+    if kwargs.get('type', 'NP') == 'xPower':
+        _rolling_mean = core.rolling_mean(y, window=25, type='emwa', out=y)
+    else:
+        _rolling_mean = core.rolling_mean(y, window=30, out=y)
+
+    np.power(_rolling_mean, 4, out=_rolling_mean)
+    _fill_padding(_rolling_mean, lengths, 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rv = (_rolling_mean.sum(axis=-1, dtype=np.float64) / lengths) ** (1/4)
+
+    return rv
+
+
+def best_interval(arg, window, offsets=None, lengths=None, mask=None, value=0.0, **kwargs):
+    """Best interval of every activity
+
+    Parameters
+    ----------
+    arg : ndarray
+        Padded 2-D streams or 1-D values of ragged streams
+    window : int
+        Duration of the interval in seconds
+    offsets : array-like of int, optional
+        Row boundaries of ragged streams, default=None means arg is padded
+    lengths : array-like of int, optional
+        Valid length of every padded row, default=None means the full width
+    mask : array-like of bool, optional
+        Same layout as arg, default=None, which means no masking
+    value : number, optional
+        Value to use for replacement, default=0.0
+
+    Returns
+    -------
+    ndarray of float
+    """
+
+    y, lengths = _as_padded(arg, offsets, lengths, mask, value)
+
+    _rolling_mean = core.rolling_mean(y, window=window, out=y)
+    _fill_padding(_rolling_mean, lengths, -np.inf)
+
+    rv = _rolling_mean.max(axis=-1, initial=-np.inf).astype(float)
+    rv[lengths == 0] = np.nan
+
+    return rv
+
+
+def time_in_zones(arg, offsets=None, lengths=None, **kwargs):
+    """Time in zones of every activity
+
+    Unlike metrics.time_in_zones, zones without samples are reported as 0,
+    so the result is always a full (activities, zones) table
+
+    Parameters
+    ----------
+    arg : ndarray
+        Padded 2-D power or heartrate streams or 1-D values of ragged streams
+    offsets : array-like of int, optional
+        Row boundaries of ragged streams, default=None means arg is padded
+    lengths : array-like of int, optional
+        Valid length of every padded row, default=None means the full width
+    ftp : array-like, optional
+        FTP of every activity, will be used for 7-zones calculation
+    lthr: array-like, optional
+        LTHR of every activity, will be used for 5-zones calculation
+    zones: array-like, optional
+        Custom zones edges shared by all activities (1-D) or per activity (2-D)
+
+    Returns
+    -------
+    ndarray of int
+        Time [sec] spent in each zone, shape (activities, zones)
+    """
+
+    y, lengths = _as_padded(arg, offsets, lengths)
+    rows = len(lengths)
+
+    if kwargs.get('zones', None) is not None:
+        abs_zones = np.asarray(kwargs.get('zones'), dtype=float)
+
+    elif kwargs.get('ftp', None) is not None:
+        abs_zones = np.multiply.outer(kwargs.get('ftp'), POWER_ZONES_THRESHOLD)
+
+    elif kwargs.get('lthr', None) is not None:
+        abs_zones = np.multiply.outer(kwargs.get('lthr'), HEART_RATE_ZONES)
+
+    else:
+        raise ValueError
+
+    n_edges = abs_zones.shape[-1]
+    if abs_zones.ndim == 1:
+        idx = core.compute_zones(y, abs_zones)
+    else:
+        # Per activity edges, count the edges below every sample as searchsorted does
+        abs_zones = np.broadcast_to(abs_zones, (rows, n_edges))
+        idx = np.zeros(y.shape, dtype=np.intp)
+        for edge in abs_zones.T:
+            idx += y > edge[:, np.newaxis]
+        idx[idx == n_edges] = 0
+
+    # Padding goes to zone 0, which is dropped together with the out of zones samples
+    _fill_padding(idx, lengths, 0)
+    idx += np.arange(rows)[:, np.newaxis] * n_edges
+
+    rv = np.bincount(idx.ravel(), minlength=rows * n_edges)
+    rv = rv.reshape(rows, n_edges)[:, 1:]
+
+    return rv
+
+
+def relative_intensity(norm_power, threshold_power):
+    """Relative intensity of every activity
+
+    Parameters
+    ----------
+    norm_power : array-like
+        NP or xPower
+    threshold_power : array-like
+        FTP or CP
+
+    Returns
+    -------
+    ndarray of float
+        IF or RI
+    """
+
+    rv = np.asarray(norm_power, dtype=float) / np.asarray(threshold_power, dtype=float)
+
+    return rv
+
+
+def stress_score(norm_power, threshold_power, duration):
+    """Stress Score of every activity
+
+    Parameters
+    ----------
+    norm_power : array-like
+        NP or xPower
+    threshold_power : array-like
+        FTP or CP
+    duration : array-like of int
+        Duration in seconds, e.g. np.diff(offsets)
+
+    Returns
+    -------
+    ndarray of float
+        TSS or BikeScore
+    """
+
+    duration = np.asarray(duration, dtype=float)
+    rv = (duration/3600) * relative_intensity(norm_power, threshold_power)**2 * 100
+
+    return rv
+
+
+def _as_padded(arg, offsets=None, lengths=None, mask=None, value=0.0):
+    """Convert padded or ragged input into a masked 2-D float array and row lengths"""
+
+    dtype = core.float_dtype(arg)
+
+    if offsets is not None:
+        offsets = np.asarray(offsets, dtype=np.intp)
+        values = core.mask_fill(arg, mask=mask, value=value, dtype=dtype)
+
+        lengths = np.diff(offsets)
+        width = lengths.max(initial=0)
+        valid = np.arange(width) < lengths[:, np.newaxis]
+
+        y = np.zeros((len(lengths), width), dtype=dtype)
+        y[valid] = values[offsets[0]:offsets[-1]]
+
+        return y, lengths
+
+    arg = np.asarray(arg)
+    if arg.ndim != 2:
+        raise ValueError("Padded input must be a 2-D array, use offsets for ragged input")
+
+    y = core.mask_fill(arg, mask=mask, value=value, dtype=dtype)
+
+    if lengths is None:
+        lengths = np.full(arg.shape[0], arg.shape[1])
+
+    return y, np.asarray(lengths, dtype=np.intp)
+
+
+def _fill_padding(arg, lengths, value):
+    """Set samples beyond the valid length of every row to value, in place"""
+
+    if (lengths < arg.shape[-1]).any():
+        arg[np.arange(arg.shape[-1]) >= lengths[:, np.newaxis]] = value
+
+    return arg
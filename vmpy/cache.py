@@ -0,0 +1,322 @@
+"""On-disk cache of Strava API responses
+
+Responses are stored as one body file and one metadata file per key in a
+cache directory. The total size is bounded, least recently used entries are
+evicted first. Entries older than *max_age* are revalidated with a
+conditional request (If-None-Match / If-Modified-Since), so an unchanged
+payload is not downloaded again.
+
+>>> cache = ResponseCache('~/.vmpy/cache', max_bytes=2 * 2**30)
+>>> streams = strava.retrieve_streams(activity_id, access_token, cache=cache)
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from vmpy import profiling
+from vmpy.utils import write_atomic
+
+logger = logging.getLogger(__name__)
+
+
+CacheEntry = collections.namedtuple('CacheEntry', ['body', 'etag', 'last_modified', 'stored'])
+
+
+def activity_key(activity_id):
+    """Cache key of an activity
+
+    Parameters
+    ----------
+    activity_id : int
+
+    Returns
+    -------
+    str
+    """
+
+    return 'activity_{}'.format(activity_id)
+
+
+def streams_key(activity_id, types):
+    """Cache key of activity streams, independent of the order of types
+
+    Parameters
+    ----------
+    activity_id : int
+    types : str
+        Comma separated stream types
+
+    Returns
+    -------
+    str
+    """
+
+    types = ','.join(sorted(t.strip() for t in types.split(',')))
+    digest = hashlib.sha1(types.encode()).hexdigest()[:12]
+
+    return 'streams_{}_{}'.format(activity_id, digest)
+
+
+class ResponseCache(object):
+    """Size bounded LRU cache of response bodies on disk
+
+    Parameters
+    ----------
+    directory : str
+        Cache directory, created if missing
+    max_bytes : int, optional
+        Upper bound of the total size of the cached bodies, default=1 GiB
+    max_age : number, optional
+        Age in sec after which an entry is revalidated with the server,
+        default=None means entries never go stale
+
+    Attributes
+    ----------
+    hits, misses, revalidations, stale : int
+        Counters of requests served from disk, fetched from the server,
+        confirmed unchanged by the server and served from disk because the
+        revalidation failed
+    """
+
+    def __init__(self, directory, max_bytes=2**30, max_age=None):
+
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self.hits = self.misses = self.revalidations = self.stale = 0
+
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(_size(p) for p, _ in self._entries())
+
+    def get(self, key):
+        """Cached entry of the key, None if not cached
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        CacheEntry or None
+        """
+
+        body_path, meta_path = self._paths(key)
+
+        # Under the lock, so a concurrent put can not pair new validators with an old body
+        try:
+            with self._lock:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                with open(body_path, 'rb') as f:
+                    body = f.read()
+        except (IOError, OSError, ValueError):
+            return None
+
+        return CacheEntry(body, meta.get('etag'), meta.get('last_modified'), meta.get('stored', 0))
+
+    def put(self, key, body, headers=None):
+        """Store the response body with its validators
+
+        Parameters
+        ----------
+        key : str
+        body : bytes
+        headers : dict-like, optional
+            Response headers, ETag and Last-Modified are kept for revalidation
+        """
+
+        headers = headers or {}
+        meta = {'etag': headers.get('ETag', None),
+                'last_modified': headers.get('Last-Modified', None),
+                'stored': time.time()}
+
+        body_path, meta_path = self._paths(key)
+
+        with self._lock:
+            previous = _size(body_path)
+
+            write_atomic(body_path, body)
+            write_atomic(meta_path, json.dumps(meta).encode())
+
+            self._size += len(body) - previous
+            self._evict()
+
+    def touch(self, key, revalidated=False):
+        """Mark the entry as recently used
+
+        Parameters
+        ----------
+        key : str
+        revalidated : bool, optional
+            The server confirmed the entry is unchanged, it becomes fresh again
+        """
+
+        body_path, meta_path = self._paths(key)
+
+        try:
+            os.utime(body_path, None)
+            if revalidated:
+                with self._lock:
+                    with open(meta_path) as f:
+                        meta = json.load(f)
+                    meta['stored'] = time.time()
+                    write_atomic(meta_path, json.dumps(meta).encode())
+        except (IOError, OSError, ValueError):
+            pass
+
+    def count(self, result):
+        """Count a lookup under the lock, result is one of hits, misses, revalidations or stale"""
+
+        with self._lock:
+            setattr(self, result, getattr(self, result) + 1)
+
+        profiling.record_cache(result)
+
+    def is_fresh(self, entry):
+        """True if the entry can be served without asking the server
+
+        Parameters
+        ----------
+        entry : CacheEntry
+
+        Returns
+        -------
+        bool
+        """
+
+        return self.max_age is None or time.time() - entry.stored < self.max_age
+
+    def clear(self):
+        """Remove all entries"""
+
+        with self._lock:
+            for body_path, meta_path in self._entries():
+                _remove(body_path)
+                _remove(meta_path)
+            self._size = 0
+
+    def __len__(self):
+
+        return len(self._entries())
+
+    def _evict(self):
+        """Remove least recently used entries until the size bound is met"""
+
+        if self._size <= self.max_bytes:
+            return
+
+        # Entries evicted meanwhile by another process are skipped
+        entries = []
+        for body_path, meta_path in self._entries():
+            try:
+                stat = os.stat(body_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, body_path, meta_path))
+        entries.sort(key=lambda e: e[0])
+
+        for _, size, body_path, meta_path in entries:
+            if self._size <= self.max_bytes:
+                break
+
+            self._size -= size
+            _remove(body_path)
+            _remove(meta_path)
+            logger.debug('Evicted {} from the cache'.format(body_path))
+
+    def _entries(self):
+
+        rv = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.body'):
+                body_path = os.path.join(self.directory, name)
+                rv.append((body_path, body_path[:-len('.body')] + '.meta'))
+
+        return rv
+
+    def _paths(self, key):
+
+        path = os.path.join(self.directory, key)
+
+        return path + '.body', path + '.meta'
+
+
+def fetch(cache, key, request):
+    """Serve a request through the cache
+
+    Parameters
+    ----------
+    cache : ResponseCache or None
+        None bypasses the cache
+    key : str
+    request : callable
+        Called with the conditional request headers (dict), returns a
+        requests.Response or None on connection errors
+
+    Returns
+    -------
+    (bytes, str)
+        Response body or None, and the failure reason
+    """
+
+    entry = cache.get(key) if cache is not None else None
+
+    if entry is not None and cache.is_fresh(entry):
+        cache.count('hits')
+        cache.touch(key)
+        return entry.body, None
+
+    headers = {}
+    if entry is not None:
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+
+    r = request(headers)
+
+    # A stale body beats no body when the server can not be reached or fails
+    if entry is not None and (r is None or r.status_code == 429 or r.status_code >= 500):
+        cache.count('stale')
+        cache.touch(key)
+        return entry.body, None
+
+    if r is None:
+        return None, 'Connection Error'
+
+    if r.status_code == 304 and entry is not None:
+        cache.count('revalidations')
+        cache.touch(key, revalidated=True)
+        return entry.body, None
+
+    if not r.ok:
+        return None, r.reason
+
+    if cache is not None:
+        cache.count('misses')
+        cache.put(key, r.content, r.headers)
+
+    return r.content, None
+
+
+def _size(path):
+    """Size of the file, 0 if it is gone"""
+
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _remove(path):
+
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,662 @@
+"""Pure NumPy kernels behind the streams and metrics functions
+
+Functions in this module accept and return ndarrays only. They never wrap the
+input into pandas objects and can write the result into a caller provided
+*out* buffer, which may be the input array itself for in-place operation.
+Rolling operations work along the last axis, so 2-D arrays are processed
+row by row.
+"""
+
+from bisect import bisect_left, insort
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from vmpy import kernels
+
+
+# Largest accumulated decay of a block of _decaying_sum, exp(230) is far from overflow
+_MAX_DECAY = 230.0
+
+# Rolling medians of windows up to this size sort all windows at once, larger
+# windows are cheaper to keep sorted sample by sample
+_SORT_WINDOW = 128
+
+# Window samples sorted at once, bounds the memory of the sorted windows to 2 MB
+_SORT_BLOCK = 1 << 18
+
+
+def mask_fill(arg, mask=None, value=0.0, out=None, dtype=None):
+    """Replace masked values
+
+    Parameters
+    ----------
+    arg : ndarray
+    mask : ndarray of bool, optional
+        Default value is None, which means no masking will be applied
+    value : number, optional
+        Value to use for replacement, default=0.0
+    out : ndarray, optional
+        Output buffer, pass arg itself for in-place operation
+    dtype : dtype, optional
+        Data type of the output if out is not provided, default=None keeps arg dtype,
+        integer streams are promoted to float only if value is not an integer
+
+    Returns
+    -------
+    out : ndarray
+    """
+
+    if out is None:
+        out = np.array(arg, dtype=dtype)
+        # Integer streams masked with e.g. NaN become the narrowest float holding them
+        if dtype is None and mask is not None and out.dtype.kind in 'biu' and not float(value).is_integer():
+            out = out.astype(float_dtype(out))
+    elif out is not arg:
+        np.copyto(out, arg, casting='unsafe')
+
+    if mask is not None:
+        out[~np.asarray(mask, dtype=bool)] = value
+
+    return out
+
+
+def float_dtype(arg):
+    """Narrowest float dtype holding every value of the stream exactly
+
+    Streams of bool, 8 and 16 bit integers and float32 map to float32, anything
+    else, including lists, to float64. Streams kept in float32 halve the memory,
+    sums over them are accumulated in float64.
+
+    Parameters
+    ----------
+    arg : array-like
+
+    Returns
+    -------
+    dtype
+    """
+
+    dtype = getattr(arg, 'dtype', None)
+    if not isinstance(dtype, np.dtype) or dtype.kind not in 'biuf':
+        return np.dtype(np.float64)
+
+    return np.promote_types(dtype, np.float32)
+
+
+def rolling_mean(arg, window=10, type='uniform', out=None):
+    """Compute trailing rolling mean along the last axis
+
+    Partial windows at the start of the stream are averaged over the available
+    samples and NaN samples are skipped, same as pandas rolling(window, min_periods=1)
+    and ewm(span=window, min_periods=1)
+
+    Parameters
+    ----------
+    arg : ndarray
+    window : int
+        Size of the moving window in samples, default=10
+    type : {"uniform", "ewma"}, optional
+        Type of averaging, default="uniform"
+    out : ndarray of float, optional
+        Output buffer, may be arg itself
+
+    Returns
+    -------
+    out : ndarray of float, float32 for narrow streams, see float_dtype
+    """
+
+    y = np.asarray(arg)
+    if y.dtype.kind != 'f':
+        y = y.astype(float_dtype(y))
+    if out is None:
+        out = np.empty_like(y)
+
+    if type == 'ewma':
+        return _ewma(y, window, out)
+
+    total, count = running_sums(y)
+
+    return uniform_mean(total, count, window, out=out)
+
+
+def running_sums(arg):
+    """Cumulative sums along the last axis behind the uniform rolling mean
+
+    Parameters
+    ----------
+    arg : ndarray
+
+    Returns
+    -------
+    (ndarray of float64, ndarray of float64 or None)
+        Cumulative sum with NaN samples counted as 0, and the cumulative count
+        of valid samples, None if there are no NaN samples. Sums are accumulated
+        in float64 whatever the dtype of the stream
+    """
+
+    y = np.asarray(arg)
+
+    valid = ~np.isnan(y)
+    if valid.all():
+        return np.cumsum(y, axis=-1, dtype=np.float64), None
+
+    return (np.cumsum(np.where(valid, y, 0), axis=-1, dtype=np.float64),
+            np.cumsum(valid, axis=-1, dtype=np.float64))
+
+
+def uniform_mean(total, count, window, out=None):
+    """Trailing uniform rolling mean from the running sums, which are left unchanged
+
+    Parameters
+    ----------
+    total, count : ndarray of float
+        Running sums, see running_sums
+    window : int
+    out : ndarray of float, optional
+        Output buffer
+
+    Returns
+    -------
+    out : ndarray of float
+    """
+
+    if out is None:
+        out = np.empty_like(total)
+
+    n = total.shape[-1]
+    w = min(window, n)
+
+    if count is None:
+        np.divide(total[..., :w], np.arange(1, w + 1), out=out[..., :w])
+        np.subtract(total[..., w:], total[..., :n - w], out=out[..., w:])
+        out[..., w:] /= window
+    else:
+        samples = count.copy()
+        samples[..., w:] -= count[..., :n - w]
+        np.subtract(total[..., w:], total[..., :n - w], out=out[..., w:])
+        out[..., :w] = total[..., :w]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            np.divide(out, samples, out=out)
+        out[samples == 0] = np.nan
+
+    return out
+
+
+def max_mean_power(energy, durations):
+    """Maximal mean power for each duration from the accumulated energy
+
+    The best t-second effort is the largest energy difference t samples apart.
+    Each duration is one vectorized pass over a preallocated scratch buffer
+
+    Parameters
+    ----------
+    energy : ndarray
+        Accumulated energy, NaN for missing samples
+    durations : array-like of int
+        Durations in samples, durations outside of 1..len(energy) - 1 evaluate to NaN
+
+    Returns
+    -------
+    ndarray of float
+    """
+
+    n = len(energy)
+    durations = np.asarray(durations, dtype=int)
+    rv = np.full(len(durations), np.nan)
+
+    # NaN-aware reduction is only needed if some samples are missing
+    reduce_max = np.fmax.reduce if np.isnan(energy).any() else np.max
+
+    buffer = np.empty(max(n - 1, 0))
+    for i, t in enumerate(durations):
+        if 1 <= t < n:
+            diff = np.subtract(energy[t:], energy[:n - t], out=buffer[:n - t])
+            rv[i] = reduce_max(diff) / t
+
+    return rv
+
+
+def quartic_mean(arg, out=None):
+    """4th root of the mean 4th power, e.g. normalized power of the rolling mean
+
+    The 4th powers are summed exactly rounded, so streaming.NormalizedPower
+    can reproduce the value
+
+    Parameters
+    ----------
+    arg : ndarray
+    out : ndarray of float, optional
+        Buffer of the 4th powers, may be arg itself
+
+    Returns
+    -------
+    float
+        NaN for an empty array
+    """
+
+    if not len(arg):
+        return np.nan
+
+    return (math.fsum(np.power(arg, 4, out=out)) / len(arg)) ** (1/4)
+
+
+def compute_zones(arg, bins, out=None):
+    """Convert stream into the zone index stream
+
+    Zone *i* covers the right closed interval (bins[i-1], bins[i]], same as pd.cut.
+    Samples outside of the bins and NaN samples are assigned to zone 0
+
+    Parameters
+    ----------
+    arg : ndarray
+    bins : array-like
+        Monotonically increasing zone edges
+    out : ndarray of int, optional
+        Output buffer
+
+    Returns
+    -------
+    out : ndarray of int
+    """
+
+    bins = np.asarray(bins)
+    idx = np.searchsorted(bins, arg, side='left')
+    idx[idx == len(bins)] = 0
+
+    if out is None:
+        return idx
+
+    out[...] = idx
+
+    return out
+
+
+def wpk(power, weight, out=None):
+    """Watts per kilo
+
+    Parameters
+    ----------
+    power : ndarray
+    weight : number
+    out : ndarray of float, optional
+        Output buffer, may be power itself if it is a float array
+
+    Returns
+    -------
+    out : ndarray of float, float32 for narrow streams, see float_dtype
+    """
+
+    if out is None:
+        return np.true_divide(power, weight, dtype=float_dtype(power))
+
+    return np.true_divide(power, weight, out=out)
+
+
+def median_filter(arg, window=31, threshold=1, value=None, out=None):
+    """Outlier replacement using median filter
+
+    Samples deviating from the trailing rolling median by more than
+    threshold x 1.4826 x MAD are replaced by the rolling median or by value
+
+    Parameters
+    ----------
+    arg : ndarray
+    window : int, optional
+        Size of window (including the sample), default=31
+    threshold : number, optional
+        default=1
+    value : float, optional
+        Value to be used for replacement, default=None means the rolling median
+    out : ndarray of float, optional
+        Output buffer, may be arg itself
+
+    Returns
+    -------
+    out : ndarray of float, float32 for narrow streams, see float_dtype
+    """
+
+    y = np.asarray(arg, dtype=float_dtype(arg))
+
+    median, median_abs_deviation = rolling_median_mad(y, window)
+    difference = np.abs(y - median)
+
+    # The factor 1.4826 makes the MAD scale estimate
+    # an unbiased estimate of the standard deviation for Gaussian data.
+    outliers = difference > 1.4826 * threshold * median_abs_deviation
+
+    out = mask_fill(y, None, out=out)
+    if value is None:
+        out[outliers] = median[outliers]
+    else:
+        out[outliers] = value
+
+    return out
+
+
+def rolling_median(arg, window):
+    """Trailing rolling median of a 1-D array with partial windows at the start
+
+    NaN samples are skipped, same as pandas rolling(window, min_periods=1).median().
+    Windows of up to 128 samples are sorted all at once in blocks, larger windows
+    are kept sorted, so every sample costs a binary search instead of a sort
+
+    Parameters
+    ----------
+    arg : ndarray
+    window : int
+
+    Returns
+    -------
+    ndarray of float
+    """
+
+    if kernels.rolling_median is not None:
+        rv = np.empty(len(arg))
+        kernels.rolling_median(np.ascontiguousarray(arg, dtype=float), window, rv)
+        return rv
+
+    if window <= _SORT_WINDOW:
+        return _sorted_windows_median(np.asarray(arg, dtype=float), window)
+
+    values = np.asarray(arg, dtype=float).tolist()
+    medians = [np.nan] * len(values)
+
+    ordered = []
+    for i, x in enumerate(values):
+        if i >= window:
+            _remove_sorted(ordered, values[i - window])
+        if x == x:
+            insort(ordered, x)
+        medians[i] = _sorted_median(ordered)
+
+    return np.array(medians)
+
+
+def rolling_median_mad(arg, window):
+    """Trailing rolling median and rolling median absolute deviation in a single pass
+
+    The deviation of a sample is taken from the rolling median at the sample,
+    same as rolling_median(abs(arg - rolling_median(arg, window)), window)
+
+    Parameters
+    ----------
+    arg : ndarray
+    window : int
+
+    Returns
+    -------
+    (ndarray of float, ndarray of float)
+        Rolling median and rolling median absolute deviation
+    """
+
+    if kernels.rolling_median_mad is not None:
+        rv = np.empty(len(arg)), np.empty(len(arg))
+        kernels.rolling_median_mad(np.ascontiguousarray(arg, dtype=float), window, *rv)
+        return rv
+
+    if window <= _SORT_WINDOW:
+        values = np.asarray(arg, dtype=float)
+        medians = _sorted_windows_median(values, window)
+        return medians, _sorted_windows_median(np.abs(values - medians), window)
+
+    values = np.asarray(arg, dtype=float).tolist()
+    n = len(values)
+    medians = [np.nan] * n
+    deviations = [np.nan] * n
+    median_abs_deviations = [np.nan] * n
+
+    ordered = []
+    ordered_deviations = []
+    for i, x in enumerate(values):
+        if i >= window:
+            _remove_sorted(ordered, values[i - window])
+            _remove_sorted(ordered_deviations, deviations[i - window])
+        if x == x:
+            insort(ordered, x)
+
+        median = medians[i] = _sorted_median(ordered)
+
+        deviation = deviations[i] = abs(x - median)
+        if deviation == deviation:
+            insort(ordered_deviations, deviation)
+
+        median_abs_deviations[i] = _sorted_median(ordered_deviations)
+
+    return np.array(medians), np.array(median_abs_deviations)
+
+
+def w_prime_balance(arg, cp, w_prime, tau=None, initial=None, out=None):
+    """W' balance of a 1-D power stream in linear time
+
+    The expended W' E = w_prime - balance follows the recurrence
+    E[t] = a[t] * E[t-1] + max(P[t] - CP, 0). With tau=None it is the
+    differential model (Skiba 2015), a[t] = exp(-max(CP - P[t], 0) / w_prime).
+    Otherwise it is the integral model (Skiba 2012) with a[t] = exp(-1 / tau).
+    NaN samples leave the balance unchanged in the differential model
+
+    Parameters
+    ----------
+    arg : ndarray
+        Power stream sampled at 1 sec
+    cp : number
+        Critical Power
+    w_prime : number
+        W' in J
+    tau : number, optional
+        Recovery time constant of the integral model in sec, see w_prime_tau
+    initial : number, optional
+        Balance before the first sample, default=None means w_prime
+    out : ndarray of float, optional
+        Output buffer, may be arg itself
+
+    Returns
+    -------
+    out : ndarray of float
+    """
+
+    y = np.asarray(arg, dtype=float)
+    if out is None:
+        out = np.empty_like(y)
+
+    expended = 0.0 if initial is None else w_prime - initial
+
+    # NaN compares False, so missing samples neither expend nor recover
+    above = np.where(y > cp, y - cp, 0.0)
+
+    if tau is None:
+        decay = np.where(y < cp, (cp - y) / w_prime, 0.0)
+        _decaying_sum(above, decay, expended, out=out)
+    else:
+        exponential_filter(above, np.exp(-1.0 / tau), out=out, initial=expended)
+
+    np.subtract(w_prime, out, out=out)
+
+    return out
+
+
+def w_prime_tau(arg, cp):
+    """Recovery time constant of the integral W' balance model (Skiba 2012)
+
+    tau = 546 exp(-0.01 D_CP) + 316, D_CP is the mean difference between CP
+    and the power of the samples below CP
+
+    Parameters
+    ----------
+    arg : ndarray
+    cp : number
+
+    Returns
+    -------
+    float
+    """
+
+    y = np.asarray(arg, dtype=float)
+    below = y[y < cp]
+    d_cp = cp - below.mean() if len(below) else 0.0
+
+    return 546.0 * np.exp(-0.01 * d_cp) + 316.0
+
+
+def _decaying_sum(arg, decay, initial, out):
+    """Linear recurrence s[t] = exp(-decay[t]) * s[t-1] + arg[t] with time varying decay
+
+    Blocks end before the accumulated decay exceeds _MAX_DECAY, so the
+    scaling factors exp(+-decay) of a block stay far from overflow.
+    """
+
+    # A single step beyond _MAX_DECAY forgets the state anyway
+    total = np.cumsum(np.minimum(decay, _MAX_DECAY))
+
+    n = len(arg)
+    start, base, state = 0, 0.0, initial
+    while start < n:
+        stop = max(int(np.searchsorted(total, base + _MAX_DECAY, side='right')), start + 1)
+
+        d = total[start:stop] - base
+        s = np.cumsum(arg[start:stop] * np.exp(d))
+        s += state
+        s *= np.exp(-d)
+        out[start:stop] = s
+
+        start, base, state = stop, total[stop - 1], s[-1]
+
+    return out
+
+
+def _sorted_windows_median(values, window):
+    """Trailing rolling median skipping NaN, sorting a block of windows at a time"""
+
+    n = len(values)
+    if not n:
+        return np.empty(0)
+
+    windows = sliding_window_view(np.concatenate((np.full(window - 1, np.nan), values)), window)
+    rv = np.empty(n)
+
+    rows = max(_SORT_BLOCK // window, 1)
+    for start in range(0, n, rows):
+        # NaN is sorted last, so the valid samples of every window come first
+        ordered = np.sort(windows[start:start + rows], axis=-1)
+        count = window - np.isnan(ordered).sum(axis=-1)
+        lower = np.take_along_axis(ordered, np.maximum(count - 1, 0)[:, np.newaxis] // 2, axis=-1)[:, 0]
+        upper = np.take_along_axis(ordered, (count // 2)[:, np.newaxis], axis=-1)[:, 0]
+        median = np.where(count % 2, lower, (lower + upper) / 2)
+        median[count == 0] = np.nan
+        rv[start:start + rows] = median
+
+    return rv
+
+
+def _sorted_median(ordered):
+    """Median of a sorted list, NaN if empty"""
+
+    n = len(ordered)
+    if not n:
+        return np.nan
+
+    if n % 2:
+        return ordered[n // 2]
+
+    return (ordered[n // 2 - 1] + ordered[n // 2]) / 2
+
+
+def _remove_sorted(ordered, x):
+    """Remove x from a sorted list, NaN was never inserted"""
+
+    if x == x:
+        del ordered[bisect_left(ordered, x)]
+
+
+def _ewma(y, window, out):
+    """Exponentially weighted mean with pandas ewm(span=window, adjust=True) weights"""
+
+    decay = 1.0 - 2.0 / (window + 1)
+
+    # Weighted sums are accumulated in float64 also for float32 streams
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~np.isnan(y)
+
+    # Without decay a NaN sample has no weight at all, the last mean carries forward
+    if decay == 0.0 and not valid.all():
+        last = np.where(valid, np.arange(y.shape[-1]), 0)
+        np.maximum.accumulate(last, axis=-1, out=last)
+        out[...] = np.take_along_axis(y, last, axis=-1)
+        return out
+
+    if valid.all():
+        weights = np.ones_like(y)
+    else:
+        weights = valid.astype(float)
+        y = np.where(valid, y, 0.0)
+
+    total = exponential_filter(y, decay)
+    weights = exponential_filter(weights, decay, out=weights)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        np.divide(total, weights, out=out)
+
+    return out
+
+
+def exponential_filter(arg, decay, out=None, initial=None):
+    """Linear recurrence s[t] = decay * s[t-1] + arg[t] along the last axis
+
+    The recurrence is evaluated block-wise with cumulative sums scaled by powers of
+    decay, the block length keeps the scaling factors far from overflow
+
+    Parameters
+    ----------
+    arg : ndarray
+    decay : float
+    out : ndarray of float, optional
+        Output buffer, may be arg itself
+    initial : number or ndarray, optional
+        State before the first sample s[-1] of every row, default=None means 0
+
+    Returns
+    -------
+    out : ndarray of float
+    """
+
+    n = arg.shape[-1]
+    if out is None:
+        out = np.empty_like(arg, dtype=float)
+
+    if decay == 0.0 or n == 0:
+        out[...] = arg
+        return out
+
+    block = min(n, _exponential_block(decay))
+
+    # Powers by repeated multiplication, which streaming.RollingMean reproduces exactly
+    powers = np.empty(block)
+    powers[0] = 1.0
+    np.cumprod(np.full(block - 1, decay), out=powers[1:])
+    inverse = 1.0 / powers
+
+    if initial is None:
+        state = np.zeros(arg.shape[:-1])
+    else:
+        state = np.broadcast_to(np.asarray(initial, dtype=float), arg.shape[:-1])
+
+    if kernels.exponential_filter is not None and out.flags.c_contiguous:
+        kernels.exponential_filter(np.ascontiguousarray(arg, dtype=float).reshape(-1, n), decay, powers, inverse,
+                                   np.ascontiguousarray(state).reshape(-1), out.reshape(-1, n))
+        return out
+
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        s = np.cumsum(arg[..., start:stop] * inverse[:stop - start], axis=-1)
+        s += (decay * state)[..., np.newaxis]
+        s *= powers[:stop - start]
+        out[..., start:stop] = s
+        state = s[..., -1]
+
+    return out
+
+
+def _exponential_block(decay):
+    """Block length of exponential_filter, decay ** -block stays far from overflow"""
+
+    return int(max(1, 230.0 / -np.log(decay)))
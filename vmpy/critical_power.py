@@ -0,0 +1,275 @@
+"""Critical Power models fitted to Power-Duration Curves
+
+Every model is linear in its power parameters once the time constant is fixed:
+
+    2-parameter:  P(t) = CP + W' / t
+    3-parameter:  P(t) = CP + W' / (t + k),           k = W' / (Pmax - CP)   (Morton)
+    exponential:  P(t) = CP + (Pmax - CP) exp(-t / tau),  W' = (Pmax - CP) tau
+
+The 2-parameter model is solved in closed form. The 3-parameter and the
+exponential model solve the closed form least squares for every time constant
+of a log-spaced grid and keep the best one. A roster of curves, one per row and
+NaN where the curve is not defined, is fitted as a single array operation.
+
+>>> fit = fit_3p(pdc.power)
+>>> fit.cp, fit.w_prime, fit.p_max
+"""
+
+import collections
+
+import numpy as np
+
+
+# Fitted parameters, the same shape as the rows of the curves
+CriticalPowerFit = collections.namedtuple(
+    'CriticalPowerFit', ['model', 'cp', 'w_prime', 'p_max', 'time_constant', 'residuals', 'rmse'])
+
+# Log-spaced grid of time constants in sec for the 3-parameter and exponential models
+TIME_CONSTANTS = np.logspace(-1, 3, 257)
+
+# Residuals computed at once by _least_squares, bounds their memory to 32 MB
+_RESIDUALS_BLOCK = 1 << 22
+
+
+def fit_2p(arg, durations=None, min_duration=120, max_duration=1200):
+    """2-parameter Critical Power model P(t) = CP + W' / t
+
+    Parameters
+    ----------
+    arg : array-like
+        Power-Duration Curve, 1-D or one curve per row, NaN where not defined
+    durations : array-like of int, optional
+        Duration of every point, default=None means 1, 2, ... as returned by
+        metrics.power_duration_curve
+    min_duration, max_duration : number, optional
+        Range of durations to fit in sec, default=120 and 1200
+
+    Returns
+    -------
+    CriticalPowerFit
+        p_max and time_constant are NaN
+    """
+
+    y, t, valid = _prepare(arg, durations, min_duration, max_duration)
+
+    cp, w_prime, _ = _least_squares(1.0 / t, y, valid)
+    cp, w_prime = cp[..., 0], w_prime[..., 0]
+
+    nan = np.full_like(cp, np.nan)
+
+    return _fit('2p', arg, y, t, valid, cp, w_prime, nan, nan)
+
+
+def fit_3p(arg, durations=None, min_duration=1, max_duration=1800, time_constants=TIME_CONSTANTS):
+    """3-parameter Critical Power model P(t) = CP + W' / (t + k)
+
+    Parameters
+    ----------
+    arg : array-like
+        Power-Duration Curve, 1-D or one curve per row, NaN where not defined
+    durations : array-like of int, optional
+        Duration of every point, default=None means 1, 2, ...
+    min_duration, max_duration : number, optional
+        Range of durations to fit in sec, default=1 and 1800
+    time_constants : array-like, optional
+        Grid of k in sec to search, default=TIME_CONSTANTS
+
+    Returns
+    -------
+    CriticalPowerFit
+        time_constant is k, p_max = CP + W' / k
+    """
+
+    y, t, valid = _prepare(arg, durations, min_duration, max_duration)
+    k = np.asarray(time_constants, dtype=float)
+
+    cp, w_prime, k = _grid_search(lambda k: 1.0 / (t + k), k, y, valid)
+
+    return _fit('3p', arg, y, t, valid, cp, w_prime, cp + w_prime / k, k)
+
+
+def fit_exponential(arg, durations=None, min_duration=1, max_duration=1800, time_constants=TIME_CONSTANTS):
+    """Exponential model P(t) = CP + (Pmax - CP) exp(-t / tau)
+
+    Parameters
+    ----------
+    arg : array-like
+        Power-Duration Curve, 1-D or one curve per row, NaN where not defined
+    durations : array-like of int, optional
+        Duration of every point, default=None means 1, 2, ...
+    min_duration, max_duration : number, optional
+        Range of durations to fit in sec, default=1 and 1800
+    time_constants : array-like, optional
+        Grid of tau in sec to search, default=TIME_CONSTANTS
+
+    Returns
+    -------
+    CriticalPowerFit
+        time_constant is tau, W' = (Pmax - CP) tau is the work above CP
+    """
+
+    y, t, valid = _prepare(arg, durations, min_duration, max_duration)
+    tau = np.asarray(time_constants, dtype=float)
+
+    cp, amplitude, tau = _grid_search(lambda tau: np.exp(-t / tau), tau, y, valid)
+
+    return _fit('exponential', arg, y, t, valid, cp, amplitude * tau, cp + amplitude, tau)
+
+
+def predict(fit, durations):
+    """Power of the fitted model at the durations
+
+    Parameters
+    ----------
+    fit : CriticalPowerFit
+    durations : array-like
+
+    Returns
+    -------
+    ndarray
+        Shape of the fit parameters followed by the durations
+    """
+
+    t = np.asarray(durations, dtype=float)
+    cp, w_prime, p_max, time_constant = (np.asarray(p, dtype=float)[..., np.newaxis]
+                                         for p in (fit.cp, fit.w_prime, fit.p_max, fit.time_constant))
+
+    if fit.model == '2p':
+        return cp + w_prime / t
+
+    if fit.model == '3p':
+        return cp + w_prime / (t + time_constant)
+
+    if fit.model == 'exponential':
+        return cp + (p_max - cp) * np.exp(-t / time_constant)
+
+    raise ValueError("Unknown model {}".format(fit.model))
+
+
+def _prepare(arg, durations, min_duration, max_duration):
+    """Curves as 2-D float array, durations and the mask of points to fit"""
+
+    y = np.atleast_2d(np.asarray(arg, dtype=float))
+
+    if durations is None:
+        t = np.arange(1, y.shape[-1] + 1, dtype=float)
+    else:
+        t = np.asarray(durations, dtype=float)
+
+    valid = ~np.isnan(y) & (t >= min_duration)
+    if max_duration is not None:
+        valid &= t <= max_duration
+
+    return np.where(valid, y, 0.0), t, valid
+
+
+def _grid_search(regressor, grid, y, valid):
+    """Least squares for every time constant of the grid, refined by parabolic interpolation
+
+    Parameters
+    ----------
+    regressor : callable
+        Regressor of the linear model for an array of time constants (..., 1)
+    grid : ndarray
+        Log-spaced time constants
+    y, valid : ndarray (rows, points)
+
+    Returns
+    -------
+    (ndarray, ndarray, ndarray)
+        Intercept, slope and time constant of every row
+    """
+
+    intercept, slope, sse = _least_squares(regressor(grid[:, np.newaxis]), y, valid)
+
+    best = np.argmin(np.where(np.isnan(sse), np.inf, sse), axis=-1)
+    rows = np.arange(len(best))
+    rv = intercept[rows, best], slope[rows, best], grid[best], sse[rows, best]
+
+    # Vertex of the parabola through the best grid point and its neighbours in log space
+    inner = np.clip(best, 1, len(grid) - 2)
+    log_grid = np.log(grid)
+    e0, e1, e2 = sse[rows, inner - 1], sse[rows, inner], sse[rows, inner + 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shift = 0.5 * (e0 - e2) / (e0 - 2 * e1 + e2)
+    shift = np.where(np.isfinite(shift), np.clip(shift, -1, 1), 0.0)
+    step = log_grid[inner + 1] - log_grid[inner]
+    refined = np.exp(log_grid[inner] + shift * step)
+
+    intercept, slope, sse = (a[:, 0] for a in _least_squares(regressor(refined[:, np.newaxis]), y, valid,
+                                                             shared=False))
+    better = sse < rv[3]
+
+    return tuple(np.where(better, new, old) for new, old in zip((intercept, slope, refined), rv[:3]))
+
+
+def _least_squares(x, y, valid, shared=True):
+    """Line y = a + b x fitted to the valid points of every row, for every regressor
+
+    Parameters
+    ----------
+    x : ndarray (grid, points)
+        Regressors shared by all rows, or one regressor per row (rows, points) if not shared
+    y : ndarray (rows, points)
+    valid : ndarray of bool (rows, points)
+
+    Returns
+    -------
+    (ndarray, ndarray, ndarray)
+        Intercept, slope and the sum of squared errors, shape (rows, grid) or (rows, 1)
+    """
+
+    x = np.atleast_2d(x)
+    w = valid.astype(float)
+
+    n = w.sum(axis=-1)[:, np.newaxis]
+    sum_y = y.sum(axis=-1)[:, np.newaxis]
+    if shared:
+        sum_x = w @ x.T
+        sum_xx = w @ (x * x).T
+        sum_xy = y @ x.T
+    else:
+        sum_x = (w * x).sum(axis=-1)[:, np.newaxis]
+        sum_xx = (w * x * x).sum(axis=-1)[:, np.newaxis]
+        sum_xy = (y * x).sum(axis=-1)[:, np.newaxis]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x * sum_x)
+        intercept = (sum_y - slope * sum_x) / n
+
+    slope[np.broadcast_to(n < 2, slope.shape)] = np.nan
+    intercept[np.isnan(slope)] = np.nan
+
+    # Squared residuals summed explicitly, expanding the square cancels catastrophically
+    # for nearly linear points. Rows are taken in blocks to bound the memory of the residuals
+    sse = np.empty_like(slope)
+    block = max(_RESIDUALS_BLOCK // x.size if shared else _RESIDUALS_BLOCK // x.shape[-1], 1)
+    for start in range(0, len(y), block):
+        rows = slice(start, start + block)
+        regressor = x if shared else x[rows, np.newaxis, :]
+        with np.errstate(invalid='ignore'):
+            residuals = slope[rows, :, np.newaxis] * regressor
+            residuals += intercept[rows, :, np.newaxis]
+            np.subtract(y[rows, np.newaxis, :], residuals, out=residuals)
+            residuals *= w[rows, np.newaxis, :]
+        sse[rows] = np.einsum('rgp,rgp->rg', residuals, residuals)
+
+    return intercept, slope, sse
+
+
+def _fit(model, arg, y, t, valid, cp, w_prime, p_max, time_constant):
+    """Residuals of the fitted points and the fit in the shape of the input"""
+
+    rv = CriticalPowerFit(model, cp, w_prime, p_max, np.asarray(time_constant, dtype=float), None, None)
+
+    residuals = np.where(valid, y - predict(rv, t), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rmse = np.sqrt(np.nansum(residuals ** 2, axis=-1) / valid.sum(axis=-1))
+    rmse[np.isnan(cp)] = np.nan
+
+    rv = rv._replace(residuals=residuals, rmse=rmse)
+
+    if np.ndim(arg) == 1:
+        rv = rv._replace(**{name: getattr(rv, name)[0] for name in rv._fields[1:]})
+
+    return rv
@@ -0,0 +1,313 @@
+"""Operations on the GPS channels latlng, distance and altitude
+
+Every function works on whole arrays, latlng is an (n, 2) array of
+[latitude, longitude] in degrees as returned by Strava. Distances are in
+meters on a spherical earth. Pass dtype=np.float32 to halve the memory of
+the results, sums are accumulated in float64 regardless.
+
+>>> distance = geo.distance(stream['latlng'])
+>>> gain, loss = geo.elevation_change(stream['altitude'])
+>>> track = np.asarray(stream['latlng'])[geo.simplify(stream['latlng'], tolerance=5.0)]
+"""
+
+import collections
+
+import numpy as np
+from vmpy import core
+from vmpy.utils import cast_array_to_original_type
+
+
+# Mean earth radius in m
+EARTH_RADIUS = 6371008.8
+
+# Climb between two samples, gain in m, length in m, grade as a fraction
+Climb = collections.namedtuple('Climb', ['start', 'stop', 'gain', 'length', 'grade'])
+
+
+def haversine(latlng1, latlng2, dtype=None):
+    """Great circle distance between points
+
+    Parameters
+    ----------
+    latlng1, latlng2 : array-like (..., 2)
+        [latitude, longitude] in degrees, broadcast against each other
+    dtype : dtype, optional
+        Data type of the computation, default=None means float64, or float32
+        for float32 input
+
+    Returns
+    -------
+    ndarray
+        Distance in m
+    """
+
+    a = np.asarray(latlng1)
+    b = np.asarray(latlng2)
+    dtype = np.dtype(dtype or np.result_type(core.float_dtype(a), core.float_dtype(b)))
+
+    a = np.radians(a, dtype=dtype)
+    b = np.radians(b, dtype=dtype)
+
+    dlat = b[..., 0] - a[..., 0]
+    dlng = b[..., 1] - a[..., 1]
+    h = np.sin(dlat / 2) ** 2 + np.cos(a[..., 0]) * np.cos(b[..., 0]) * np.sin(dlng / 2) ** 2
+
+    return (2 * EARTH_RADIUS) * np.arcsin(np.sqrt(np.minimum(h, 1)))
+
+
+def distance(latlng, dtype=None):
+    """Cumulative distance along the track, same as the Strava distance stream
+
+    Parameters
+    ----------
+    latlng : array-like (n, 2)
+        [latitude, longitude] in degrees, missing points (NaN) add no distance
+    dtype : dtype, optional
+        Data type of the result, default=None means float64, or float32 for float32 input
+
+    Returns
+    -------
+    array-like, the same type as latlng
+        Distance in m from the first point
+    """
+
+    y = _as_track(latlng)
+    dtype = np.dtype(dtype or core.float_dtype(y))
+
+    steps = haversine(y[:-1], y[1:], dtype=dtype)
+
+    rv = np.zeros(len(y), dtype=dtype)
+    rv[1:] = np.cumsum(np.where(np.isnan(steps), 0, steps), dtype=np.float64)
+    rv = cast_array_to_original_type(rv, type(latlng))
+
+    return rv
+
+
+def elevation_change(altitude, threshold=3.0):
+    """Total ascent and descent with hysteresis
+
+    Altitude changes count only once the altitude has turned by at least
+    threshold from the last highest or lowest point, so GPS and barometric
+    noise smaller than threshold does not add up
+
+    Parameters
+    ----------
+    altitude : array-like
+        Altitude in m, missing samples (NaN) are skipped
+    threshold : number, optional
+        Hysteresis in m, default=3.0
+
+    Returns
+    -------
+    (float, float)
+        Gain and loss in m, both positive
+    """
+
+    y = np.asarray(altitude, dtype=float)
+    pivots = y[_turning_points(y, threshold)]
+    change = np.diff(pivots)
+
+    return float(change[change > 0].sum()), float(-change[change < 0].sum())
+
+
+def climbs(altitude, distance, threshold=10.0, min_gain=30.0, min_grade=0.03):
+    """Climbs of the track
+
+    A climb runs from a low to the next high turning point of the altitude,
+    descents shorter than threshold do not interrupt it
+
+    Parameters
+    ----------
+    altitude : array-like
+        Altitude in m
+    distance : array-like
+        Cumulative distance in m, see distance
+    threshold : number, optional
+        Hysteresis of the turning points in m, default=10.0
+    min_gain : number, optional
+        Smallest gain of a climb in m, default=30.0
+    min_grade : number, optional
+        Smallest average grade of a climb, default=0.03
+
+    Returns
+    -------
+    list of Climb
+        Start and stop sample index, gain, length and average grade of every climb
+    """
+
+    y = np.asarray(altitude, dtype=float)
+    d = np.asarray(distance, dtype=float)
+
+    pivots = _turning_points(y, threshold)
+    start, stop = pivots[:-1], pivots[1:]
+
+    gain = y[stop] - y[start]
+    length = d[stop] - d[start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        grade = gain / length
+
+    found = (gain >= min_gain) & (grade >= min_grade)
+
+    return [Climb(*values) for values in zip(start[found].tolist(), stop[found].tolist(), gain[found].tolist(),
+                                             length[found].tolist(), grade[found].tolist())]
+
+
+def simplify(latlng, tolerance=5.0, dtype=None):
+    """Douglas-Peucker simplification of the track
+
+    All segments of a level of the recursion are split at once, so every level
+    is a single pass over the points. Distances are measured on a local
+    equirectangular projection, accurate for tracks of up to a few hundred km
+
+    Parameters
+    ----------
+    latlng : array-like (n, 2)
+        [latitude, longitude] in degrees without missing points
+    tolerance : number, optional
+        Largest distance in m of a dropped point from the simplified track, default=5.0
+    dtype : dtype, optional
+        Data type of the projected points, default=None means float64, or float32 for float32 input
+
+    Returns
+    -------
+    ndarray of int
+        Sorted indices of the kept points, always including the first and the last
+    """
+
+    xy = _project(_as_track(latlng), dtype)
+    n = len(xy)
+    if n < 3:
+        return np.arange(n)
+
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    points = np.arange(n)
+
+    while True:
+        kept = np.flatnonzero(keep)
+
+        # Segment of every point and the point farthest from its segment
+        segment = np.searchsorted(kept, points, side='right') - 1
+        segment[-1] = len(kept) - 2
+        offset = _segment_distance(xy, xy[kept[segment]], xy[kept[segment + 1]])
+
+        farthest = np.maximum.reduceat(offset, kept[:-1])
+        split = farthest > tolerance
+        if not split.any():
+            return kept
+
+        # Index of the maximum within every segment that is split
+        is_max = (offset == farthest[segment]) & split[segment] & ~keep
+        first = np.unique(segment[is_max], return_index=True)[1]
+        keep[np.flatnonzero(is_max)[first]] = True
+
+
+def _turning_points(y, threshold):
+    """Indices of the first sample, the confirmed turning points and the last extreme
+
+    Between two turning points the running maximum (or minimum) of the local
+    extremes is scanned in chunks of doubling size, so there is one Python
+    iteration per turning point instead of one per local extreme
+    """
+
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) < 2:
+        return valid
+
+    # Only the local extremes can become turning points
+    v = y[valid]
+    steps = np.flatnonzero(np.diff(v))
+    direction = np.sign(np.diff(v)[steps])
+    extremes = steps[np.flatnonzero(direction[1:] != direction[:-1])] + 1
+    candidates = valid[np.concatenate(([0], extremes, [len(v) - 1]))]
+    v = y[candidates]
+
+    # The direction is set once the range of the altitude reaches threshold
+    reached = np.flatnonzero((np.maximum.accumulate(v) - np.minimum.accumulate(v))[1:] >= threshold)
+    if not len(reached):
+        return candidates[:1]
+
+    first = reached[0] + 2
+    low, high = np.argmin(v[:first]), np.argmax(v[:first])
+    rising = high > low
+
+    # Chunks of about twice the last segment, so most segments take a single scan
+    rv = [low if rising else high]
+    extreme, reversal, size = (high if rising else low), first - 1, 64
+    signed = v, -v
+    while reversal is not None:
+        start = reversal + 1
+        extreme, reversal = _next_reversal(signed[not rising], extreme, start, threshold, size)
+        rv.append(extreme)
+        if reversal is not None:
+            size = max(2 * (reversal - start), 64)
+        extreme, rising = reversal, not rising
+
+    return candidates[np.array(rv, dtype=np.intp)]
+
+
+def _next_reversal(v, extreme, start, threshold, size):
+    """Last maximum from extreme on before v falls by threshold, and the index of the fall or None"""
+
+    top = v[extreme]
+
+    while start < len(v):
+        chunk = v[start:start + size]
+        peak = np.maximum.accumulate(chunk)
+        np.maximum(peak, top, out=peak)
+
+        fall = np.flatnonzero((peak - chunk >= threshold) & (chunk < peak))
+        stop = fall[0] if len(fall) else len(chunk)
+
+        # Ties move the extreme forward, the same as x >= v[extreme]
+        if stop:
+            ties = np.flatnonzero(chunk[:stop] == peak[stop - 1])
+            if len(ties):
+                extreme, top = start + ties[-1], peak[stop - 1]
+
+        if len(fall):
+            return extreme, start + stop
+
+        start += size
+        size *= 2
+
+    return extreme, None
+
+
+def _segment_distance(p, a, b):
+    """Distance of the points p from the segments a-b"""
+
+    ab = b - a
+    ap = p - a
+    length = (ab * ab).sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(length > 0, np.clip((ap * ab).sum(axis=-1) / length, 0, 1), 0)
+
+    return np.hypot(*(ap - t[:, np.newaxis] * ab).T)
+
+
+def _project(latlng, dtype=None):
+    """Local equirectangular projection in m around the mean latitude"""
+
+    dtype = np.dtype(dtype or core.float_dtype(latlng))
+    rad = np.radians(latlng, dtype=np.float64)
+    lat0 = np.nanmean(rad[:, 0]) if len(rad) else 0.0
+
+    xy = np.empty(rad.shape, dtype=dtype)
+    xy[:, 0] = EARTH_RADIUS * np.cos(lat0) * rad[:, 1]
+    xy[:, 1] = EARTH_RADIUS * rad[:, 0]
+
+    return xy
+
+
+def _as_track(latlng):
+
+    y = np.asarray(latlng)
+    if y.dtype == object:
+        y = np.array([(np.nan, np.nan) if p is None else p for p in latlng], dtype=float)
+    if y.size == 0:
+        y = y.reshape(0, 2)
+    if y.ndim != 2 or y.shape[1] != 2:
+        raise ValueError("latlng must be an array of [latitude, longitude] pairs")
+
+    return y
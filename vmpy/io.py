@@ -0,0 +1,473 @@
+"""Compact columnar storage of activity streams
+
+Streams are stored with one typed array per channel, e.g. watts as int16 and
+heartrate as uint8, instead of JSON lists of boxed numbers. Loading memory-maps
+the file, so every channel is a zero-copy read-only ndarray view that the
+streams and metrics functions consume directly.
+
+File layout: the magic bytes, the length of a JSON header and the header
+itself, followed by the channel columns, each aligned to 64 bytes.
+
+>>> save_streams('1354978421.vmpy', strava.retrieve_streams(1354978421, access_token))
+>>> streams = load_streams('1354978421.vmpy')
+>>> metrics.normalized_power(streams['watts'])
+
+StreamDecoder parses a Strava streams response incrementally, straight into
+the typed arrays, without building a Python object for every number.
+
+>>> streams = decode_streams(open('streams_1202065_1354978421.json', 'rb'))
+"""
+
+import json
+import mmap
+import re
+import struct
+import warnings
+
+import numpy as np
+
+
+# Narrowest dtype able to hold every Strava channel, see stream2arrays
+CHANNEL_DTYPES = {
+    'time': np.uint32,
+    'latlng': np.float32,
+    'distance': np.float32,
+    'altitude': np.float32,
+    'velocity_smooth': np.float32,
+    'heartrate': np.uint8,
+    'cadence': np.uint8,
+    'watts': np.int16,
+    'temp': np.int8,
+    'moving': np.bool_,
+    'grade_smooth': np.float32,
+}
+
+_MAGIC = b'VMPYSTRM'
+_VERSION = 1
+_HEADER = struct.Struct('<8sI')
+_ALIGN = 64
+
+_CHUNK_SIZE = 1 << 16
+
+# Structural JSON tokens outside of the data arrays, numbers and literals only
+# once they are followed by a delimiter so a chunk boundary does not split them
+_TOKEN = re.compile(rb'\s*(?:([\[\]{}:,])|("(?:[^"\\]|\\.)*")|(-?[0-9][-+0-9.eE]*|true|false|null)(?=[\s,\]}]))')
+_BRACKETS = bytes.maketrans(b'[]', b'  ')
+
+
+def stream2arrays(stream_dict, dtypes=None):
+    """Convert stream dict into typed ndarrays
+
+    Integer channels with missing values (None) or values that do not fit the
+    channel dtype are stored as float32, with NaN for the missing values.
+
+    Parameters
+    ----------
+    stream_dict : dict
+        Streams in dict form, see strava.stream2dict
+    dtypes : dict, optional
+        Channel dtypes overriding CHANNEL_DTYPES, unknown channels are float64
+
+    Returns
+    -------
+    dict
+        Stream name mapped to ndarray, latlng has the shape (n, 2)
+    """
+
+    channel_dtypes = dict(CHANNEL_DTYPES, **(dtypes or {}))
+
+    rv = {}
+    for name, data in stream_dict.items():
+        rv[name] = _channel_array(data, np.dtype(channel_dtypes.get(name, np.float64)))
+
+    return rv
+
+
+def save_streams(path, streams, dtypes=None):
+    """Save streams into a columnar binary file
+
+    Parameters
+    ----------
+    path : str
+    streams : dict
+        Streams in dict form as lists or ndarrays, see strava.stream2dict
+    dtypes : dict, optional
+        Channel dtypes overriding CHANNEL_DTYPES, see stream2arrays
+    """
+
+    arrays = {}
+    for name, data in streams.items():
+        if isinstance(data, np.ndarray) and not (dtypes and name in dtypes):
+            arrays[name] = data
+        else:
+            arrays.update(stream2arrays({name: data}, dtypes))
+
+    channels = []
+    offset = 0
+    for name, arr in arrays.items():
+        channels.append({'name': name, 'dtype': arr.dtype.newbyteorder('<').str,
+                         'shape': list(arr.shape), 'offset': offset})
+        offset = _aligned(offset + arr.nbytes)
+
+    header = json.dumps({'version': _VERSION, 'channels': channels}).encode()
+    data_start = _aligned(_HEADER.size + len(header))
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(header)))
+        f.write(header)
+        for channel, arr in zip(channels, arrays.values()):
+            f.seek(data_start + channel['offset'])
+            f.write(np.ascontiguousarray(arr, dtype=channel['dtype']).tobytes())
+        f.truncate(data_start + offset)
+
+
+def load_streams(path, mmap_mode=True):
+    """Load streams from a columnar binary file
+
+    Parameters
+    ----------
+    path : str
+    mmap_mode : bool, optional
+        Memory-map the file and return zero-copy read-only views, default=True.
+        If False, the channels are read into memory
+
+    Returns
+    -------
+    dict
+        Stream name mapped to ndarray
+    """
+
+    with open(path, 'rb') as f:
+        if mmap_mode:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = f.read()
+
+    magic, header_size = _HEADER.unpack_from(buffer)
+    if magic != _MAGIC:
+        raise ValueError("{} is not a vmpy streams file".format(path))
+
+    header = json.loads(bytes(buffer[_HEADER.size:_HEADER.size + header_size]).decode())
+    if header['version'] != _VERSION:
+        raise ValueError("Unsupported vmpy streams file version {}".format(header['version']))
+
+    data_start = _aligned(_HEADER.size + header_size)
+
+    rv = {}
+    for channel in header['channels']:
+        dtype = np.dtype(channel['dtype'])
+        shape = tuple(channel['shape'])
+        count = int(np.prod(shape))
+        arr = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + channel['offset'])
+        rv[channel['name']] = arr.reshape(shape)
+
+    return rv
+
+
+def decode_streams(source, dtypes=None, chunk_size=_CHUNK_SIZE):
+    """Decode a Strava streams response into typed ndarrays, see StreamDecoder
+
+    Parameters
+    ----------
+    source : bytes, str, file-like or iterable of bytes
+        Response body, binary file or chunks e.g. requests Response.iter_content()
+    dtypes : dict, optional
+        Channel dtypes overriding CHANNEL_DTYPES, see stream2arrays
+    chunk_size : int, optional
+        Bytes read from a file or decoded at once, default=65536
+
+    Returns
+    -------
+    dict
+        Stream name mapped to ndarray, the same as stream2arrays(strava.stream2dict(streams))
+    """
+
+    decoder = StreamDecoder(dtypes)
+
+    if isinstance(source, str):
+        source = source.encode()
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        chunks = (view[i:i + chunk_size] for i in range(0, len(view), chunk_size))
+    elif hasattr(source, 'read'):
+        chunks = iter(lambda: source.read(chunk_size), b'')
+    else:
+        chunks = source
+
+    for chunk in chunks:
+        decoder.feed(chunk)
+
+    return decoder.close()
+
+
+class StreamDecoder(object):
+    """Incremental decoder of a Strava streams response into typed ndarrays
+
+    The response is a JSON list of stream objects with a type and a data
+    array. The structure is tokenized in Python, the data arrays are parsed a
+    chunk at a time by NumPy, so the memory of a channel is a float64 buffer
+    while it is read and its typed array once its object is complete.
+    Missing values (null) become NaN, see stream2arrays for the channel dtypes.
+
+    >>> decoder = StreamDecoder()
+    >>> for chunk in r.iter_content(65536):
+    ...     decoder.feed(chunk)
+    >>> streams = decoder.close()
+    """
+
+    def __init__(self, dtypes=None):
+
+        self.dtypes = dict(CHANNEL_DTYPES, **(dtypes or {}))
+        self.streams = {}
+
+        self._buffer = b''
+        self._pos = 0
+        self._state = 'start'
+        self._stream = None
+        self._key = None
+
+        # Data array of the current stream: parsed chunks, bracket depth, nested rows,
+        # the depth of its numbers and whether the last chunk ended at a comma
+        self._chunks = []
+        self._depth = 0
+        self._rows = 0
+        self._level = None
+        self._comma = False
+
+    def feed(self, chunk):
+        """Decode the next chunk of the response
+
+        Parameters
+        ----------
+        chunk : bytes
+        """
+
+        if self._state == 'closed':
+            raise ValueError("The decoder is closed")
+
+        self._buffer = self._buffer[self._pos:] + bytes(chunk)
+        self._pos = 0
+        self._decode()
+
+    def close(self):
+        """Finish decoding
+
+        Returns
+        -------
+        dict
+            Stream name mapped to ndarray
+
+        Raises
+        ------
+        ValueError
+            If the response is incomplete or not a list of streams
+        """
+
+        # Trailing delimiter completes a number or literal at the very end
+        self.feed(b' ')
+
+        if self._state != 'end' or self._buffer[self._pos:].strip():
+            raise ValueError("Incomplete streams JSON")
+
+        self._state = 'closed'
+
+        return self.streams
+
+    def _decode(self):
+
+        while True:
+            if self._state == 'data':
+                if not self._decode_data():
+                    return
+                continue
+
+            match = _TOKEN.match(self._buffer, self._pos)
+            if match is None:
+                return
+
+            self._pos = match.end()
+            punctuation, string, literal = match.groups()
+            if punctuation:
+                self._punctuation(punctuation.decode())
+            else:
+                self._value(json.loads(string or literal))
+
+    def _punctuation(self, token):
+
+        state = self._state
+
+        if state == 'start' and token == '[':
+            self._state = 'stream'
+        elif state == 'stream' and token == '{':
+            self._stream = {}
+            self._state = 'key'
+        elif state == 'stream' and token == ']' and not self.streams:
+            self._state = 'end'
+        elif state == 'colon' and token == ':':
+            self._state = 'value'
+        elif state == 'value' and token == '[' and self._key == 'data':
+            self._chunks, self._depth, self._rows, self._comma = [], 0, 0, False
+            self._level = None
+            self._state = 'data'
+        elif state == 'next_key' and token == ',':
+            self._state = 'member'
+        elif state in ('key', 'next_key') and token == '}':
+            self._add_stream()
+            self._state = 'next_stream'
+        elif state == 'next_stream' and token == ',':
+            self._state = 'stream'
+        elif state == 'next_stream' and token == ']':
+            self._state = 'end'
+        else:
+            raise ValueError("Unexpected {!r} in streams JSON".format(token))
+
+    def _value(self, value):
+
+        if self._state in ('key', 'member') and isinstance(value, str):
+            self._key = value
+            self._state = 'colon'
+        elif self._state == 'value':
+            self._stream[self._key] = value
+            self._state = 'next_key'
+        else:
+            raise ValueError("Unexpected {!r} in streams JSON".format(value))
+
+    def _decode_data(self):
+        """Parse the data array up to its end or the last complete number of the buffer"""
+
+        text = self._buffer[self._pos:]
+        arr = np.frombuffer(text, dtype=np.uint8)
+
+        # Only the brackets of nested arrays e.g. latlng change the depth
+        brackets = np.flatnonzero((arr == ord('[')) | (arr == ord(']')))
+        opening = arr[brackets] == ord('[')
+        depth = self._depth + np.cumsum(np.where(opening, 1, -1))
+        closing = np.flatnonzero(depth < 0)
+
+        if len(closing):
+            below = closing[0]
+            stop = brackets[below]
+        else:
+            stop = text.rfind(b',')
+            if stop < 0:
+                return False
+            below = np.searchsorted(brackets, stop)
+
+        self._check_level(arr[:stop], brackets[:below], depth[:below])
+        if not len(closing):
+            self._depth = int(depth[below - 1]) if below else self._depth
+
+        numbers = _parse_numbers(text[:stop], nested=below > 0)
+        # A comma needs a value on both sides, e.g. [1, 2, ] is invalid JSON
+        if not numbers.size and (self._comma or not len(closing)):
+            raise ValueError("Missing value in streams JSON data")
+        self._comma = not len(closing)
+
+        self._rows += int(np.count_nonzero(opening[:below]))
+        self._chunks.append(numbers)
+        self._buffer, self._pos = text[stop + 1:], 0
+
+        if len(closing):
+            self._stream['data'] = self._data()
+            self._state = 'next_key'
+
+        return True
+
+    def _check_level(self, arr, brackets, depth):
+        """Numbers are either all flat or all rows of nested arrays, e.g. not [[1, 2], 3]"""
+
+        values = np.flatnonzero((arr > ord(' ')) & (arr != ord(',')) & (arr != ord('['))
+                                & (arr != ord(']')))
+        if not values.size:
+            return
+
+        # Depth of a value is the depth after the last bracket in front of it
+        before = np.searchsorted(brackets, values)
+        levels = np.concatenate(([self._depth], depth))[before]
+
+        level = self._level if self._level is not None else int(levels[0])
+        if level > 1 or (levels != level).any():
+            raise ValueError("Mixed nesting of the data array in streams JSON")
+        self._level = level
+
+    def _data(self):
+
+        data = np.concatenate(self._chunks) if self._chunks else np.empty(0)
+        self._chunks = []
+
+        if self._rows:
+            if data.size % self._rows:
+                raise ValueError("Nested data arrays of unequal length in streams JSON")
+            data = data.reshape(self._rows, -1)
+
+        return data
+
+    def _add_stream(self):
+
+        if 'type' not in self._stream or 'data' not in self._stream:
+            raise ValueError("Stream without a type or data in streams JSON")
+
+        name = self._stream['type']
+        data = self._stream['data']
+        if not isinstance(data, np.ndarray):
+            raise ValueError("Data of the {} stream is not an array".format(name))
+
+        self.streams[name] = _channel_array(data, np.dtype(self.dtypes.get(name, np.float64)))
+        self._stream = None
+
+
+def _parse_numbers(text, nested=False):
+    """Numbers of a chunk of a JSON array, null is NaN, nested arrays are flattened"""
+
+    if nested:
+        text = text.translate(_BRACKETS)
+    if b'u' in text:
+        text = text.replace(b'null', b'nan').replace(b'true', b'1')
+    if b'f' in text:
+        text = text.replace(b'false', b'0')
+
+    # fromstring skips a trailing comma and reads an empty element as -1
+    arr = np.frombuffer(text, dtype=np.uint8)
+    commas = arr[arr > ord(' ')] == ord(',')
+    if not commas.size:
+        return np.empty(0)
+    if commas[0] or commas[-1] or (commas[1:] & commas[:-1]).any():
+        raise ValueError("Missing value in streams JSON data")
+    # JSON has no leading plus, only the sign of an exponent e.g. 1e+5
+    plus = np.flatnonzero(arr == ord('+'))
+    if plus.size and (plus[0] == 0 or not np.isin(arr[plus - 1], (ord('e'), ord('E'))).all()):
+        raise ValueError("Invalid number in streams JSON data")
+
+    # Older numpy stops at an invalid number with a DeprecationWarning instead of
+    # raising, so the count of the numbers is checked against the commas too
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            numbers = np.fromstring(text, dtype=np.float64, sep=',')
+        except (ValueError, DeprecationWarning):
+            raise ValueError("Invalid number in streams JSON data") from None
+    if numbers.size != np.count_nonzero(commas) + 1:
+        raise ValueError("Invalid number in streams JSON data")
+
+    return numbers
+
+
+def _channel_array(data, dtype):
+
+    if dtype.kind in 'iu':
+        arr = np.asarray(data, dtype=float)
+        info = np.iinfo(dtype)
+        fits = (np.isfinite(arr).all() and (arr == np.round(arr)).all()
+                and (arr.size == 0 or (arr.min() >= info.min and arr.max() <= info.max)))
+        return arr.astype(dtype if fits else np.float32)
+
+    if dtype.kind == 'b':
+        return np.asarray(data, dtype=dtype)
+
+    return np.asarray(data, dtype=float).astype(dtype)
+
+
+def _aligned(offset):
+
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
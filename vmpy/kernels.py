@@ -0,0 +1,46 @@
+"""Compiled kernels of the sequential loops in core
+
+The backend is selected once at import. If numba is installed the kernels are
+JIT compiled (and cached on disk), otherwise every kernel is None and the
+callers use their NumPy implementation. The kernels repeat the floating point
+operations of the NumPy implementations in the same order, so both backends
+return bit for bit identical results.
+
+numba itself is only imported on the first access of a kernel, so importing
+vmpy stays cheap for code that never reaches a compiled loop.
+
+Set the environment variable VMPY_BACKEND=numpy to disable the compiled kernels.
+"""
+
+import importlib.util
+import os
+
+
+if os.environ.get('VMPY_BACKEND', 'numba') == 'numpy' or importlib.util.find_spec('numba') is None:
+    BACKEND = 'numpy'
+else:
+    BACKEND = 'numba'
+
+KERNELS = ('exponential_filter', 'rolling_median', 'rolling_median_mad')
+
+
+def __getattr__(name):
+    """Load the kernels on first access, None with the numpy backend"""
+
+    if name not in KERNELS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+    global BACKEND
+
+    kernels = dict.fromkeys(KERNELS)
+    if BACKEND == 'numba':
+        try:
+            from vmpy import _numba_kernels
+        except ImportError:
+            BACKEND = 'numpy'
+        else:
+            kernels = {k: getattr(_numba_kernels, k) for k in KERNELS}
+
+    globals().update(kernels)
+
+    return kernels[name]
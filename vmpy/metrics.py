@@ -1,15 +1,19 @@
 """Calculation of performance metrics that change the shape of stream"""
 
+import struct
+import zlib
 import numpy as np
-import pandas as pd
-from vmpy.streams import rolling_mean, mask_fill, compute_zones
-from vmpy.utils import cast_array_to_original_type
+from vmpy import core
+from vmpy.profiling import instrument
+from vmpy.streams import rolling_mean, ZoneBinner
+from vmpy.utils import cast_array_to_original_type, is_series, to_datetime64
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-def power_duration_curve(arg, mask=None, value=0.0, **kwargs):
+@instrument
+def power_duration_curve(arg, mask=None, value=0.0, durations=None, **kwargs):
     """Power-Duration Curve
 
     Compute power duration curve from the power stream. Mask-filter options can be
@@ -23,29 +27,227 @@ def power_duration_curve(arg, mask=None, value=0.0, **kwargs):
         Replacement mask (the default is None, which implies no masking)
     value: number, optional
         Value to use as a replacement (the default is 0.0)
+    durations: array-like of int, optional
+        Durations in seconds to evaluate the curve at (the default is None,
+        which implies every duration from 1 to len(arg) - 1), see log_durations
 
     Returns
     -------
     rv : type of input argument
-        Power-Duration Curve
+        Power-Duration Curve, one value per duration
     """
 
-    y = mask_fill(arg, mask=mask, value=value)
-    y = pd.Series(y)
+    y = core.mask_fill(arg, mask=mask, value=value, dtype=core.float_dtype(arg))
 
     # Compute the accumulated energy from the power data
-    energy = y.cumsum()
+    energy = _cumulative_energy(y)
 
-    # Compute the maximum sustainable power using the difference in energy
-    # This method is x4 faster than using rolling mean
-    y = np.array([])
-    for t in np.arange(1, len(energy)):
-        y = np.append(y, energy.diff(t).max()/(t))
+    if durations is None:
+        durations = np.arange(1, len(energy))
+
+    y = core.max_mean_power(energy, durations)
     y = cast_array_to_original_type(y, type(arg))
 
     return y
 
 
+@instrument
+def log_durations(max_duration, num=100):
+    """Log-spaced grid of durations for the Power-Duration Curve
+
+    Parameters
+    ----------
+    max_duration : int
+        Longest duration in seconds, usually len(arg) - 1
+    num : int, optional
+        Number of grid points before rounding to whole seconds, default=100
+
+    Returns
+    -------
+    ndarray of int
+        Unique durations in seconds, sorted ascending
+    """
+
+    if max_duration < 1:
+        return np.array([], dtype=int)
+
+    rv = np.logspace(0, np.log10(max_duration), num)
+    rv = np.unique(np.round(rv).astype(int))
+
+    return rv
+
+
+def _cumulative_energy(arg):
+    """Accumulated energy with pandas cumsum semantics: NaN samples stay NaN
+    but do not interrupt the accumulation. Energy is accumulated in float64
+    whatever the dtype of the stream, so long int16 or float32 rides do not overflow
+    or lose precision"""
+
+    y = np.asarray(arg)
+    nans = np.isnan(y)
+
+    if nans.any():
+        energy = np.cumsum(np.where(nans, 0, y), dtype=np.float64)
+        energy[nans] = np.nan
+    else:
+        energy = np.cumsum(y, dtype=np.float64)
+
+    return energy
+
+
+class PowerDurationCurve(object):
+    """Best power envelope accumulated over many activities
+
+    Keeps the best power for every duration together with the activity and the
+    date that set it. Element *i* of every array corresponds to the duration of
+    *i + 1* seconds, the same layout as returned by power_duration_curve.
+
+    Attributes
+    ----------
+    power : ndarray of float
+        Best power per duration, NaN where no activity was long enough
+    activity_id : ndarray of int
+        Activity that set the best power, -1 if not provided
+    date : ndarray of datetime64[s]
+        Date of the activity that set the best power, NaT if not provided
+
+    Examples
+    --------
+    >>> pdc = PowerDurationCurve()
+    >>> pdc.update(power_duration_curve(stream['watts']), activity_id=1354978421,
+    ...            date='2018-01-07T10:05:42')
+    >>> blob = pdc.to_bytes()
+    >>> pdc = PowerDurationCurve.from_bytes(blob)
+    """
+
+    _MAGIC = b'VPDC'
+    _VERSION = 1
+    _HEADER = struct.Struct('<4sBI')
+
+    def __init__(self):
+
+        self.power = np.array([], dtype=float)
+        self.activity_id = np.array([], dtype=np.int64)
+        self.date = np.array([], dtype='datetime64[s]')
+
+    def __len__(self):
+
+        return len(self.power)
+
+    @property
+    def durations(self):
+        """Durations in seconds the envelope is defined for"""
+
+        return np.arange(1, len(self) + 1)
+
+    def update(self, curve, activity_id=None, date=None):
+        """Merge the Power-Duration Curve of a single activity into the envelope
+
+        Parameters
+        ----------
+        curve : array-like
+            Power-Duration Curve of the activity, see power_duration_curve
+        activity_id : int, optional
+            Activity identifier, default=None is stored as -1
+        date : str, datetime or datetime64, optional
+            Activity date, default=None is stored as NaT
+
+        Returns
+        -------
+        ndarray of bool
+            True for every duration the activity did improve
+        """
+
+        curve = np.asarray(curve, dtype=float)
+        activity_id = -1 if activity_id is None else activity_id
+
+        return self._merge(curve,
+                           np.full(len(curve), activity_id, dtype=np.int64),
+                           np.full(len(curve), to_datetime64(date)))
+
+    def merge(self, other):
+        """Merge another envelope into this one
+
+        Parameters
+        ----------
+        other : PowerDurationCurve
+
+        Returns
+        -------
+        ndarray of bool
+            True for every duration the other envelope did improve
+        """
+
+        return self._merge(other.power, other.activity_id, other.date)
+
+    def to_bytes(self):
+        """Serialize the envelope into a compact binary blob
+
+        Returns
+        -------
+        bytes
+        """
+
+        payload = b''.join([self.power.astype('<f8').tobytes(),
+                            self.activity_id.astype('<i8').tobytes(),
+                            self.date.astype('<i8').tobytes()])
+
+        rv = self._HEADER.pack(self._MAGIC, self._VERSION, len(self)) + zlib.compress(payload)
+
+        return rv
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """Restore the envelope from a blob created by to_bytes
+
+        Parameters
+        ----------
+        blob : bytes
+
+        Returns
+        -------
+        PowerDurationCurve
+        """
+
+        magic, version, n = cls._HEADER.unpack_from(blob)
+        if magic != cls._MAGIC or version != cls._VERSION:
+            raise ValueError("Not a PowerDurationCurve blob")
+
+        payload = zlib.decompress(blob[cls._HEADER.size:])
+        if len(payload) != 24 * n:
+            raise ValueError("Corrupted PowerDurationCurve blob")
+
+        rv = cls()
+        rv.power = np.frombuffer(payload, dtype='<f8', count=n).astype(float)
+        rv.activity_id = np.frombuffer(payload, dtype='<i8', count=n, offset=8 * n).astype(np.int64)
+        rv.date = np.frombuffer(payload, dtype='<i8', count=n, offset=16 * n).view('datetime64[s]').copy()
+
+        return rv
+
+    def _merge(self, power, activity_id, date):
+
+        n = len(power)
+        if n > len(self):
+            self._grow(n)
+
+        current = self.power[:n]
+        better = (power > current) | (np.isnan(current) & ~np.isnan(power))
+
+        current[better] = power[better]
+        self.activity_id[:n][better] = activity_id[better]
+        self.date[:n][better] = date[better]
+
+        return better
+
+    def _grow(self, n):
+
+        extra = n - len(self)
+        self.power = np.concatenate([self.power, np.full(extra, np.nan)])
+        self.activity_id = np.concatenate([self.activity_id, np.full(extra, -1, dtype=np.int64)])
+        self.date = np.concatenate([self.date, np.full(extra, np.datetime64('NaT'), dtype='datetime64[s]')])
+
+
+@instrument
 def best_interval(arg, window, mask=None, value=0.0, **kwargs):
     """Compute best interval of the stream
 
@@ -66,13 +268,80 @@ def best_interval(arg, window, mask=None, value=0.0, **kwargs):
     float
     """
 
-    y = rolling_mean(arg, window=window, mask=mask, value=value, **kwargs)
+    # Scalar metrics are computed in float64 also for narrow streams
+    y = rolling_mean(np.asarray(arg, dtype=float), window=window, mask=mask, value=value, **kwargs)
+
+    # Series.max skips NaN, lists and ndarrays propagate it
+    if is_series(arg):
+        y = y[~np.isnan(y)]
+        return np.max(y) if y.size else np.nan
 
     rv = np.max(y)
 
     return rv
 
 
+@instrument
+def best_intervals(arg, windows, mask=None, value=0.0, **kwargs):
+    """Compute best intervals of the stream for many windows at once
+
+    All windows are evaluated from a single cumulative sum of the stream, the
+    values match best_interval of a Series for every window. Windows holding
+    only NaN samples are skipped, the value is NaN only if all of them are.
+    Masking with replacement is controlled by keyword arguments
+
+    Parameters
+    ----------
+    arg: array-like
+    windows : list of int
+        Durations of the intervals in seconds
+    mask : array-like of bool, optional
+        default=None, which means no masking
+    value : number, optional
+        Value to use for replacement, default=0.0
+
+    Returns
+    -------
+    dict
+        Maps every window to a tuple of (best value, start index of the interval),
+        the start index is -1 for a NaN value
+    """
+
+    y = core.mask_fill(arg, mask=mask, value=value, dtype=core.float_dtype(arg))
+    n = len(y)
+
+    # Rolling means skip missing samples, so count the valid ones alongside the sum
+    valid = ~np.isnan(y)
+    total = np.zeros(n + 1)
+    np.cumsum(np.where(valid, y, 0), dtype=np.float64, out=total[1:])
+    if valid.all():
+        count = np.arange(n + 1, dtype=float)
+    else:
+        count = np.zeros(n + 1)
+        np.cumsum(valid, out=count[1:])
+
+    means = np.empty(n)
+    rv = {}
+    for window in windows:
+        # Windows are trailing and include partial windows at the start of the stream
+        start = np.maximum(np.arange(n) + 1 - window, 0)
+        samples = count[1:] - count[start]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            np.divide(total[1:] - total[start], samples, out=means)
+        # Windows without a single valid sample are skipped, as with Series.max
+        means[samples == 0] = -np.inf
+
+        if n == 0 or not samples.any():
+            rv[window] = (np.nan, -1)
+            continue
+
+        idx = int(np.argmax(means))
+        rv[window] = (float(means[idx]), int(start[idx]))
+
+    return rv
+
+
+@instrument
 def time_in_zones(arg, **kwargs):
     """Time in zones
 
@@ -87,16 +356,12 @@ def time_in_zones(arg, **kwargs):
     -------
     array-like, the same type as arg
     """
-    type_arg = type(arg)
-    z = pd.Series(compute_zones(arg, **kwargs))
-    tiz = z.groupby(z).count()
-    rv = cast_array_to_original_type(tiz, type_arg)
-
-    return rv
+    return ZoneBinner(**kwargs).time_in_zones(arg)
 
 
 
 
+@instrument
 def normalized_power(arg, mask=None, value=0.0, **kwargs):
     """Normalized power
 
@@ -116,19 +381,17 @@ def normalized_power(arg, mask=None, value=0.0, **kwargs):
     number
     """
 
+    y = core.mask_fill(arg, mask=mask, value=value, dtype=float)
+
     if kwargs.get('type', 'NP') == 'xPower':
-        _rolling_mean = rolling_mean(arg, window=25, mask=mask, value=value, type='emwa')
+        _rolling_mean = core.rolling_mean(y, window=25, type='emwa', out=y)
     else:
-        _rolling_mean = rolling_mean(arg, window=30, mask=mask, value=value)
-
-    if type(_rolling_mean) == list:
-        _rolling_mean = np.asarray(_rolling_mean, dtype=np.float)
+        _rolling_mean = core.rolling_mean(y, window=30, out=y)
 
-    rv = np.mean(np.power(_rolling_mean, 4)) ** (1/4)
-
-    return rv
+    return core.quartic_mean(_rolling_mean, out=_rolling_mean)
 
 
+@instrument
 def relative_intensity(norm_power, threshold_power):
     """Relative intensity
 
@@ -150,6 +413,7 @@ def relative_intensity(norm_power, threshold_power):
     return rv
 
 
+@instrument
 def stress_score(norm_power, threshold_power, duration):
     """Stress Score
 
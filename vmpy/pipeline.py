@@ -0,0 +1,217 @@
+"""Scoring of many activities across a pool of worker processes
+
+Every activity is a stream JSON file as returned by the Strava API v3
+(see strava.retrieve_streams). Results are written as JSON Lines, one
+activity per line, in chunks while the pool is still working.
+
+Usage from the command line:
+
+    $ vmpy score tests/assets --ftp 270 --lthr 160 --output scores.jsonl
+"""
+
+import argparse
+import functools
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+from vmpy.activity import Activity
+from vmpy.metrics import log_durations
+from vmpy.strava import stream2dict
+from vmpy.streams import ZoneBinner
+from vmpy.utils import to_json, write_lines
+
+logger = logging.getLogger(__name__)
+
+
+def score_streams(streams, ftp=None, lthr=None, full_curve=False):
+    """Compute the metrics of a single activity
+
+    Parameters
+    ----------
+    streams : dict
+        Streams in dict form, see strava.stream2dict
+    ftp : number, optional
+        Value for FTP, required for IF, TSS and power zones
+    lthr : number, optional
+        Value for LTHR, required for heart rate zones
+    full_curve : bool, optional
+        Evaluate the Power-Duration Curve for every duration instead of
+        a log-spaced grid, default=False
+
+    Returns
+    -------
+    dict
+    """
+
+    rv = {}
+
+    if streams.get('watts', None) is not None:
+        activity = Activity(streams, ftp=ftp)
+        power = activity.power
+
+        rv['duration'] = activity.duration
+        rv['normalized_power'] = activity.normalized_power
+
+        if ftp:
+            rv['relative_intensity'] = activity.relative_intensity
+            rv['stress_score'] = activity.stress_score
+            rv['time_in_power_zones'] = _time_in_zones(power, ftp=ftp)
+
+        if full_curve:
+            durations = np.arange(1, len(power))
+            curve = activity.power_duration_curve
+        else:
+            durations = log_durations(len(power) - 1)
+            curve = activity.power_duration_curve_at(durations)
+        rv['power_duration_curve'] = {'durations': durations, 'power': curve}
+
+    heartrate = streams.get('heartrate', None)
+    if heartrate is not None and lthr:
+        rv['time_in_heart_rate_zones'] = _time_in_zones(heartrate, lthr=lthr)
+
+    return rv
+
+
+def _time_in_zones(arg, **kwargs):
+    """Time [sec] in every zone, 0 for the zones without samples"""
+
+    binner = ZoneBinner(**kwargs)
+
+    return binner.zone_counts(binner.zone_index(arg), observed=False)[0]
+
+
+def score_file(path, **kwargs):
+    """Compute the metrics of a single stream JSON file
+
+    Any exception is caught and reported in the result, so a single broken
+    activity does not stop the whole run
+
+    Parameters
+    ----------
+    path : str
+    kwargs : see score_streams
+
+    Returns
+    -------
+    dict
+        Metrics with the *activity* name, or the *error* message
+    """
+
+    rv = {'activity': os.path.splitext(os.path.basename(path))[0]}
+
+    try:
+        with open(path) as f:
+            streams = json.load(f)
+
+        if isinstance(streams, list):
+            streams = stream2dict(streams)
+
+        rv.update(score_streams(streams, **kwargs))
+
+    except Exception as e:
+        logger.warning('Scoring {} failed with a reason {!r}'.format(path, e))
+        rv['error'] = '{}: {}'.format(type(e).__name__, e)
+
+    return rv
+
+
+def run(paths, output, processes=None, chunk_size=100, progress=None, **kwargs):
+    """Score many stream JSON files across a pool of worker processes
+
+    Parameters
+    ----------
+    paths : list of str
+        Stream JSON files
+    output : file-like
+        Text stream the JSON Lines results are written to
+    processes : int, optional
+        Number of worker processes, default=None uses all cores
+    chunk_size : int, optional
+        Number of results buffered before they are written out, default=100
+    progress : callable, optional
+        Called as progress(done, total, failed) after every activity
+    kwargs : see score_streams
+
+    Returns
+    -------
+    (int, int)
+        Number of scored and failed activities
+    """
+
+    paths = list(paths)
+    total = len(paths)
+    done = failed = 0
+    buffer = []
+
+    worker = functools.partial(score_file, **kwargs)
+
+    with multiprocessing.Pool(processes) as pool:
+
+        # Workers load the stream files themselves, so only the activities
+        # in flight and one chunk of results are held in memory
+        for result in pool.imap_unordered(worker, paths, chunksize=1):
+
+            done += 1
+            failed += 'error' in result
+            buffer.append(json.dumps(to_json(result)))
+
+            if len(buffer) >= chunk_size:
+                write_lines(output, buffer)
+
+            if progress:
+                progress(done, total, failed)
+
+    write_lines(output, buffer)
+
+    return done - failed, failed
+
+
+def main(argv=None):
+    """Entry point of the vmpy console script"""
+
+    parser = argparse.ArgumentParser(prog='vmpy', description='Performance Velo Metrics Toolbox')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    score = subparsers.add_parser('score', help='Score a directory of stream JSON files')
+    score.add_argument('directory', help='Directory with stream JSON files')
+    score.add_argument('--pattern', default='streams_*.json', help='File name pattern, default=%(default)s')
+    score.add_argument('--output', '-o', default='-', help='JSON Lines output file, default=stdout')
+    score.add_argument('--ftp', type=float, help='Functional threshold power')
+    score.add_argument('--lthr', type=float, help='Lactate threshold heart rate')
+    score.add_argument('--processes', '-j', type=int, help='Number of worker processes, default=all cores')
+    score.add_argument('--chunk-size', type=int, default=100, help='Results written per chunk, default=%(default)s')
+    score.add_argument('--full-curve', action='store_true', help='Power-Duration Curve for every duration')
+    score.add_argument('--quiet', '-q', action='store_true', help='Do not report progress')
+
+    args = parser.parse_args(argv)
+
+    paths = sorted(glob.glob(os.path.join(args.directory, args.pattern)))
+    progress = None if args.quiet else _report_progress
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        scored, failed = run(paths, output, processes=args.processes, chunk_size=args.chunk_size,
+                             progress=progress, ftp=args.ftp, lthr=args.lthr, full_curve=args.full_curve)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    return 1 if failed else 0
+
+
+def _report_progress(done, total, failed):
+
+    sys.stderr.write('\rScored {}/{} activities, {} failed'.format(done, total, failed))
+    if done == total:
+        sys.stderr.write('\n')
+    sys.stderr.flush()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""Training load: chronic load (CTL), acute load (ATL) and balance (TSB)
+
+The daily stress scores are smoothed exponentially, the loads follow
+
+    CTL[d] = CTL[d-1] + (TSS[d] - CTL[d-1]) / ctl_days
+
+and the same for ATL with atl_days. The balance of a day is the form going
+into the day, TSB[d] = CTL[d-1] - ATL[d-1]. Days run along the last axis, so
+a 2-D daily load of many athletes is processed in a single pass.
+
+>>> days, load = daily_load(dates, tss)
+>>> ctl, atl, tsb = training_load(load)
+"""
+
+import numpy as np
+from vmpy import core
+from vmpy.utils import to_datetime64
+
+
+CTL_DAYS = 42
+ATL_DAYS = 7
+
+
+def daily_load(dates, tss, start=None, end=None):
+    """Sum the stress scores of the activities per day
+
+    Parameters
+    ----------
+    dates : array-like of str, datetime or datetime64
+        Activity dates
+    tss : array-like
+        Stress score of every activity, see metrics.stress_score
+    start : str, datetime or datetime64, optional
+        First day, default=None means the day of the earliest activity
+    end : str, datetime or datetime64, optional
+        Last day, default=None means the day of the latest activity
+
+    Returns
+    -------
+    (ndarray of datetime64[D], ndarray of float)
+        Every day from start to end, and the stress score of the day
+    """
+
+    days = _as_days(dates)
+    tss = np.asarray(tss, dtype=float)
+
+    start = days.min() if start is None else np.datetime64(start, 'D')
+    end = days.max() if end is None else np.datetime64(end, 'D')
+
+    offsets = (days - start).astype(int)
+    inside = (offsets >= 0) & (days <= end)
+    n = int((end - start).astype(int)) + 1
+
+    load = np.bincount(offsets[inside], weights=tss[inside], minlength=max(n, 0))
+
+    return start + np.arange(len(load)), load
+
+
+def training_load(load, ctl_days=CTL_DAYS, atl_days=ATL_DAYS, ctl=0.0, atl=0.0):
+    """Chronic load, acute load and balance of the daily load
+
+    Parameters
+    ----------
+    load : array-like
+        Daily stress score without gaps, 1-D or (athletes, days)
+    ctl_days : number, optional
+        Time constant of the chronic load in days, default=42
+    atl_days : number, optional
+        Time constant of the acute load in days, default=7
+    ctl, atl : number or array-like, optional
+        Loads on the day before the first day, default=0.0
+
+    Returns
+    -------
+    (ndarray, ndarray, ndarray)
+        CTL, ATL and TSB, the same shape as load
+    """
+
+    load = np.asarray(load, dtype=float)
+
+    rv_ctl = _exponential_load(load, ctl_days, ctl)
+    rv_atl = _exponential_load(load, atl_days, atl)
+    tsb = _balance(rv_ctl, rv_atl, ctl, atl)
+
+    return rv_ctl, rv_atl, tsb
+
+
+class TrainingLoad(object):
+    """Training load of many athletes updated with new activities as they come
+
+    Only the days from the earliest new activity onwards are recomputed,
+    starting from the stored loads of the day before
+
+    Parameters
+    ----------
+    start : str, datetime or datetime64
+        First day of the history
+    ctl_days : number, optional
+        Time constant of the chronic load in days, default=42
+    atl_days : number, optional
+        Time constant of the acute load in days, default=7
+
+    Attributes
+    ----------
+    athletes : list
+        Athletes in the order of the rows of load, ctl, atl and tsb
+
+    Examples
+    --------
+    >>> pmc = TrainingLoad('2018-01-01')
+    >>> pmc.append(dates, tss, athletes=athlete_ids)
+    >>> pmc.append(['2018-06-01T07:00:00'], [85.0], athletes=[1202065], end='2018-06-02')
+    >>> ctl, atl, tsb = pmc[1202065]
+    """
+
+    def __init__(self, start, ctl_days=CTL_DAYS, atl_days=ATL_DAYS):
+
+        self.start = np.datetime64(start, 'D')
+        self.ctl_days = ctl_days
+        self.atl_days = atl_days
+
+        self.athletes = []
+        self._rows = {}
+        self._days = 0
+        self._load = np.zeros((0, 0))
+        self._ctl = np.zeros((0, 0))
+        self._atl = np.zeros((0, 0))
+
+    def __len__(self):
+
+        return self._days
+
+    def __getitem__(self, athlete):
+        """CTL, ATL and TSB of a single athlete
+
+        Parameters
+        ----------
+        athlete : hashable
+            Athlete identifier, None if append was called without athletes
+
+        Returns
+        -------
+        (ndarray, ndarray, ndarray)
+        """
+
+        row = self._rows[athlete]
+
+        return self.ctl[row], self.atl[row], self.tsb[row]
+
+    @property
+    def days(self):
+        """Every day of the history, ndarray of datetime64[D]"""
+
+        return self.start + np.arange(self._days)
+
+    @property
+    def load(self):
+        """Daily stress score, ndarray (athletes, days)"""
+
+        return self._load[:len(self.athletes), :self._days]
+
+    @property
+    def ctl(self):
+        """Chronic training load, ndarray (athletes, days)"""
+
+        return self._ctl[:len(self.athletes), :self._days]
+
+    @property
+    def atl(self):
+        """Acute training load, ndarray (athletes, days)"""
+
+        return self._atl[:len(self.athletes), :self._days]
+
+    @property
+    def tsb(self):
+        """Training stress balance going into the day, ndarray (athletes, days)"""
+
+        return _balance(self.ctl, self.atl, 0.0, 0.0)
+
+    def append(self, dates, tss, athletes=None, end=None):
+        """Add activities and extend the history up to the latest day
+
+        Parameters
+        ----------
+        dates : array-like of str, datetime or datetime64
+            Activity dates, not before start
+        tss : array-like
+            Stress score of every activity
+        athletes : array-like, optional
+            Athlete of every activity, default=None means a single athlete
+        end : str, datetime or datetime64, optional
+            Extend the history up to this day even without activities, e.g. today
+        """
+
+        days = _as_days(dates)
+        tss = np.asarray(tss, dtype=float)
+
+        offsets = (days - self.start).astype(int)
+        if np.any(offsets < 0):
+            raise ValueError("Activities before the start {} of the history".format(self.start))
+
+        if athletes is None:
+            athletes = [None] * len(offsets)
+        rows = np.array([self._row(athlete) for athlete in athletes], dtype=int)
+
+        n = self._days
+        if len(offsets):
+            n = max(n, int(offsets.max()) + 1)
+        if end is not None:
+            n = max(n, int((np.datetime64(end, 'D') - self.start).astype(int)) + 1)
+        self._reserve(len(self.athletes), n)
+
+        np.add.at(self._load, (rows, offsets), tss)
+
+        # Days before the earliest new activity keep their loads
+        first = min(int(offsets.min()), self._days) if len(offsets) else self._days
+        self._days = n
+
+        rows = len(self.athletes)
+        ctl = self._ctl[:rows, first - 1] if first else 0.0
+        atl = self._atl[:rows, first - 1] if first else 0.0
+        load = self._load[:rows, first:n]
+
+        _exponential_load(load, self.ctl_days, ctl, out=self._ctl[:rows, first:n])
+        _exponential_load(load, self.atl_days, atl, out=self._atl[:rows, first:n])
+
+    def _row(self, athlete):
+
+        if athlete not in self._rows:
+            self._rows[athlete] = len(self.athletes)
+            self.athletes.append(athlete)
+
+        return self._rows[athlete]
+
+    def _reserve(self, rows, days):
+        """Grow the buffers geometrically, so appending day by day stays cheap"""
+
+        capacity_rows, capacity_days = self._load.shape
+        if rows <= capacity_rows and days <= capacity_days:
+            return
+
+        shape = (max(rows, 2 * capacity_rows), max(days, 2 * capacity_days))
+        for name in ('_load', '_ctl', '_atl'):
+            grown = np.zeros(shape)
+            old = getattr(self, name)
+            grown[:old.shape[0], :old.shape[1]] = old
+            setattr(self, name, grown)
+
+
+def _exponential_load(load, days, initial, out=None):
+    """Exponentially weighted load, x[d] = x[d-1] + (load[d] - x[d-1]) / days"""
+
+    decay = 1.0 - 1.0 / days
+
+    return core.exponential_filter(load / days, decay, out=out, initial=initial)
+
+
+def _balance(ctl, atl, ctl_before, atl_before):
+    """Balance of every day from the loads of the day before"""
+
+    tsb = np.empty_like(ctl)
+    if ctl.shape[-1]:
+        tsb[..., 0] = np.subtract(ctl_before, atl_before)
+        np.subtract(ctl[..., :-1], atl[..., :-1], out=tsb[..., 1:])
+
+    return tsb
+
+
+def _as_days(dates):
+
+    dates = np.asarray(dates)
+    if dates.dtype.kind in 'UO':
+        dates = np.array([to_datetime64(date) for date in dates], dtype='datetime64[s]')
+
+    return dates.astype('datetime64[D]')
@@ -0,0 +1,246 @@
+"""Opt-in instrumentation of the streams, metrics and strava functions
+
+Instrumented functions record their calls, cumulative wall time and the
+length of their first argument. With memory=True the peak bytes allocated
+during every call are traced as well, which slows the calls down noticeably.
+HTTP requests of vmpy.strava record their latency and status, and the
+response cache its hits, misses, revalidations and stale bodies served.
+
+Instrumentation is off by default, a disabled instrumented function costs a
+single flag check on top of the call.
+
+>>> profiling.enable()
+>>> pipeline.score_streams(streams, ftp=270)
+>>> profiling.snapshot()['functions']['metrics.normalized_power']
+>>> print(profiling.to_prometheus())
+"""
+
+import collections
+import functools
+import threading
+import time
+import tracemalloc
+
+
+_enabled = False
+_memory = False
+# Only stop tracemalloc on disable if enable started it, not the caller
+_tracing = False
+_lock = threading.Lock()
+_local = threading.local()
+
+_functions = collections.defaultdict(lambda: dict.fromkeys(('calls', 'seconds', 'bytes', 'samples', 'max_length'), 0))
+_http = collections.defaultdict(lambda: {'requests': 0, 'seconds': 0.0})
+_cache = dict.fromkeys(('hits', 'misses', 'revalidations', 'stale'), 0)
+
+_CACHE_RESULTS = {'hits': 'hit', 'misses': 'miss', 'revalidations': 'revalidation', 'stale': 'stale'}
+
+
+def enable(memory=False):
+    """Start recording
+
+    Parameters
+    ----------
+    memory : bool, optional
+        Trace the bytes allocated by every call with tracemalloc, default=False.
+        Bytes are only traced if tracemalloc is not already running, the peak
+        of the caller's own tracing is left alone
+    """
+
+    global _enabled, _memory, _tracing
+
+    _memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _tracing = True
+    _enabled = True
+
+
+def disable():
+    """Stop recording, the collected data is kept until reset"""
+
+    global _enabled, _memory, _tracing
+
+    _enabled = False
+    if _tracing and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _memory = _tracing = False
+
+
+def is_enabled():
+    """True while recording"""
+
+    return _enabled
+
+
+def reset():
+    """Discard the collected data"""
+
+    with _lock:
+        _functions.clear()
+        _http.clear()
+        _cache.update(dict.fromkeys(_cache, 0))
+
+
+def instrument(func):
+    """Decorator recording the calls of func while instrumentation is enabled
+
+    The function is reported by its module and qualified name, e.g. metrics.normalized_power
+    """
+
+    name = '{}.{}'.format(func.__module__.split('.')[-1], func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+
+        if not _enabled:
+            return func(*args, **kwargs)
+
+        return _call(name, func, args, kwargs)
+
+    return wrapper
+
+
+def record_http(status, seconds):
+    """Record an HTTP request, status is None for connection errors, reported as error"""
+
+    if not _enabled:
+        return
+
+    with _lock:
+        stats = _http[status]
+        stats['requests'] += 1
+        stats['seconds'] += seconds
+
+
+def record_cache(result):
+    """Record a response cache lookup, result is one of hits, misses, revalidations or stale"""
+
+    if not _enabled:
+        return
+
+    with _lock:
+        _cache[result] += 1
+
+
+def snapshot():
+    """Collected data
+
+    Returns
+    -------
+    dict
+        functions: name mapped to calls, seconds, bytes, samples and max_length
+        http: requests, seconds and mean latency in total and per status
+        cache: hits, misses, revalidations, stale and hit_rate of the lookups
+    """
+
+    with _lock:
+        functions = {name: dict(stats) for name, stats in _functions.items()}
+        status = {key: dict(stats) for key, stats in _http.items()}
+        cache = dict(_cache)
+
+    requests = sum(s['requests'] for s in status.values())
+    seconds = sum(s['seconds'] for s in status.values())
+    http = {'requests': requests, 'seconds': seconds,
+            'latency': seconds / requests if requests else None,
+            'status': status}
+
+    lookups = sum(cache.values())
+    cache['hit_rate'] = (cache['hits'] + cache['revalidations'] + cache['stale']) / lookups if lookups else None
+
+    return {'functions': functions, 'http': http, 'cache': cache}
+
+
+def to_prometheus(prefix='vmpy'):
+    """Collected data in the Prometheus text exposition format
+
+    Parameters
+    ----------
+    prefix : str, optional
+        Metric name prefix, default='vmpy'
+
+    Returns
+    -------
+    str
+    """
+
+    data = snapshot()
+
+    metrics = [
+        ('function_calls_total', 'Calls of the instrumented function', 'function', 'calls', data['functions']),
+        ('function_seconds_total', 'Wall time of the instrumented function', 'function', 'seconds', data['functions']),
+        ('function_allocated_bytes_total', 'Peak bytes allocated by the calls, if traced', 'function', 'bytes',
+         data['functions']),
+        ('function_samples_total', 'Length of the first argument summed over the calls', 'function', 'samples',
+         data['functions']),
+        ('http_requests_total', 'Strava API requests', 'status', 'requests', data['http']['status']),
+        ('http_request_seconds_total', 'Strava API request latency', 'status', 'seconds', data['http']['status']),
+    ]
+
+    lines = []
+    for metric, doc, label, field, values in metrics:
+        lines.extend(_header(prefix, metric, doc))
+        for key, stats in sorted(values.items(), key=lambda item: str(item[0])):
+            lines.append(_sample(prefix, metric, label, key, stats[field]))
+
+    lines.extend(_header(prefix, 'cache_lookups_total', 'Response cache lookups'))
+    for field, result in _CACHE_RESULTS.items():
+        lines.append(_sample(prefix, 'cache_lookups_total', 'result', result, data['cache'][field]))
+
+    return '\n'.join(lines) + '\n'
+
+
+def _call(name, func, args, kwargs):
+
+    length = _length(args)
+    # The peak is reset on every call, only done if profiling started tracemalloc
+    memory = _memory and _tracing and tracemalloc.is_tracing()
+
+    if memory:
+        peaks = _local.__dict__.setdefault('peaks', [])
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        peaks.append(0)
+
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+
+        allocated = 0
+        if memory:
+            # Nested calls reset the peak, so their peaks are carried up the stack
+            peak = max(tracemalloc.get_traced_memory()[1], peaks.pop())
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak)
+            allocated = max(peak - before, 0)
+
+        with _lock:
+            stats = _functions[name]
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['bytes'] += allocated
+            if length is not None:
+                stats['samples'] += length
+                stats['max_length'] = max(stats['max_length'], length)
+
+
+def _length(args):
+
+    try:
+        return len(args[0])
+    except (IndexError, TypeError):
+        return None
+
+
+def _header(prefix, metric, doc):
+
+    return ['# HELP {}_{} {}'.format(prefix, metric, doc), '# TYPE {}_{} counter'.format(prefix, metric)]
+
+
+def _sample(prefix, metric, label, key, value):
+
+    key = 'error' if key is None else str(key).replace('\\', '\\\\').replace('"', '\\"')
+
+    return '{}_{}{{{}="{}"}} {}'.format(prefix, metric, label, key, value)
@@ -0,0 +1,186 @@
+"""Resampling of stream dicts onto a uniform time grid
+
+The rolling and metrics functions count windows in samples, so they expect
+1 Hz streams without gaps. Strava streams have pauses and smart recording
+gaps, visible in the *time* channel. Resampling computes a single gather index
+of the grid into the recorded samples and applies it to every channel, the
+gap samples are then filled by the policy of the channel:
+
+    zero    0, e.g. no power while coasting
+    nan     NaN, the channel becomes float
+    ffill   last recorded value
+    linear  linear interpolation between the samples around the gap
+
+Gaps longer than *max_gap* are pauses, filled by the pause policy instead.
+
+>>> stream = resample(strava.stream2dict(stream_list), max_gap=10)
+>>> metrics.normalized_power(stream['watts'])
+"""
+
+import numpy as np
+from vmpy import core
+
+
+FILL_POLICIES = ('zero', 'nan', 'ffill', 'linear')
+
+# Gap fill policy of the Strava channels, other channels are filled forward
+FILL = {
+    'latlng': 'linear',
+    'distance': 'linear',
+    'altitude': 'linear',
+    'velocity_smooth': 'linear',
+    'heartrate': 'linear',
+    'cadence': 'linear',
+    'watts': 'linear',
+    'temp': 'ffill',
+    'moving': 'ffill',
+    'grade_smooth': 'linear',
+}
+
+# Pause fill policy, the rider stands still and the sensors may be off
+PAUSE_FILL = {
+    'latlng': 'ffill',
+    'distance': 'ffill',
+    'altitude': 'ffill',
+    'velocity_smooth': 'zero',
+    'heartrate': 'nan',
+    'cadence': 'zero',
+    'watts': 'zero',
+    'temp': 'ffill',
+    'moving': 'zero',
+    'grade_smooth': 'zero',
+}
+
+
+def resample(stream_dict, step=1, fill=None, max_gap=None, pause_fill=None, time='time'):
+    """Resample every channel of the stream dict onto a uniform time grid
+
+    Parameters
+    ----------
+    stream_dict : dict
+        Streams in dict form, see strava.stream2dict, with a time channel
+        increasing monotonically
+    step : number, optional
+        Grid step in sec, default=1
+    fill : str or dict, optional
+        Gap fill policy of every channel, or channel mapped to policy, see
+        FILL_POLICIES, default=None means FILL
+    max_gap : number, optional
+        Longest gap in sec filled by the fill policy, default=None means no limit
+    pause_fill : str or dict, optional
+        Fill policy of the gaps longer than max_gap, default=None means PAUSE_FILL
+    time : str, optional
+        Name of the time channel, default='time'
+
+    Returns
+    -------
+    dict
+        Channels as ndarrays of the grid length, the time channel holds the grid.
+        Channels recorded on the grid already are returned without a copy
+    """
+
+    t = np.asarray(stream_dict[time])
+    if t.ndim != 1:
+        raise ValueError("The time channel must be 1-D")
+    if len(t) and np.any(np.diff(t) < 0):
+        raise ValueError("The time channel must increase monotonically")
+
+    fill = _policies(fill, FILL)
+    pause_fill = _policies(pause_fill, PAUSE_FILL)
+
+    grid, gather = _gather_index(t, step, max_gap)
+
+    rv = {}
+    for name, data in stream_dict.items():
+        if name == time:
+            rv[name] = t if gather is None else grid
+        else:
+            rv[name] = _resample_channel(_as_array(data), gather, fill(name), pause_fill(name))
+
+    return rv
+
+
+def _gather_index(t, step, max_gap):
+    """Uniform grid and the indices shared by all channels, None if t is the grid"""
+
+    if len(t) == 0:
+        return t, None
+
+    n = int(np.floor((t[-1] - t[0]) / step)) + 1
+    grid = t[0] + step * np.arange(n, dtype=np.result_type(t, step))
+
+    if n == len(t) and np.array_equal(grid, t):
+        return grid, None
+
+    # Last recorded sample at or before every grid point and the one after it
+    before = np.searchsorted(t, grid, side='right') - 1
+    after = np.minimum(before + 1, len(t) - 1)
+    gap = ~(t[before] == grid)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(gap, (grid - t[before]) / (t[after] - t[before]), 0.0)
+
+    pause = gap & (t[after] - t[before] > max_gap) if max_gap is not None else np.zeros(n, dtype=bool)
+
+    return grid, (before, after, frac, gap & ~pause, pause)
+
+
+def _resample_channel(data, gather, fill, pause_fill):
+    """Gather the channel onto the grid and fill the gap and the pause samples"""
+
+    if gather is None:
+        return data
+
+    before, after, frac, gap, pause = gather
+
+    policies = {fill, pause_fill}
+    if policies & {'nan', 'linear'} and data.dtype.kind != 'f':
+        data = data.astype(core.float_dtype(data))
+
+    rv = data[before]
+
+    for policy, where in ((fill, gap), (pause_fill, pause)):
+        if policy == 'ffill' or not where.any():
+            continue
+        if policy == 'zero':
+            rv[where] = 0
+        elif policy == 'nan':
+            rv[where] = np.nan
+        else:
+            w = frac[where].reshape((-1,) + (1,) * (data.ndim - 1))
+            start = rv[where]
+            rv[where] = start + w * (data[after[where]] - start)
+
+    return rv
+
+
+def _policies(fill, defaults):
+    """Channel name to fill policy"""
+
+    if fill is None:
+        fill = defaults
+
+    if isinstance(fill, str):
+        _check_policy(fill)
+        return lambda name: fill
+
+    for policy in fill.values():
+        _check_policy(policy)
+
+    return lambda name: fill.get(name, defaults.get(name, 'ffill'))
+
+
+def _check_policy(policy):
+
+    if policy not in FILL_POLICIES:
+        raise ValueError("Unknown fill policy {}, use one of {}".format(policy, ', '.join(FILL_POLICIES)))
+
+
+def _as_array(data):
+    """Channel as ndarray, missing values (None) become NaN"""
+
+    rv = np.asarray(data)
+    if rv.dtype == object:
+        rv = np.array(data, dtype=float)
+
+    return rv
@@ -3,14 +3,39 @@
     STRAVA_ACCESS_TOKEN must be explicitly provided as an input
 
     ALL returned values are python objects e.g. dict or list
+
+    requests is imported on the first HTTP call, so stream2dict and the other
+    helpers can be used without it
 """
-import requests
 import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from vmpy import profiling
+from vmpy.cache import fetch, activity_key, streams_key
+from vmpy.io import stream2arrays, decode_streams
+from vmpy.profiling import instrument
 
 logger = logging.getLogger(__name__)
 
 
+STRAVA_API_URL = "https://www.strava.com/api/v3"
+
+STREAM_TYPES = "time,latlng,distance,altitude,velocity_smooth,heartrate,cadence,watts,temp,moving,grade_smooth"
+
+# Default Strava rate limits: requests per 15 minutes and per day
+RATE_LIMIT_SHORT = 600
+RATE_LIMIT_LONG = 30000
+
+# Transient server errors retried by StravaClient
+_RETRY_STATUS = (500, 502, 503, 504)
+
+# Bytes read at a time from a streamed response
+_CHUNK_SIZE = 1 << 16
+
+
+@instrument
 def retrieve_athlete(access_token):
     """Retrieve current(authenticated) athlete
 
@@ -28,8 +53,8 @@ def retrieve_athlete(access_token):
 
     endpoint_url = "https://www.strava.com/api/v3/athlete"
 
-    r = requests.get(endpoint_url,
-                     headers=authorization_header(access_token))
+    r = _http_get(endpoint_url,
+                  headers=authorization_header(access_token))
 
     if r.ok:
 
@@ -43,6 +68,7 @@ def retrieve_athlete(access_token):
     return athlete
 
 
+@instrument
 def retrieve_zones(access_token, **kwargs):
     """Retrieve Power and Heartrate zones
 
@@ -60,8 +86,8 @@ def retrieve_zones(access_token, **kwargs):
 
     endpoint_url = "https://www.strava.com/api/v3/athlete/zones"
 
-    r = requests.get(endpoint_url,
-                     headers=authorization_header(access_token))
+    r = _http_get(endpoint_url,
+                  headers=authorization_header(access_token))
 
     if r.ok:
 
@@ -75,7 +101,8 @@ def retrieve_zones(access_token, **kwargs):
     return zones
 
 
-def retrieve_activity(activity_id, access_token):
+@instrument
+def retrieve_activity(activity_id, access_token, cache=None):
     """Retrieve a detailed representation of activity
 
     API V3: https://strava.github.io/api/v3/activities/#get-details
@@ -85,6 +112,8 @@ def retrieve_activity(activity_id, access_token):
     activity_id: int
     access_token : str
         Settings/My API Applications/Your Access Token
+    cache : vmpy.cache.ResponseCache, optional
+        On-disk response cache, default=None means no caching
 
     Returns
     -------
@@ -93,21 +122,23 @@ def retrieve_activity(activity_id, access_token):
 
     endpoint_url = "https://www.strava.com/api/v3/activities/{}".format(activity_id)
 
-    r = requests.get(endpoint_url,
-                     headers=authorization_header(access_token))
+    body, reason = fetch(cache, activity_key(activity_id),
+                         lambda headers: _http_get(endpoint_url,
+                                                   headers=dict(authorization_header(access_token), **headers)))
 
-    if r.ok:
+    if body is not None:
 
-        activity = json.loads(r.text)
+        activity = json.loads(body)
 
     else:
 
-        logger.error('Retrieve Activity Failed with a reason {}'.format(r.reason))
+        logger.error('Retrieve Activity Failed with a reason {}'.format(reason))
         activity = None
 
     return activity
 
 
+@instrument
 def retrieve_streams(activity_id, access_token, **kwargs):
     """Retrieve activity streams
 
@@ -120,6 +151,12 @@ def retrieve_streams(activity_id, access_token, **kwargs):
         Settings/My API Applications/Your Access Token
     type: {None, 'original'}
         Returns serialized original API response if set to 'original'
+    cache : vmpy.cache.ResponseCache, optional
+        On-disk response cache, default=None means no caching
+    compact : bool, optional
+        Decode the response straight into typed ndarrays, see io.decode_streams,
+        default=False. Without a cache the response is decoded while it is
+        downloaded and the body is never buffered
 
     Returns
     -------
@@ -127,37 +164,39 @@ def retrieve_streams(activity_id, access_token, **kwargs):
         Streams are the list of dicts
     """
 
-    types = kwargs.get("types",
-                       "time,latlng,distance,altitude,velocity_smooth,heartrate,cadence,watts,temp,moving,grade_smooth")
+    types = kwargs.get("types", STREAM_TYPES)
+    compact = kwargs.get('compact', False) and not kwargs.get('type', None)
 
     endpoint_url = "https://www.strava.com/api/v3/activities/{}/streams/{}".format(activity_id, types)
 
-    r = requests.get(endpoint_url,
-                         headers=authorization_header(access_token))
+    streams, reason = _fetch_streams(kwargs.get('cache', None), streams_key(activity_id, types),
+                                     lambda headers, stream: _http_get(
+                                         endpoint_url, headers=dict(authorization_header(access_token), **headers),
+                                         stream=stream),
+                                     compact)
 
-    if r.ok:
+    if streams is None:
 
-        streams = json.loads(r.text)
+        logger.error('Retrieve Streams Failed with a reason {}'.format(reason))
 
-    else:
-
-        logger.error('Retrieve Streams Failed with a reason {}'.format(r.reason))
-        streams = None
-
-    if streams and not kwargs.get('type', None):
+    if streams and not compact and not kwargs.get('type', None):
 
         streams = stream2dict(streams)
 
     return streams
 
 
-def stream2dict(stream_list):
+@instrument
+def stream2dict(stream_list, compact=False):
     """Convert stream list into stream dict
 
     Parameters
     ----------
     stream_list : list
         Stream in list form (list of dicts), as returned by Strava API v3
+    compact : bool, optional
+        Convert every stream into an ndarray of the narrowest channel dtype,
+        e.g. int16 watts and uint8 heartrate, see io.stream2arrays, default=False
 
     Returns
     -------
@@ -172,6 +211,9 @@ def stream2dict(stream_list):
 
         stream_dict.update({s['type']: s['data']})
 
+    if compact:
+        stream_dict = stream2arrays(stream_dict)
+
     return stream_dict
 
 
@@ -213,3 +255,401 @@ def authorization_header(access_token):
     rv = {'Authorization': 'Bearer {}'.format(access_token)}
 
     return rv
+
+
+def _fetch_streams(cache, key, request, compact):
+    """Serve a streams request through the cache, see cache.fetch
+
+    request is called with the conditional request headers and whether to
+    stream the response. Compact streams are decoded chunk by chunk straight
+    from the connection, unless the body has to be cached.
+
+    Returns
+    -------
+    (list or dict, str)
+        Decoded streams or None, and the failure reason
+    """
+
+    if compact and cache is None:
+
+        r = request({}, True)
+
+        if r is None:
+            return None, 'Connection Error'
+
+        with r:
+            if not r.ok:
+                return None, r.reason
+            return decode_streams(r.iter_content(_CHUNK_SIZE)), None
+
+    body, reason = fetch(cache, key, lambda headers: request(headers, False))
+
+    if body is None:
+        return None, reason
+
+    return (decode_streams(body) if compact else json.loads(body)), None
+
+
+def _http_get(url, **kwargs):
+    """requests.get recording the latency, see profiling.record_http"""
+
+    import requests
+
+    start = time.perf_counter()
+    r = requests.get(url, **kwargs)
+    profiling.record_http(r.status_code, time.perf_counter() - start)
+
+    return r
+
+
+class RateLimiter(object):
+    """Client side accounting of the Strava 15-minute and daily rate limits
+
+    Usage is counted locally for every request and synchronized with the
+    X-RateLimit-Limit and X-RateLimit-Usage response headers. Once a limit is
+    reached, acquire() blocks until the window resets: every quarter of an hour
+    for the short limit and at midnight UTC for the daily limit.
+
+    Parameters
+    ----------
+    short_limit : int, optional
+        Requests per 15 minutes, default=600
+    long_limit : int, optional
+        Requests per day, default=30000
+    clock : callable, optional
+        Returns the current UNIX time, default=time.time
+    sleep : callable, optional
+        Blocks for the given number of seconds, default=time.sleep
+    """
+
+    WINDOWS = (900, 86400)
+
+    def __init__(self, short_limit=RATE_LIMIT_SHORT, long_limit=RATE_LIMIT_LONG,
+                 clock=time.time, sleep=time.sleep):
+
+        self.limits = [short_limit, long_limit]
+        self.usage = [0, 0]
+
+        self._clock = clock
+        self._sleep = sleep
+        self._windows = [None, None]
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Account for one request, blocking while a limit is exhausted"""
+
+        with self._lock:
+            while True:
+                now = self._roll()
+                wait = self._wait(now)
+                if wait <= 0:
+                    self.usage = [u + 1 for u in self.usage]
+                    return
+                logger.warning('Strava rate limit reached, waiting {:.0f} sec'.format(wait))
+                self._sleep(wait)
+
+    def update(self, headers):
+        """Synchronize with the rate limit headers of a response
+
+        Parameters
+        ----------
+        headers : dict-like
+        """
+
+        limit = headers.get('X-RateLimit-Limit', None)
+        usage = headers.get('X-RateLimit-Usage', None)
+        if not limit or not usage:
+            return
+
+        try:
+            limit = [int(x) for x in limit.split(',')]
+            usage = [int(x) for x in usage.split(',')]
+        except ValueError:
+            logger.warning('Malformed rate limit headers {}, {}'.format(limit, usage))
+            return
+
+        with self._lock:
+            self._roll()
+            self.limits = limit[:2]
+            # Requests in flight are not yet reflected in the headers
+            self.usage = [max(u, h) for u, h in zip(self.usage, usage[:2])]
+
+    def exhausted(self):
+        """Mark the short window as exhausted, e.g. after HTTP 429 Too Many Requests"""
+
+        with self._lock:
+            self._roll()
+            self.usage[0] = max(self.usage[0], self.limits[0])
+
+    def _roll(self):
+        """Reset the usage of windows that did elapse, returns the current time"""
+
+        now = self._clock()
+        for i, length in enumerate(self.WINDOWS):
+            window = int(now // length)
+            if window != self._windows[i]:
+                self._windows[i] = window
+                self.usage[i] = 0
+
+        return now
+
+    def _wait(self, now):
+
+        wait = 0
+        for i, length in enumerate(self.WINDOWS):
+            if self.usage[i] >= self.limits[i]:
+                wait = max(wait, (self._windows[i] + 1) * length - now)
+
+        return wait
+
+
+class StravaClient(object):
+    """Strava API v3 client with a pooled session, retries and rate limiting
+
+    Connections are kept alive and shared by a pool of threads, which fetch
+    many activities or streams concurrently. Transient failures (connection
+    errors and HTTP 5xx) are retried with exponential backoff and HTTP 429 waits
+    for the rate limit window to reset. Every attempt, retries included, is
+    counted by the rate limiter.
+
+    Parameters
+    ----------
+    access_token : str
+        Settings/My API Applications/Your Access Token
+    base_url : str, optional
+        API root, default=STRAVA_API_URL
+    max_workers : int, optional
+        Number of concurrent requests, default=8
+    retries : int, optional
+        Number of retries of a failing request, default=3
+    backoff_factor : float, optional
+        Backoff between retries is backoff_factor * 2 ** (retry - 1) sec, default=0.5
+    timeout : float, optional
+        Request timeout in sec, default=30
+    rate_limiter : RateLimiter, optional
+        Default=None creates a limiter with the default Strava limits
+    cache : vmpy.cache.ResponseCache, optional
+        On-disk cache of activities and streams, default=None means no caching
+
+    Examples
+    --------
+    >>> with StravaClient(access_token=STRAVA_ACCESS_TOKEN) as client:
+    ...     streams = client.retrieve_activities_streams([1282167861, 1299011495])
+    """
+
+    def __init__(self, access_token, base_url=STRAVA_API_URL, max_workers=8, retries=3,
+                 backoff_factor=0.5, timeout=30, rate_limiter=None, cache=None):
+
+        self.access_token = access_token
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.cache = cache
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # Retries are made by _get, so that every attempt passes the rate limiter
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=0)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(authorization_header(access_token))
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
+
+    def close(self):
+        """Close the pooled connections"""
+
+        self.session.close()
+
+    @instrument
+    def retrieve_athlete(self):
+        """Retrieve current(authenticated) athlete, see strava.retrieve_athlete"""
+
+        return self._retrieve('/athlete', 'Athlete')
+
+    @instrument
+    def retrieve_zones(self):
+        """Retrieve Power and Heartrate zones, see strava.retrieve_zones"""
+
+        return self._retrieve('/athlete/zones', 'Zones')
+
+    @instrument
+    def retrieve_activity(self, activity_id):
+        """Retrieve a detailed representation of activity, see strava.retrieve_activity"""
+
+        return self._retrieve('/activities/{}'.format(activity_id), 'Activity',
+                              key=activity_key(activity_id))
+
+    @instrument
+    def retrieve_streams(self, activity_id, **kwargs):
+        """Retrieve activity streams, see strava.retrieve_streams"""
+
+        types = kwargs.get("types", STREAM_TYPES)
+        compact = kwargs.get('compact', False) and not kwargs.get('type', None)
+
+        path = '/activities/{}/streams/{}'.format(activity_id, types)
+        streams, reason = _fetch_streams(self.cache, streams_key(activity_id, types),
+                                         lambda headers, stream: self._get(path, headers=headers, stream=stream),
+                                         compact)
+
+        if streams is None:
+
+            logger.error('Retrieve Streams Failed with a reason {}'.format(reason))
+
+        if streams and not compact and not kwargs.get('type', None):
+
+            streams = stream2dict(streams)
+
+        return streams
+
+    @instrument
+    def retrieve_activities(self, activity_ids):
+        """Retrieve many activities concurrently
+
+        Parameters
+        ----------
+        activity_ids : list of int
+
+        Returns
+        -------
+        list
+            Activity dicts in the order of activity_ids, None for failed requests
+        """
+
+        return self._map(self.retrieve_activity, activity_ids)
+
+    @instrument
+    def retrieve_activities_streams(self, activity_ids, **kwargs):
+        """Retrieve streams of many activities concurrently
+
+        Parameters
+        ----------
+        activity_ids : list of int
+        kwargs : see retrieve_streams
+
+        Returns
+        -------
+        list
+            Streams in the order of activity_ids, None for failed requests
+        """
+
+        return self._map(lambda x: self.retrieve_streams(x, **kwargs), activity_ids)
+
+    @instrument
+    def list_activities(self, after=None, before=None, per_page=200):
+        """List the activities of the authenticated athlete
+
+        API V3: https://developers.strava.com/docs/reference/#api-Activities-getLoggedInAthleteActivities
+
+        Pages are requested concurrently, max_workers pages at a time, until
+        a page is not full
+
+        Parameters
+        ----------
+        after : int, optional
+            Only activities that started after this epoch timestamp in sec
+        before : int, optional
+            Only activities that started before this epoch timestamp in sec
+        per_page : int, optional
+            Activities per page, default=200 is the largest page Strava allows
+
+        Returns
+        -------
+        list
+            Summary activity dicts in the order of the pages, None if a page failed
+        """
+
+        params = {k: v for k, v in (('after', after), ('before', before)) if v is not None}
+
+        rv = []
+        first = 1
+
+        while True:
+
+            pages = range(first, first + self.max_workers)
+            results = self._map(lambda page: self._retrieve('/athlete/activities', 'Activities',
+                                                            params=dict(params, page=page, per_page=per_page)),
+                                pages)
+
+            if any(r is None for r in results):
+                return None
+
+            for r in results:
+                rv.extend(r)
+                if len(r) < per_page:
+                    return rv
+
+            first += self.max_workers
+
+    def _map(self, func, args):
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            rv = list(executor.map(func, args))
+
+        return rv
+
+    def _get(self, path, params=None, headers=None, stream=False):
+        """GET the path with rate limiting, returns the response or None on connection errors"""
+
+        import requests
+
+        url = self.base_url + path
+
+        for attempt in range(self.retries + 1):
+
+            if attempt and self.backoff_factor:
+                time.sleep(self.backoff_factor * 2 ** (attempt - 1))
+
+            self.rate_limiter.acquire()
+
+            start = time.perf_counter()
+            try:
+                r = self.session.get(url, params=params, headers=headers, timeout=self.timeout, stream=stream)
+            except requests.RequestException as e:
+                profiling.record_http(None, time.perf_counter() - start)
+                if attempt < self.retries and isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                    continue
+                logger.error('Request to {} failed with a reason {!r}'.format(path, e))
+                return None
+            profiling.record_http(r.status_code, time.perf_counter() - start)
+
+            self.rate_limiter.update(r.headers)
+
+            if r.status_code == 429 and attempt < self.retries:
+                self.rate_limiter.exhausted()
+                r.close()
+                continue
+
+            if r.status_code in _RETRY_STATUS and attempt < self.retries:
+                r.close()
+                continue
+
+            return r
+
+    def _retrieve(self, path, name, params=None, key=None):
+
+        cache = self.cache if key is not None else None
+        body, reason = fetch(cache, key, lambda headers: self._get(path, params=params, headers=headers))
+
+        if body is not None:
+
+            rv = json.loads(body)
+
+        else:
+
+            logger.error('Retrieve {} Failed with a reason {}'.format(name, reason))
+            rv = None
+
+        return rv
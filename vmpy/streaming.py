@@ -0,0 +1,340 @@
+"""Stateful counterparts of the streams and metrics functions for live telemetry
+
+Every object consumes the stream sample by sample with *push*, at O(1) cost
+per sample (O(log window) search for the median filter), and keeps the most
+recent output in *value*. After the whole stream was pushed, the outputs are
+identical to the batch functions in streams and metrics.
+
+>>> np_ = NormalizedPower()
+>>> power_30s = RollingMean(window=30)
+>>> zone = Zones(ftp=270)
+>>> for sample in trainer:
+...     np_.push(sample), power_30s.push(sample), zone.push(sample)
+"""
+
+import bisect
+import collections
+import math
+
+import numpy as np
+from vmpy import core
+from vmpy.streams import zone_edges
+
+
+class _Streaming(object):
+    """Common push interface, a sample returns a value and a chunk returns an array"""
+
+    value = np.nan
+
+    def push(self, arg):
+        """Consume a sample or a chunk of samples
+
+        Parameters
+        ----------
+        arg : number or array-like
+
+        Returns
+        -------
+        number or ndarray
+            Output for the sample, or for every sample of the chunk
+        """
+
+        if np.ndim(arg) == 0:
+            return self._update(_as_float(arg))
+
+        return np.array([self._update(_as_float(x)) for x in np.asarray(arg, dtype=float)])
+
+    def _update(self, x):
+
+        raise NotImplementedError
+
+
+class RollingMean(_Streaming):
+    """Streaming streams.rolling_mean
+
+    Parameters
+    ----------
+    window : int
+        Size of the moving window in sec, default=10
+    type : {"uniform", "ewma"}, optional
+        Type of averaging, default="uniform"
+    """
+
+    def __init__(self, window=10, type='uniform'):
+
+        self.window = window
+        self.type = type
+
+        if type == 'ewma':
+            decay = 1.0 - 2.0 / (window + 1)
+            self._total = _ExponentialFilter(decay)
+            self._weights = _ExponentialFilter(decay)
+        else:
+            # Running sums replicate the cumulative sums of core.rolling_mean
+            self._total = 0.0
+            self._count = 0.0
+            self._history = collections.deque(maxlen=window)
+
+    def _update(self, x):
+
+        valid = x == x
+
+        if self.type == 'ewma':
+            total = self._total.update(x if valid else 0.0)
+            weights = self._weights.update(1.0 if valid else 0.0)
+            # Without decay the weight of a NaN sample is 0, the last mean carries forward
+            self.value = total / weights if weights else self.value
+            return self.value
+
+        self._total += x if valid else 0.0
+        self._count += valid
+
+        total, count = self._total, self._count
+        if len(self._history) == self.window:
+            old_total, old_count = self._history[0]
+            total -= old_total
+            count -= old_count
+        self._history.append((self._total, self._count))
+
+        self.value = total / count if count else np.nan
+
+        return self.value
+
+
+class NormalizedPower(_Streaming):
+    """Streaming metrics.normalized_power
+
+    Parameters
+    ----------
+    type : {"xPower", "NP}
+        Determines calculation method to use, default='NP'
+    """
+
+    def __init__(self, type='NP'):
+
+        if type == 'xPower':
+            self._rolling_mean = RollingMean(window=25, type='emwa')
+        else:
+            self._rolling_mean = RollingMean(window=30)
+
+        # Partial sums of Shewchuk's algorithm, the same exact sum as math.fsum
+        self._partials = []
+        self._count = 0
+
+    def _update(self, x):
+
+        _rolling_mean = self._rolling_mean._update(x)
+
+        _add_exact(self._partials, float(np.power(_rolling_mean, 4)))
+        self._count += 1
+
+        self.value = (math.fsum(self._partials) / self._count) ** (1/4)
+
+        return self.value
+
+
+class BestInterval(_Streaming):
+    """Streaming metrics.best_interval
+
+    Parameters
+    ----------
+    window : int
+        Duration of the interval in seconds
+    """
+
+    value = -np.inf
+
+    def __init__(self, window):
+
+        self._rolling_mean = RollingMean(window=window)
+
+    def _update(self, x):
+
+        _rolling_mean = self._rolling_mean._update(x)
+
+        # Same as np.max, a single NaN makes the best interval NaN
+        if _rolling_mean != _rolling_mean:
+            self.value = np.nan
+        elif _rolling_mean > self.value:
+            self.value = _rolling_mean
+
+        return self.value
+
+
+class Zones(_Streaming):
+    """Streaming streams.compute_zones
+
+    Parameters
+    ----------
+    kwargs : see streams.zone_edges
+    """
+
+    def __init__(self, **kwargs):
+
+        abs_zones, labels = zone_edges(**kwargs)
+        self._edges = np.asarray(abs_zones, dtype=float).tolist()
+        self._labels = labels.tolist()
+
+    def _update(self, x):
+
+        idx = bisect.bisect_left(self._edges, x) if x == x else 0
+
+        if 0 < idx < len(self._edges):
+            self.value = self._labels[idx - 1]
+        else:
+            self.value = np.nan
+
+        return self.value
+
+
+class MedianFilter(_Streaming):
+    """Streaming streams.median_filter
+
+    The rolling median and the rolling median absolute deviation are both
+    trailing, so every sample can be filtered as soon as it arrives
+
+    Parameters
+    ----------
+    window : int, optional
+        Size of window (including the sample), default=31
+    threshold : number, optional
+        default=1
+    value : float, optional
+        Value to be used for replacement, default=None means the rolling median
+    """
+
+    def __init__(self, window=31, threshold=1, value=None):
+
+        self.threshold = threshold
+        self.replacement = value
+
+        self._median = _RollingMedian(window)
+        self._median_abs_deviation = _RollingMedian(window)
+
+    def _update(self, x):
+
+        median = self._median.update(x)
+        difference = abs(x - median)
+        median_abs_deviation = self._median_abs_deviation.update(difference)
+
+        # The factor 1.4826 makes the MAD scale estimate
+        # an unbiased estimate of the standard deviation for Gaussian data.
+        if difference > 1.4826 * self.threshold * median_abs_deviation:
+            x = median if self.replacement is None else self.replacement
+
+        self.value = x
+
+        return self.value
+
+
+class WPrimeBalance(_Streaming):
+    """Streaming streams.w_prime_balance
+
+    The balance equals the batch function up to floating point rounding,
+    which evaluates the same recurrence block-wise
+
+    Parameters
+    ----------
+    cp : number
+        Critical Power
+    w_prime : number
+        W' in J
+    tau : number, optional
+        Recovery time constant of the integral model, default=None means the
+        differential model
+    """
+
+    def __init__(self, cp, w_prime, tau=None):
+
+        self.cp = cp
+        self.w_prime = w_prime
+        self._decay = None if tau is None else math.exp(-1.0 / tau)
+        self._expended = 0.0
+
+    def _update(self, x):
+
+        if self._decay is not None:
+            self._expended *= self._decay
+
+        if x > self.cp:
+            self._expended += x - self.cp
+        elif x < self.cp and self._decay is None:
+            self._expended *= math.exp(-min((self.cp - x) / self.w_prime, core._MAX_DECAY))
+
+        self.value = self.w_prime - self._expended
+
+        return self.value
+
+
+class _RollingMedian(object):
+    """Trailing rolling median over a sorted copy of the window, NaN samples are skipped"""
+
+    def __init__(self, window):
+
+        self._window = collections.deque(maxlen=window)
+        self._sorted = []
+
+    def update(self, x):
+
+        if len(self._window) == self._window.maxlen:
+            core._remove_sorted(self._sorted, self._window[0])
+
+        self._window.append(x)
+        if x == x:
+            bisect.insort(self._sorted, x)
+
+        return core._sorted_median(self._sorted)
+
+
+class _ExponentialFilter(object):
+    """Streaming core.exponential_filter with the same block-wise arithmetic"""
+
+    def __init__(self, decay):
+
+        self._decay = decay
+        self._block = core._exponential_block(decay) if decay else 1
+        self._position = 0
+        self._state = 0.0
+        self._partial = 0.0
+        self._power = 1.0
+
+    def update(self, x):
+
+        if self._decay == 0.0:
+            return x
+
+        if self._position % self._block == 0:
+            self._partial = 0.0
+            self._power = 1.0
+        else:
+            self._power *= self._decay
+
+        self._partial += x * (1.0 / self._power)
+        s = (self._partial + self._decay * self._state) * self._power
+
+        self._position += 1
+        if self._position % self._block == 0:
+            self._state = s
+
+        return s
+
+
+def _add_exact(partials, x):
+    """Add x to the non-overlapping partial sums, see math.fsum"""
+
+    i = 0
+    for y in partials:
+        if abs(x) < abs(y):
+            x, y = y, x
+        hi = x + y
+        lo = y - (hi - x)
+        if lo:
+            partials[i] = lo
+            i += 1
+        x = hi
+    partials[i:] = [x]
+
+
+def _as_float(x):
+
+    return np.nan if x is None else float(x)
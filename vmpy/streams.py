@@ -1,8 +1,9 @@
 """Operation on Streams that leave the shape of the stream unchanged"""
 
 import numpy as np
-import pandas as pd
-from vmpy.utils import cast_array_to_original_type
+from vmpy import core
+from vmpy.profiling import instrument
+from vmpy.utils import cast_array_to_original_type, is_series
 
 
 # FTP based 7-zones with left bind edge set to -0.001
@@ -16,7 +17,11 @@ HEART_RATE_ZONES = [-0.001, 0.68, 0.83, 0.94, 1.05, 10.0]
 HEART_RATE_ZONES_DESC = ["Active recovery", "Endurance", "Tempo", "Threshold", "VO2Max",]
 HEART_RATE_ZONES_ZNAME = ["Z1", "Z2", "Z3", "Z4", "Z5"]
 
+# Upper bound of the integer lookup table of ZoneBinner
+_LUT_SIZE = 2**16
 
+
+@instrument
 def compute_zones(arg, **kwargs):
     """Convert stream into respective zones stream
 
@@ -39,10 +44,31 @@ def compute_zones(arg, **kwargs):
     array-like of int, the same type as arg
     """
 
-    arg_s = pd.Series(arg)
+    return ZoneBinner(**kwargs).compute_zones(arg)
+
+
+def zone_edges(**kwargs):
+    """Absolute zone edges and labels
+
+    Parameters
+    ----------
+    ftp : number, optional
+        Value for FTP, will be used for 7-zones calculation
+    lthr: number, optional
+        Value for LTHR, will be used for 5-zones calculation
+    zones: list, optional
+        List of custom defined zones with left edge set to -1 and right edge to 10000
+    labels: list, optional
+        Zone labels, default is 1, 2, ... number of zones
+
+    Returns
+    -------
+    (ndarray, ndarray)
+        Zone edges and labels
+    """
 
     if kwargs.get('zones', None):
-        abs_zones = kwargs.get('zones')
+        abs_zones = np.asarray(kwargs.get('zones'))
 
     elif kwargs.get('ftp', None):
         abs_zones = np.asarray(POWER_ZONES_THRESHOLD) * kwargs.get('ftp')
@@ -56,13 +82,168 @@ def compute_zones(arg, **kwargs):
     labels = kwargs.get('labels', list(range(1, len(abs_zones))))
     assert len(abs_zones) == (len(labels) + 1)
 
-    y = pd.cut(arg_s, bins=abs_zones, labels=labels)
-    y = cast_array_to_original_type(y, type(arg))
+    return abs_zones, np.asarray(labels)
 
-    return y
 
+class ZoneBinner(object):
+    """Zone edges compiled once and applied to many streams
+
+    Integer streams, e.g. watts and heartrate as returned by Strava, are
+    binned through a lookup table indexed by the sample value. Other streams
+    fall back to a binary search of the edges
+
+    >>> binner = ZoneBinner(ftp=270)
+    >>> for power in activities:
+    ...     binner.time_in_zones(power)
+
+    Parameters
+    ----------
+    kwargs : see zone_edges
+    """
+
+    def __init__(self, **kwargs):
+
+        self.edges, self.labels = zone_edges(**kwargs)
+        self.edges = np.asarray(self.edges, dtype=float)
+        self._lut = None
+
+    def __len__(self):
+
+        return len(self.labels)
+
+    def zone_index(self, arg):
+        """Zone index stream, zone 0 marks samples outside of the zones and NaN samples
+
+        Parameters
+        ----------
+        arg : array-like
+
+        Returns
+        -------
+        ndarray of int
+        """
+
+        y = np.asarray(arg)
+
+        if y.dtype.kind in 'iu' and y.size:
+            lut = self._lookup_table()
+            if y.min() >= 0 and y.max() < len(lut):
+                return lut[y]
+
+        return core.compute_zones(np.asarray(y, dtype=float), self.edges)
+
+    def compute_zones(self, arg):
+        """Convert stream into respective zones stream, see streams.compute_zones
+
+        Parameters
+        ----------
+        arg : array-like
+
+        Returns
+        -------
+        array-like of int, the same type as arg
+            A Series is categorical with the zone labels as categories, as with pd.cut
+        """
+
+        idx = self.zone_index(arg)
+
+        if is_series(arg):
+            import pandas as pd
+            zones = pd.Categorical.from_codes(idx.astype(np.intp) - 1, categories=self.labels, ordered=True)
+            return pd.Series(zones, index=arg.index, name=arg.name)
+
+        # A list keeps the labels as they are, with NaN only for zone 0
+        if isinstance(arg, list) and not idx.all():
+            labels = self.labels.tolist()
+            return [labels[i - 1] if i else np.nan for i in idx.tolist()]
+
+        y = self.zone_labels(idx)
+        y = cast_array_to_original_type(y, type(arg))
+
+        return y
+
+    def time_in_zones(self, arg):
+        """Time [sec] spent in each zone, see metrics.time_in_zones
+
+        Parameters
+        ----------
+        arg : array-like
+
+        Returns
+        -------
+        array-like, the same type as arg
+            Samples in every zone with at least one sample. A Series holds every zone,
+            including the empty ones, and is indexed by the zone labels
+        """
+
+        if is_series(arg):
+            import pandas as pd
+            counts, labels = self.zone_counts(self.zone_index(arg), observed=False)
+            return pd.Series(counts, index=pd.CategoricalIndex(labels, categories=labels, ordered=True))
+
+        counts, labels = self.zone_counts(self.zone_index(arg))
+
+        return cast_array_to_original_type(counts, type(arg))
+
+    def zone_labels(self, idx):
+        """Zone label stream of the zone index stream
 
+        Parameters
+        ----------
+        idx : ndarray of int
+            See zone_index
 
+        Returns
+        -------
+        ndarray
+            Zone labels, NaN for zone 0
+        """
+
+        # Zone 0 marks samples outside of the zones, they become NaN as with pd.cut,
+        # intp keeps the index of zone 0 at -1 for the narrow lookup table dtypes
+        y = self.labels[idx.astype(np.intp) - 1]
+        if not idx.all():
+            y = y.astype(float if y.dtype.kind in 'iuf' else object)
+            y[idx == 0] = np.nan
+
+        return y
+
+    def zone_counts(self, idx, observed=True):
+        """Samples in every zone of the zone index stream
+
+        Parameters
+        ----------
+        idx : ndarray of int
+            See zone_index
+        observed : bool, optional
+            Only the zones with at least one sample, default=True
+
+        Returns
+        -------
+        (ndarray of int, ndarray)
+            Samples and labels of the zones
+        """
+
+        counts = np.bincount(idx, minlength=len(self.labels) + 1)[1:]
+        if not observed:
+            return counts, self.labels
+
+        observed = counts > 0
+
+        return counts[observed], self.labels[observed]
+
+    def _lookup_table(self):
+        """Zone index of every integer from 0 up to the last edge"""
+
+        if self._lut is None:
+            size = int(np.clip(np.ceil(self.edges[-1]) + 1, 0, _LUT_SIZE))
+            dtype = np.uint8 if len(self.labels) < 256 else np.intp
+            self._lut = core.compute_zones(np.arange(size, dtype=float), self.edges).astype(dtype)
+
+        return self._lut
+
+
+@instrument
 def wpk(power, weight):
     """Watts per kilo
 
@@ -76,12 +257,13 @@ def wpk(power, weight):
     array-like
     """
 
-    rv = pd.Series(power, dtype=float)/ weight
+    rv = core.wpk(np.asarray(power, dtype=core.float_dtype(power)), weight)
     rv = cast_array_to_original_type(rv, type(power))
 
     return rv
 
 
+@instrument
 def mask_fill(arg, mask=None, value=0.0, **kwargs):
     """Replace masked values
 
@@ -105,17 +287,15 @@ def mask_fill(arg, mask=None, value=0.0, **kwargs):
     if mask is None:
         return arg
 
-    y = np.array(arg)
-
-    mask = np.array(mask, dtype=bool)
-    y[~mask] = value
+    y = core.mask_fill(arg, mask=mask, value=value)
 
     rv = cast_array_to_original_type(y, type(arg))
 
     return rv
 
 
-def median_filter(arg, window=31, threshold=1, value=None, **kwargs):
+@instrument
+def median_filter(arg, window=31, threshold=1, value=None, inplace=False, **kwargs):
     """Outlier replacement using median filter
 
     Detect outliers using median filter and replace with rolling median or specified value
@@ -129,39 +309,24 @@ def median_filter(arg, window=31, threshold=1, value=None, **kwargs):
         default=3 and corresponds to 2xSigma
     value : float, optional
         Value to be used for replacement, default=None, which means replacement by rolling median value
+    inplace : bool, optional
+        Replace the outliers in the original array, default=False. Only applies to a
+        writeable float ndarray, e.g. not to the read-only arrays of io.load_streams
 
     Returns
     -------
     y: type of input argument
-
-    In case the arg is an ndarray all operations will be performed on the original array.
-    To preserve original array pass a copy to the function
-    """
-    y = pd.Series(arg)
-
-    rolling_median = y.rolling(window, min_periods=1).median()
-
-    difference = np.abs(y - rolling_median)
-
-    median_abs_deviation = difference.rolling(window, min_periods=1).median()
-
-    outlier_idx = difference > 1.4826 * threshold * median_abs_deviation
-    """ The factor 1.4826 makes the MAD scale estimate
-        an unbiased estimate of the standard deviation for Gaussian data.
     """
-
-    if value:
-        y[outlier_idx] = value
-    else:
-        y[outlier_idx] = rolling_median[outlier_idx]
-
-    y = y.as_matrix()
+    y = np.asarray(arg, dtype=core.float_dtype(arg))
+    out = y if inplace and y is arg and y.flags.writeable else None
+    y = core.median_filter(y, window=window, threshold=threshold, value=value, out=out)
 
     y = cast_array_to_original_type(y, type(arg))
 
     return y
 
 
+@instrument
 def rolling_mean(arg, window=10, mask=None, value=0.0, **kwargs):
     """Compute rolling mean
 
@@ -187,17 +352,55 @@ def rolling_mean(arg, window=10, mask=None, value=0.0, **kwargs):
     The moving array will indicate which samples to set to zero before
     applying rolling mean.
     """
-    if mask is not None:
-        arg = mask_fill(arg, mask, value, **kwargs)
+    y = core.mask_fill(arg, mask=mask, value=value, dtype=core.float_dtype(arg))
+    y = core.rolling_mean(y, window=window, type=kwargs.get('type', 'uniform'), out=y)
 
-    y = pd.Series(arg)
+    y = cast_array_to_original_type(y, type(arg))
 
-    if kwargs.get('type', 'uniform') == 'ewma':
-        y = y.ewm(span=window, min_periods=1).mean().values
-    else:
-        y = y.rolling(window, min_periods=1).mean().values
+    return y
+
+
+@instrument
+def w_prime_balance(arg, cp, w_prime, mask=None, value=0.0, **kwargs):
+    """W' balance
+
+    Computed in linear time from the recursive formulation of the W' balance
+    models. A long ride can be processed chunk by chunk, passing the last
+    balance of a chunk as *initial* of the next one
+
+    Parameters
+    ----------
+    arg : array-like
+        Power stream
+    cp : number
+        Critical Power
+    w_prime : number
+        W' in J
+    mask : array-like of boolean, optional
+        Default value is None, which means no masking will be applied
+    value : number, optional
+        Value to use for replacement, default=0.0
+    model : {"differential", "integral"}, optional
+        Skiba 2015 differential or Skiba 2012 integral model, default="differential"
+    tau : number, optional
+        Recovery time constant of the integral model, default=None means it
+        is estimated from the ride, see core.w_prime_tau
+    initial : number, optional
+        Balance before the first sample, default=None means w_prime
+
+    Returns
+    -------
+    y: type of input argument
+    """
+
+    y = core.mask_fill(arg, mask=mask, value=value, dtype=float)
+
+    tau = None
+    if kwargs.get('model', 'differential') == 'integral':
+        tau = kwargs.get('tau', None) or core.w_prime_tau(y, cp)
+
+    y = core.w_prime_balance(y, cp, w_prime, tau=tau, initial=kwargs.get('initial', None), out=y)
 
     y = cast_array_to_original_type(y, type(arg))
 
     return y
-
@@ -1,6 +1,10 @@
-import numpy as np
-import pandas as pd
 import logging
+import math
+import os
+import sys
+import threading
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -19,13 +23,123 @@ def cast_array_to_original_type(arg, arg_type):
     """
 
     if arg_type == list:
-        return list(arg)
+        return arg.tolist() if isinstance(arg, np.ndarray) else list(arg)
 
     elif arg_type == np.ndarray:
-        return np.array(arg)
+        return np.asarray(arg)
 
-    elif arg_type == pd.Series:
-        return pd.Series(arg)
+    elif _is_series_type(arg_type):
+        import pandas as pd
+        return arg if isinstance(arg, pd.Series) else pd.Series(arg, copy=False)
 
     else:
         raise ValueError("arg_type must be list, ndarray or pd.Series")
+
+
+def is_series(arg):
+    """True if arg is a pd.Series, without importing pandas
+
+    Parameters
+    ----------
+    arg: array-like
+
+    Returns
+    -------
+    bool
+    """
+
+    return _is_series_type(type(arg))
+
+
+def to_datetime64(date):
+    """Convert date into datetime64[s]
+
+    Parameters
+    ----------
+    date : str, datetime, datetime64 or None
+        Strava UTC dates with the Z suffix are accepted
+
+    Returns
+    -------
+    datetime64[s]
+        NaT for None
+    """
+
+    if date is None:
+        return np.datetime64('NaT', 's')
+
+    if isinstance(date, str) and date.endswith('Z'):
+        # Strava API returns UTC dates with the Z suffix
+        date = date[:-1]
+
+    return np.datetime64(date, 's')
+
+
+def to_json(arg):
+    """Convert ndarrays and NumPy scalars into JSON serializable objects
+
+    Parameters
+    ----------
+    arg : dict, list, tuple, ndarray, NumPy scalar or JSON serializable object
+
+    Returns
+    -------
+    JSON serializable object
+        NaN becomes None
+    """
+
+    if isinstance(arg, dict):
+        return {k: to_json(v) for k, v in arg.items()}
+
+    if isinstance(arg, (list, tuple, np.ndarray)):
+        return [to_json(v) for v in np.asarray(arg).tolist()]
+
+    if isinstance(arg, np.generic):
+        arg = arg.item()
+
+    if isinstance(arg, float) and math.isnan(arg):
+        return None
+
+    return arg
+
+
+def write_lines(output, lines):
+    """Write the buffered lines and empty the buffer
+
+    Parameters
+    ----------
+    output : file-like
+        Text stream, flushed after writing
+    lines : list of str
+    """
+
+    if lines:
+        output.write('\n'.join(lines) + '\n')
+        output.flush()
+        del lines[:]
+
+
+def write_atomic(path, data):
+    """Replace the file atomically, readers never see a partly written file
+
+    Parameters
+    ----------
+    path : str
+    data : bytes
+    """
+
+    tmp = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _is_series_type(arg_type):
+    """True if arg_type is pd.Series, without importing pandas
+
+    A Series can only exist once pandas has been imported by the caller
+    """
+
+    pd = sys.modules.get('pandas')
+
+    return pd is not None and arg_type == pd.Series